@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: vectorized detection matching vs. a pure-Python per-box loop.
+
+Usage:
+    python benchmarks/bench_detection.py --images 2000 --boxes 10
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from mmcsbench.metrics.detection import IOU_THRESHOLDS, DetectionMetric
+
+
+def _iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def python_map(samples):
+    """Reference mAP computed with per-box Python loops."""
+    detections = [[] for _ in IOU_THRESHOLDS]
+    num_gt = 0
+    for boxes, scores, gts in samples:
+        num_gt += len(gts)
+        order = sorted(range(len(boxes)), key=lambda i: -scores[i])
+        for t, threshold in enumerate(IOU_THRESHOLDS):
+            taken = [False] * len(gts)
+            for i in order:
+                best, best_iou = -1, threshold
+                for j, gt in enumerate(gts):
+                    if taken[j]:
+                        continue
+                    iou = _iou(boxes[i], gt)
+                    if iou >= best_iou:
+                        best, best_iou = j, iou
+                if best >= 0:
+                    taken[best] = True
+                detections[t].append((scores[i], best >= 0))
+
+    aps = []
+    for dets in detections:
+        dets.sort(key=lambda d: -d[0])
+        tp = fp = 0
+        curve = []
+        for _, hit in dets:
+            tp += hit
+            fp += not hit
+            curve.append((tp / num_gt, tp / (tp + fp)))
+        total = 0.0
+        for r in range(101):
+            target = r / 100
+            total += max((p for rec, p in curve if rec >= target), default=0.0)
+        aps.append(total / 101)
+    return sum(aps) / len(aps)
+
+
+def make_samples(num_images, boxes_per_image, seed=0):
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(num_images):
+        gts = []
+        for _ in range(max(1, boxes_per_image // 2)):
+            x, y = rng.uniform(0, 400), rng.uniform(0, 400)
+            gts.append([x, y, x + rng.uniform(20, 100), y + rng.uniform(20, 100)])
+        boxes, scores = [], []
+        for _ in range(boxes_per_image):
+            gt = rng.choice(gts)
+            jitter = [v + rng.gauss(0, 8) for v in gt]
+            boxes.append(
+                [
+                    min(jitter[0], jitter[2]),
+                    min(jitter[1], jitter[3]),
+                    max(jitter[0], jitter[2]),
+                    max(jitter[1], jitter[3]),
+                ]
+            )
+            scores.append(rng.random())
+        samples.append((boxes, scores, gts))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection metrics")
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument(
+        "--boxes", type=int, default=10, help="Predicted boxes per image"
+    )
+    args = parser.parse_args()
+
+    samples = make_samples(args.images, args.boxes)
+    arrays = [(np.asarray(b), np.asarray(s), np.asarray(g)) for b, s, g in samples]
+    print(f"{args.images} images, {args.images * args.boxes} predicted boxes")
+
+    def vectorized_map(score_resolution):
+        config = {"tasks": {"detection": {"score_resolution": score_resolution}}}
+        metric = DetectionMetric(config)
+        for boxes, scores, gts in arrays:
+            metric.add({"boxes": boxes, "scores": scores}, {"boxes": gts})
+        return metric.compute()["mAP"]
+
+    start = time.perf_counter()
+    # Scores are random floats: a fine resolution keeps every score in its own bin
+    vectorized = vectorized_map(1e-12)
+    numpy_time = time.perf_counter() - start
+    binned = vectorized_map(1e-4)
+
+    start = time.perf_counter()
+    reference = python_map(samples)
+    python_time = time.perf_counter() - start
+
+    print(f"numpy:  mAP={vectorized:.4f}  {numpy_time:.3f}s")
+    print(f"python: mAP={reference:.4f}  {python_time:.3f}s")
+    print(
+        f"binned: mAP={binned:.4f}  "
+        f"(default score_resolution, {binned - reference:+.2e})"
+    )
+    print(f"speedup: {python_time / numpy_time:.1f}x {vectorized - reference:+.3e}")
+    assert np.isclose(vectorized, reference, atol=1e-6)
+
+
+if __name__ == "__main__":
+    main()
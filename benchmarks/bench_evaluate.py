@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Throughput/latency benchmark of ``MMCSBenchmark.evaluate`` on synthetic data.
+
+Runs the full harness (data loading, batching, generation, metrics) against a
+synthetic split and a stub model with configurable latency, and reports
+samples/sec, per-sample latency percentiles, peak RSS and the time spent in
+data loading, the model and the metrics, as measured by
+:mod:`mmcsbench.profiling`. Every run is appended to a JSON history; the
+latest earlier run with the same parameters is used as the baseline for
+regression checks.
+
+Usage:
+    python benchmarks/bench_evaluate.py --images 500 --density 3 --sample-latency 0.001
+    python benchmarks/bench_evaluate.py --fail-on-regression
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from synthetic import StubModel, make_dataset
+
+import mmcsbench
+from mmcsbench import MMCSBenchmark, profiling
+from mmcsbench.tasks import TASKS
+
+DEFAULT_HISTORY = Path(__file__).resolve().parent / "history.json"
+
+# Top-level profiler stages summed into each reported phase
+PHASES = {
+    "load": ("dataset.load", "dataset.warm_cache"),
+    "model": ("model.generate", "model.encode_image"),
+    "wait": ("engine.wait",),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """Run one benchmark and return its params and results."""
+    data_dir = Path(args.data_dir or tempfile.mkdtemp(prefix="mmcsbench-bench-"))
+    height, width = args.image_size
+    params = {
+        "images": args.images,
+        "image_size": [height, width],
+        "density": args.density,
+        "tasks": args.tasks,
+        "batch_size": args.batch_size,
+        "num_workers": args.num_workers,
+        "fused": args.fused,
+        "image_cache": args.image_cache,
+        "call_latency": args.call_latency,
+        "sample_latency": args.sample_latency,
+    }
+    marker = data_dir / "synthetic.json"
+    layout = {key: params[key] for key in ("images", "image_size", "density")}
+    if not marker.exists() or json.loads(marker.read_text()) != layout:
+        print(f"Generating {args.images} synthetic images in {data_dir}...")
+        make_dataset(str(data_dir), args.images, (height, width), args.density)
+        marker.write_text(json.dumps(layout))
+
+    config = {
+        "data_dir": str(data_dir),
+        "dataset": {"image_size": args.target_size, "image_cache": args.image_cache},
+        "evaluation": {
+            "batch_size": args.batch_size,
+            "num_workers": args.num_workers,
+            "prefetch_batches": 2,
+            "fused": args.fused,
+        },
+        "cache": {"enabled": False},
+    }
+    model = StubModel(
+        call_latency=args.call_latency,
+        sample_latency=args.sample_latency,
+        jitter=args.jitter,
+    )
+    latencies = []
+    generate_batch = model.generate_batch
+
+    def timed_generate_batch(images, prompts, **kwargs):
+        start = time.perf_counter()
+        outputs = generate_batch(images, prompts, **kwargs)
+        elapsed = time.perf_counter() - start
+        latencies.extend([elapsed] * len(prompts))
+        return outputs
+
+    model.generate_batch = timed_generate_batch
+    benchmark = MMCSBenchmark(config=config)
+    with profiling.enable() as profiler:
+        start = time.perf_counter()
+        benchmark.evaluate(model, tasks=args.tasks, split="test")
+        wall = time.perf_counter() - start
+
+    timers = profiler.timers
+    phases = {
+        phase: sum(timers[name].total for name in names if name in timers)
+        for phase, names in PHASES.items()
+    }
+    phases["metrics"] = sum(
+        h.total for name, h in timers.items() if name.startswith("metrics.")
+    )
+
+    latency_ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    results = {
+        "samples": len(latencies),
+        "wall_s": wall,
+        "samples_per_s": len(latencies) / wall if wall else 0.0,
+        "latency_ms": {
+            f"p{q}": float(np.percentile(latency_ms, q)) for q in (50, 95, 99)
+        },
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "phases_s": phases,
+    }
+    return params, results
+
+
+def load_history(path):
+    if not path.exists():
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def find_baseline(history, params):
+    for entry in reversed(history):
+        if entry["params"] == params:
+            return entry
+    return None
+
+
+def compare(results, baseline, threshold):
+    """Return throughput and p95 latency regressions beyond relative ``threshold``."""
+    regressions = []
+    old, new = baseline["results"]["samples_per_s"], results["samples_per_s"]
+    if old and new < old * (1 - threshold):
+        regressions.append(
+            f"samples/sec {new:.1f} < {old:.1f} (-{(1 - new / old):.0%})"
+        )
+    old = baseline["results"]["latency_ms"]["p95"]
+    new = results["latency_ms"]["p95"]
+    if old and new > old * (1 + threshold):
+        regressions.append(
+            f"p95 latency {new:.2f}ms > {old:.2f}ms (+{(new / old - 1):.0%})"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark MMCSBenchmark.evaluate throughput"
+    )
+    parser.add_argument("--images", type=int, default=200, help="Synthetic images")
+    parser.add_argument(
+        "--image-size",
+        type=int,
+        nargs=2,
+        default=[480, 640],
+        metavar=("H", "W"),
+        help="Synthetic image size",
+    )
+    parser.add_argument(
+        "--target-size",
+        type=int,
+        nargs=2,
+        default=[224, 224],
+        metavar=("H", "W"),
+        help="dataset.image_size used for decoding",
+    )
+    parser.add_argument(
+        "--density", type=int, default=2, help="Boxes, questions and captions per image"
+    )
+    parser.add_argument("--tasks", nargs="+", default=list(TASKS), choices=list(TASKS))
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument(
+        "--no-fused",
+        dest="fused",
+        action="store_false",
+        help="Evaluate the tasks one after another",
+    )
+    parser.add_argument(
+        "--image-cache",
+        action="store_true",
+        help="Enable the memory-mapped resized-image cache",
+    )
+    parser.add_argument(
+        "--call-latency",
+        type=float,
+        default=0.0,
+        help="Stub model latency per generate_batch call (s)",
+    )
+    parser.add_argument(
+        "--sample-latency",
+        type=float,
+        default=0.001,
+        help="Stub model latency per prompt (s)",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Relative jitter of the stub latency"
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="Directory for the synthetic dataset (reused across runs)",
+    )
+    parser.add_argument(
+        "--history",
+        type=Path,
+        default=DEFAULT_HISTORY,
+        help="JSON file the run is appended to",
+    )
+    parser.add_argument(
+        "--no-record", action="store_true", help="Do not append to the history"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative change reported as a regression",
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Exit with status 1 on a regression",
+    )
+    args = parser.parse_args()
+
+    params, results = run(args)
+    phases = results["phases_s"]
+    latency = results["latency_ms"]
+    print(
+        f"{results['samples']} samples in {results['wall_s']:.2f}s: "
+        f"{results['samples_per_s']:.1f} samples/sec"
+    )
+    print(
+        f"latency p50={latency['p50']:.2f}ms p95={latency['p95']:.2f}ms "
+        f"p99={latency['p99']:.2f}ms"
+    )
+    print(
+        f"load={phases['load']:.2f}s (worker threads) wait={phases['wait']:.2f}s "
+        f"model={phases['model']:.2f}s metrics={phases['metrics']:.2f}s "
+        f"peak_rss={results['peak_rss_mb']:.0f}MB"
+    )
+
+    history = load_history(args.history)
+    baseline = find_baseline(history, params)
+    regressions = []
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        label = baseline.get("version"), baseline.get("commit")
+        print(
+            f"baseline {label[0]} ({label[1]}): "
+            f"{baseline['results']['samples_per_s']:.1f} samples/sec"
+        )
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+
+    if not args.no_record:
+        history.append(
+            {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "version": mmcsbench.__version__,
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "params": params,
+                "results": results,
+            }
+        )
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.history, "w") as f:
+            json.dump(history, f, indent=2)
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
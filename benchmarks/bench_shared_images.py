@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: handing decoded images to another process through a pickling
+queue vs. a :class:`SharedImageRing`.
+
+The handoff benchmark sends pre-decoded ``(H, W, 3)`` images from a producer
+process to a consumer process, so it measures only the per-image copy and
+serialization cost. The loading benchmark decodes a synthetic split in loader
+processes, either returning arrays through a ``multiprocessing`` pool or
+decoding into ring slots with :func:`stream_shared_images`.
+
+Usage:
+    python benchmarks/bench_shared_images.py --images 2000 --size 448
+"""
+
+import argparse
+import multiprocessing
+import pickle
+import tempfile
+import time
+
+import numpy as np
+from synthetic import make_dataset
+
+from mmcsbench.datasets import CamouflageDataset
+from mmcsbench.shared_images import SharedImageRing, stream_shared_images
+
+
+def _produce_pickled(frames, count, output):
+    for i in range(count):
+        output.put((i, frames[i % len(frames)]))
+    output.put(None)
+
+
+def _produce_shared(frames, count, ring):
+    for i in range(count):
+        slot = ring.acquire()
+        ring.slot(slot)[...] = frames[i % len(frames)]
+        ring.publish(slot, i)
+    ring.publish(None)
+    ring.close()
+
+
+def handoff_pickled(frames, count, context):
+    """Seconds to move ``count`` images through a pickling queue."""
+    output = context.Queue(maxsize=64)
+    producer = context.Process(target=_produce_pickled, args=(frames, count, output))
+    start = time.perf_counter()
+    producer.start()
+    checksum = 0
+    while True:
+        item = output.get()
+        if item is None:
+            break
+        checksum += int(item[1][0, 0, 0])
+    elapsed = time.perf_counter() - start
+    producer.join()
+    return elapsed, checksum
+
+
+def handoff_shared(frames, count, context, num_slots):
+    """Seconds to move ``count`` images through a shared-memory ring."""
+    with SharedImageRing(num_slots, frames.shape[1:3], context=context) as ring:
+        producer = context.Process(target=_produce_shared, args=(frames, count, ring))
+        start = time.perf_counter()
+        producer.start()
+        checksum = 0
+        while True:
+            slot, _ = ring.receive()
+            if slot is None:
+                break
+            checksum += int(ring.slot(slot)[0, 0, 0])
+            ring.release(slot)
+        elapsed = time.perf_counter() - start
+        producer.join()
+    return elapsed, checksum
+
+
+_DATASET = None
+
+
+def _load(idx):
+    return idx, _DATASET.load_image(idx)
+
+
+def _init_worker(dataset):
+    global _DATASET
+    _DATASET = dataset
+
+
+def load_pickled(dataset, workers, context):
+    with context.Pool(workers, initializer=_init_worker, initargs=(dataset,)) as pool:
+        start = time.perf_counter()
+        for _, image in pool.imap_unordered(_load, range(len(dataset)), chunksize=4):
+            image[0, 0, 0]
+        return time.perf_counter() - start
+
+
+def load_shared(dataset, workers, context, num_slots):
+    with SharedImageRing.from_dataset(dataset, num_slots, context=context) as ring:
+        start = time.perf_counter()
+        for _, slot, _ in stream_shared_images(
+            dataset, range(len(dataset)), ring, num_workers=workers, context=context
+        ):
+            ring.slot(slot)[0, 0, 0]
+            ring.release(slot)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark shared-memory image handoff"
+    )
+    parser.add_argument("--images", type=int, default=2000, help="Images handed off")
+    parser.add_argument("--size", type=int, default=448, help="Image side length")
+    parser.add_argument("--slots", type=int, default=64, help="Ring slots")
+    parser.add_argument("--workers", type=int, default=2, help="Loader processes")
+    parser.add_argument(
+        "--dataset-images",
+        type=int,
+        default=200,
+        help="Images of the synthetic split decoded by the loaders (0 skips)",
+    )
+    args = parser.parse_args()
+    context = multiprocessing.get_context()
+
+    frames = np.random.default_rng(0).integers(
+        0, 256, (8, args.size, args.size, 3), dtype=np.uint8
+    )
+    message = len(pickle.dumps((0, frames[0]), protocol=pickle.HIGHEST_PROTOCOL))
+    slot_message = len(pickle.dumps((0, 0), protocol=pickle.HIGHEST_PROTOCOL))
+    pickled, expected = handoff_pickled(frames, args.images, context)
+    shared, checksum = handoff_shared(frames, args.images, context, args.slots)
+    assert checksum == expected
+
+    print(
+        f"handoff of {args.images} images of {args.size}x{args.size}x3 "
+        f"({frames[0].nbytes / 1024:.0f} KiB each)"
+    )
+    print(
+        f"pickled queue: {pickled / args.images * 1e6:8.1f} us/image  "
+        f"{message} bytes serialized per image"
+    )
+    print(
+        f"shared ring:   {shared / args.images * 1e6:8.1f} us/image  "
+        f"{slot_message} bytes serialized per image"
+    )
+    print(f"speedup: {pickled / shared:.1f}x")
+
+    if args.dataset_images:
+        with tempfile.TemporaryDirectory() as root:
+            make_dataset(root, num_images=args.dataset_images, image_size=(480, 640))
+            dataset = CamouflageDataset(
+                root,
+                split="test",
+                image_size=args.size,
+                image_cache=False,
+                packed=False,
+            )
+            pickled = load_pickled(dataset, args.workers, context)
+            shared = load_shared(dataset, args.workers, context, args.slots)
+        print(
+            f"\ndecode + handoff of {args.dataset_images} JPEGs "
+            f"with {args.workers} workers"
+        )
+        print(f"pool (pickled):  {args.dataset_images / pickled:8.1f} images/s")
+        print(f"ring (shared):   {args.dataset_images / shared:8.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Synthetic datasets and stub models for the MMCSBench benchmark suite.
+"""
+
+import json
+import random
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from mmcsbench.models import BaseModel
+from mmcsbench.tasks import TASKS
+
+CATEGORIES = ["animal", "military", "adaptive", "natural"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+WORDS = [
+    "a",
+    "moth",
+    "hides",
+    "on",
+    "the",
+    "bark",
+    "green",
+    "leaf",
+    "insect",
+    "blends",
+    "into",
+    "sand",
+    "soldier",
+    "net",
+    "shadow",
+    "snake",
+    "rock",
+    "pattern",
+]
+
+
+def _sentence(rng: random.Random, length: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def make_dataset(
+    root: str,
+    num_images: int = 200,
+    image_size: Tuple[int, int] = (480, 640),
+    density: int = 2,
+    tasks: Sequence[str] = TASKS,
+    split: str = "test",
+    seed: int = 0,
+) -> Path:
+    """
+    Write a synthetic split with JPEG images and annotations for every task.
+
+    Args:
+        root: Data directory to create
+        num_images: Number of images
+        image_size: Image ``(height, width)``
+        density: Annotations per image and task (boxes, questions, captions)
+        tasks: Tasks to annotate
+        split: Split name
+        seed: Random seed
+
+    Returns:
+        The data directory
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    images_dir = root / "images" / split
+    images_dir.mkdir(parents=True, exist_ok=True)
+    (root / "annotations").mkdir(parents=True, exist_ok=True)
+    height, width = image_size
+    noise = np.random.default_rng(seed).integers(
+        0, 256, (height, width, 3), dtype=np.uint8
+    )
+
+    annotations = []
+    for i in range(num_images):
+        image_file = f"{i:06d}.jpg"
+        # Shift a shared noise texture so images differ without regenerating it
+        Image.fromarray(np.roll(noise, i * 7, axis=1)).save(
+            images_dir / image_file, quality=90
+        )
+        category = CATEGORIES[i % len(CATEGORIES)]
+        annotation = {
+            "image_id": f"syn{i:06d}",
+            "image_file": image_file,
+            "category": category,
+            "difficulty": DIFFICULTIES[i % 3],
+            "tasks": {},
+        }
+        if "detection" in tasks:
+            boxes = []
+            for _ in range(density):
+                x, y = rng.uniform(0, width - 100), rng.uniform(0, height - 100)
+                boxes.append([x, y, x + rng.uniform(20, 100), y + rng.uniform(20, 100)])
+            annotation["tasks"]["detection"] = {"boxes": boxes}
+        if "classification" in tasks:
+            annotation["tasks"]["classification"] = {"label": category}
+        if "reasoning" in tasks:
+            annotation["tasks"]["reasoning"] = [
+                {
+                    "question": f"Question {q} about image {i}?",
+                    "answer": _sentence(rng, 3),
+                }
+                for q in range(density)
+            ]
+        if "description" in tasks:
+            annotation["tasks"]["description"] = {
+                "captions": [_sentence(rng, rng.randint(6, 14)) for _ in range(density)]
+            }
+        annotations.append(annotation)
+
+    with open(root / "annotations" / f"{split}.json", "w") as f:
+        json.dump(annotations, f)
+    return root
+
+
+class StubModel(BaseModel):
+    """
+    Model with configurable latency and canned answers.
+
+    Each ``generate_batch`` call sleeps ``call_latency`` plus
+    ``sample_latency`` per prompt, with optional relative jitter.
+    """
+
+    def __init__(
+        self,
+        call_latency: float = 0.0,
+        sample_latency: float = 0.001,
+        jitter: float = 0.0,
+        seed: int = 0,
+    ):
+        self.call_latency = call_latency
+        self.sample_latency = sample_latency
+        self.jitter = jitter
+        self.name = "stub"
+        self.config = {"call_latency": call_latency, "sample_latency": sample_latency}
+        self._rng = random.Random(seed)
+
+    def _sleep(self, num_prompts: int):
+        delay = self.call_latency + self.sample_latency * num_prompts
+        if self.jitter:
+            delay *= 1 + self._rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def forward(self, image, text: Optional[str] = None):
+        return None
+
+    def _answer(self, prompt: str) -> str:
+        seed = sum(map(ord, prompt))
+        if "bounding boxes" in prompt.lower() or "locate" in prompt.lower():
+            x, y = seed % 400, (seed * 7) % 300
+            return f"[{x}, {y}, {x + 60}, {y + 40}]"
+        if "camouflage" in prompt.lower() and "type" in prompt.lower():
+            return f"It is {CATEGORIES[seed % 4]} camouflage."
+        return " ".join(WORDS[(seed + k) % len(WORDS)] for k in range(seed % 9 + 3))
+
+    def generate(self, image, prompt: str, **kwargs):
+        self._sleep(1)
+        return self._answer(prompt)
+
+    def generate_batch(
+        self, images: Sequence, prompts: Sequence[str], **kwargs
+    ) -> List:
+        self._sleep(len(prompts))
+        return [self._answer(prompt) for prompt in prompts]
@@ -4,15 +4,43 @@ Example script demonstrating how to use MMCSBench for model evaluation.
 """
 
 import argparse
-from mmcsbench import MMCSBenchmark, load_model
+import contextlib
+import json
+import os
+
+import yaml
+from mmcsbench import MMCSBenchmark, load_model, profiling
+from mmcsbench.sharding import parse_shard
+from mmcsbench.subsets import parse_subset
+
+
+def write_profile(profiler, directory, cprofile=False):
+    """Print the profile summary and write it, with a Chrome trace, to a directory."""
+    os.makedirs(directory, exist_ok=True)
+    summary = profiler.summary()
+    print("\nProfile:")
+    print(summary)
+    with open(os.path.join(directory, "profile.txt"), "w") as f:
+        f.write(summary + "\n")
+    with open(os.path.join(directory, "profile.json"), "w") as f:
+        json.dump(profiler.to_dict(), f, indent=2)
+    profiler.write_trace(os.path.join(directory, "trace.json"))
+    if cprofile:
+        profiler.write_cprofile(os.path.join(directory, "profile.pstats"))
+    print(f"Profile written to {directory}")
 
 
 def main():
     parser = argparse.ArgumentParser(description='Run MMCSBench evaluation')
     parser.add_argument('--config', default='configs/default.yaml', 
                         help='Path to configuration file')
-    parser.add_argument('--model', required=True,
-                        help='Model name to evaluate')
+    parser.add_argument(
+        "--model",
+        required=True,
+        nargs="+",
+        help="Model name(s) to evaluate; several models share data loading "
+        "and are ranked on a leaderboard",
+    )
     parser.add_argument('--tasks', nargs='+', 
                         choices=['detection', 'classification', 'reasoning', 'description'],
                         help='Tasks to evaluate (default: all)')
@@ -20,39 +48,132 @@ def main():
                         help='Data split to use')
     parser.add_argument('--output-dir', default='results/',
                         help='Output directory for results')
-    
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Disable the prediction cache"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached predictions and overwrite them",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted run from the predictions in --output-dir",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="Evaluate only shard I of N (zero-based); "
+        "combine shards with `mmcsbench merge`",
+    )
+    parser.add_argument(
+        "--subset",
+        type=parse_subset,
+        metavar="N",
+        help="Smoke-evaluate a stratified sample of N items (or a fraction "
+        "below 1) and report its expected error against the full split; "
+        "results go to OUTPUT_DIR/subset-N",
+    )
+    parser.add_argument(
+        "--subset-reference",
+        metavar="RESULTS_JSON",
+        help="With --subset, the results.json of a full-split run to compare "
+        "the subset metrics with",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Profile the run and write profile.txt, profile.json and "
+        "trace.json (Chrome/Perfetto) to DIR",
+    )
+    parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="With --profile, also write cProfile stats to DIR/profile.pstats",
+    )
+
     args = parser.parse_args()
-    
+
     # Initialize benchmark
     print(f"Loading benchmark with config: {args.config}")
-    benchmark = MMCSBenchmark(config=args.config)
-    
-    # Load model
-    print(f"Loading model: {args.model}")
-    model = load_model(args.model)
-    
+    with open(args.config, "r") as f:
+        config = yaml.safe_load(f)
+    cache_config = config.setdefault("cache", {})
+    if args.no_cache:
+        cache_config["enabled"] = False
+    if args.refresh:
+        cache_config["refresh"] = True
+    benchmark = MMCSBenchmark(config=config)
+
+    # Load models
+    print(f"Loading model(s): {', '.join(args.model)}")
+    models = [load_model(name) for name in args.model]
+
+    output_dir = args.output_dir
+    reference = None
+    if args.subset is not None:
+        output_dir = os.path.join(args.output_dir, f"subset-{args.subset}")
+        if args.subset_reference:
+            with open(args.subset_reference, "r") as f:
+                reference = json.load(f)
+
     # Run evaluation
     print(f"Running evaluation on {args.split} split...")
-    results = benchmark.evaluate(
-        model=model,
-        tasks=args.tasks,
-        split=args.split
+    profiler = (
+        profiling.Profiler(trace=True, cprofile=args.cprofile) if args.profile else None
     )
-    
+    with profiling.enable(profiler) if profiler else contextlib.nullcontext():
+        if len(models) > 1:
+            results = benchmark.evaluate_many(
+                models=models,
+                tasks=args.tasks,
+                split=args.split,
+                output_dir=output_dir,
+                resume=args.resume,
+                shard=args.shard,
+                subset=args.subset,
+                subset_reference=reference,
+            )
+        else:
+            results = benchmark.evaluate(
+                model=models[0],
+                tasks=args.tasks,
+                split=args.split,
+                output_dir=output_dir,
+                resume=args.resume,
+                shard=args.shard,
+                subset=args.subset,
+                subset_reference=reference,
+            )
+    if profiler:
+        write_profile(profiler, args.profile, args.cprofile)
+
     # Print results
+    if args.shard:
+        print(
+            f"\nResults cover shard {args.shard[0]}/{args.shard[1]} only; "
+            f"run `mmcsbench merge` once all shards are done."
+        )
     print("\nEvaluation Results:")
     print("=" * 50)
-    for task, metrics in results.items():
-        print(f"\n{task.upper()} Task:")
-        for metric, value in metrics.items():
-            print(f"  {metric}: {value:.4f}")
-    
+    for model_name, model_results in (
+        results.items() if len(models) > 1 else [(args.model[0], results)]
+    ):
+        if len(models) > 1:
+            print(f"\n[{model_name}]")
+        for task, metrics in model_results.items():
+            print(f"\n{task.upper()} Task:")
+            for metric, value in metrics.items():
+                print(f"  {metric}: {value:.4f}")
+
     # Generate detailed report
-    print(f"\nGenerating detailed report in {args.output_dir}")
-    benchmark.generate_report(results, args.output_dir)
-    
+    print(f"\nGenerating detailed report in {output_dir}")
+    benchmark.generate_report(results, output_dir)
+
     print("Evaluation completed!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
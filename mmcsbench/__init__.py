@@ -9,15 +9,45 @@ __version__ = "1.0.0"
 __author__ = "Jin Zhang"
 __email__ = ""
 
-from .benchmark import MMCSBenchmark
-from .models import ModelRegistry, load_model
-from .evaluation import Evaluator
-from .datasets import CamouflageDataset
+import importlib
+from typing import TYPE_CHECKING
+
+# Public API, imported on first access so that ``import mmcsbench`` stays cheap
+# and does not pull in torch, PIL, numpy or yaml
+_LAZY_ATTRIBUTES = {
+    "MMCSBenchmark": ".benchmark",
+    "ModelRegistry": ".models",
+    "load_model": ".models",
+    "Evaluator": ".evaluation",
+    "CamouflageDataset": ".datasets",
+    "profiling": ".profiling",
+}
+
+if TYPE_CHECKING:
+    from . import profiling
+    from .benchmark import MMCSBenchmark
+    from .datasets import CamouflageDataset
+    from .evaluation import Evaluator
+    from .models import ModelRegistry, load_model
 
 __all__ = [
     "MMCSBenchmark",
-    "ModelRegistry", 
+    "ModelRegistry",
     "load_model",
     "Evaluator",
     "CamouflageDataset",
-]
\ No newline at end of file
+    "profiling",
+]
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+    value = module if module.__name__ == f"{__name__}.{name}" else getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
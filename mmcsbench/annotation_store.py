@@ -0,0 +1,276 @@
+"""
+Compact, memory-mapped annotation store for MMCSBench
+
+``annotations/{split}.json`` is converted once into a ``{split}.store``
+directory next to it::
+
+    meta.json           vocabularies, source file signature, format version
+    payload.bin         UTF-8 JSON of every annotation, concatenated
+    offsets.npy         int64 byte offsets into payload.bin (len + 1 entries)
+    category.npy        int32 category code per item (-1 if missing)
+    difficulty.npy      int32 difficulty code per item (-1 if missing)
+    {field}_order.npy   item indices sorted by code
+    {field}_bounds.npy  start offsets of each code in {field}_order.npy
+    task_{task}.npy     int64 indices of items annotated for a task
+
+All arrays are opened with ``mmap_mode='r'``, so opening a store is
+constant-time and an annotation is only decoded when it is accessed.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .tasks import TASKS
+
+STORE_VERSION = 1
+
+_FIELDS = ("category", "difficulty")
+
+
+def _source_signature(source: Path) -> Dict[str, int]:
+    stat = source.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_annotation_list(source: Union[str, Path]) -> List[Dict]:
+    """
+    Read an annotation JSON file into a list of per-image annotations.
+
+    Accepts a plain list or a dict with an ``annotations`` list, as written by
+    ``scripts/download_dataset.py``.
+    """
+    with open(source, "r") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("annotations", [])
+    return list(data)
+
+
+class AnnotationStore(Sequence):
+    """
+    Read-only sequence of annotations backed by a memory-mapped store.
+
+    Besides item access, the store answers task, category and difficulty
+    lookups with precomputed index arrays, so a lookup costs O(k) in the
+    number of matching items.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Open an existing store.
+
+        Args:
+            path: Store directory
+        """
+        self.path = Path(path)
+        with open(self.path / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported annotation store version in {self.path}")
+
+        self._offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        size = int(self._offsets[-1]) if len(self._offsets) else 0
+        if size:
+            self._payload = np.memmap(
+                self.path / "payload.bin", dtype=np.uint8, mode="r"
+            )
+        else:
+            self._payload = np.zeros(0, dtype=np.uint8)
+        self._codes = {}
+        self._order = {}
+        self._bounds = {}
+        for field in _FIELDS:
+            self._codes[field] = np.load(self.path / f"{field}.npy", mmap_mode="r")
+            self._order[field] = np.load(
+                self.path / f"{field}_order.npy", mmap_mode="r"
+            )
+            self._bounds[field] = np.load(
+                self.path / f"{field}_bounds.npy", mmap_mode="r"
+            )
+        self._tasks = {
+            task: np.load(self.path / f"task_{task}.npy", mmap_mode="r")
+            for task in TASKS
+        }
+
+    @classmethod
+    def build(
+        cls, source: Union[str, Path], path: Union[str, Path]
+    ) -> "AnnotationStore":
+        """
+        Convert an annotation JSON file into a store.
+
+        Args:
+            source: Annotation JSON file
+            path: Store directory to (re)create
+
+        Returns:
+            The opened store
+        """
+        source = Path(source)
+        path = Path(path)
+        annotations = load_annotation_list(source)
+
+        vocabularies: Dict[str, List[str]] = {field: [] for field in _FIELDS}
+        lookup: Dict[str, Dict[str, int]] = {field: {} for field in _FIELDS}
+        codes = {
+            field: np.full(len(annotations), -1, dtype=np.int32) for field in _FIELDS
+        }
+        tasks: Dict[str, List[int]] = {task: [] for task in TASKS}
+        offsets = np.zeros(len(annotations) + 1, dtype=np.int64)
+
+        tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+
+        with open(tmp / "payload.bin", "wb") as payload:
+            for idx, annotation in enumerate(annotations):
+                encoded = json.dumps(annotation, separators=(",", ":")).encode("utf-8")
+                payload.write(encoded)
+                offsets[idx + 1] = offsets[idx] + len(encoded)
+                for field in _FIELDS:
+                    value = annotation.get(field)
+                    if value is None:
+                        continue
+                    value = str(value)
+                    if value not in lookup[field]:
+                        lookup[field][value] = len(vocabularies[field])
+                        vocabularies[field].append(value)
+                    codes[field][idx] = lookup[field][value]
+                for task in annotation.get("tasks", {}):
+                    if task in tasks:
+                        tasks[task].append(idx)
+
+        np.save(tmp / "offsets.npy", offsets)
+        for field in _FIELDS:
+            order = np.argsort(codes[field], kind="stable").astype(np.int64)
+            bounds = np.searchsorted(
+                codes[field][order], np.arange(len(vocabularies[field]) + 1)
+            )
+            np.save(tmp / f"{field}.npy", codes[field])
+            np.save(tmp / f"{field}_order.npy", order)
+            np.save(tmp / f"{field}_bounds.npy", bounds.astype(np.int64))
+        for task, indices in tasks.items():
+            np.save(tmp / f"task_{task}.npy", np.asarray(indices, dtype=np.int64))
+        with open(tmp / "meta.json", "w") as f:
+            json.dump(
+                {
+                    "version": STORE_VERSION,
+                    "source": _source_signature(source),
+                    "num_items": len(annotations),
+                    "vocabularies": vocabularies,
+                },
+                f,
+            )
+
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+        return cls(path)
+
+    @classmethod
+    def open(
+        cls, source: Union[str, Path], path: Optional[Union[str, Path]] = None
+    ) -> "AnnotationStore":
+        """
+        Open the store for an annotation file, building it if missing or stale.
+
+        Args:
+            source: Annotation JSON file
+            path: Store directory. Defaults to ``{source stem}.store`` next to it.
+
+        Returns:
+            The opened store
+        """
+        source = Path(source)
+        path = Path(path) if path is not None else source.with_suffix(".store")
+        meta_file = path / "meta.json"
+        if meta_file.exists():
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+            if meta.get("version") == STORE_VERSION and meta.get(
+                "source"
+            ) == _source_signature(source):
+                return cls(path)
+        return cls.build(source, path)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"annotation index {idx} out of range")
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return json.loads(self._payload[start:end].tobytes())
+
+    @property
+    def vocabularies(self) -> Dict[str, List[str]]:
+        """Category and difficulty values present in the split."""
+        return self.meta["vocabularies"]
+
+    def task_indices(self, task: str) -> np.ndarray:
+        """Indices of items annotated for a task."""
+        if task not in self._tasks:
+            raise ValueError(f"Unknown task: {task}")
+        return self._tasks[task]
+
+    def field_indices(self, field: str, value: Any) -> np.ndarray:
+        """
+        Indices of items whose ``category`` or ``difficulty`` equals a value.
+
+        Args:
+            field: ``'category'`` or ``'difficulty'``
+            value: Field value
+
+        Returns:
+            Sorted index array (empty if the value does not occur)
+        """
+        if field not in self._codes:
+            raise ValueError(f"Unknown annotation field: {field}")
+        try:
+            code = self.vocabularies[field].index(str(value))
+        except ValueError:
+            return np.zeros(0, dtype=np.int64)
+        bounds = self._bounds[field]
+        return self._order[field][bounds[code] : bounds[code + 1]]
+
+    def field_codes(self, field: str) -> np.ndarray:
+        """Per-item integer codes of ``category`` or ``difficulty`` (-1 if missing)."""
+        return self._codes[field]
+
+    def select(
+        self,
+        task: Optional[str] = None,
+        category: Optional[Any] = None,
+        difficulty: Optional[Any] = None,
+    ) -> np.ndarray:
+        """
+        Indices of items matching every given filter.
+
+        Returns:
+            Sorted index array
+        """
+        selected = None
+        if task is not None:
+            selected = np.asarray(self.task_indices(task))
+        for field, value in (("category", category), ("difficulty", difficulty)):
+            if value is None:
+                continue
+            indices = np.asarray(self.field_indices(field, value))
+            selected = (
+                indices
+                if selected is None
+                else np.intersect1d(selected, indices, assume_unique=True)
+            )
+        if selected is None:
+            return np.arange(len(self), dtype=np.int64)
+        return selected
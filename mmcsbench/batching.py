@@ -0,0 +1,317 @@
+"""
+Adaptive dynamic batching of model calls for MMCSBench
+
+:class:`DynamicBatcher` sits between the inference engine and
+:meth:`BaseModel.generate_batch`. Requests are grouped by image size and
+prompt length, the batch size grows while the per-sample latency improves,
+and on an out-of-memory error the failed batch is halved and only its items
+are retried. Tuned sizes are stored per model and task in a small JSON file
+and picked up by the next run.
+"""
+
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from . import profiling
+
+
+def is_oom_error(error: BaseException) -> bool:
+    """Return whether an exception signals that a batch did not fit in memory."""
+    if isinstance(error, MemoryError):
+        return True
+    message = str(error).lower()
+    return isinstance(error, RuntimeError) and (
+        "out of memory" in message
+        or "cuda error: out of memory" in message
+        or "failed to allocate" in message
+    )
+
+
+def batch_key(identity: Dict[str, Any], task: str) -> str:
+    """
+    Key tuned batch sizes are stored under.
+
+    Args:
+        identity: Model name and config, see :func:`model_identity`
+        task: Task name
+
+    Returns:
+        ``name/config-digest/task``
+    """
+    config = json.dumps(identity.get("config", {}), sort_keys=True, default=str)
+    digest = hashlib.sha1(config.encode("utf-8")).hexdigest()[:12]
+    return f"{identity['name']}/{digest}/{task}"
+
+
+def _image_shape(image: Any) -> Optional[tuple]:
+    shape = getattr(image, "shape", None)
+    if shape is not None:
+        return tuple(shape)
+    size = getattr(image, "size", None)
+    if isinstance(size, tuple):
+        return size
+    return None
+
+
+class _State:
+    """Tuning state of one model and task."""
+
+    __slots__ = ("size", "ceiling", "latency", "converged")
+
+    def __init__(
+        self,
+        size: int,
+        ceiling: Optional[int] = None,
+        latency: Optional[Dict[int, float]] = None,
+        converged: bool = False,
+    ):
+        self.size = size
+        self.ceiling = ceiling
+        self.latency = latency or {}
+        self.converged = converged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "ceiling": self.ceiling,
+            "converged": self.converged,
+            "latency": {str(size): value for size, value in self.latency.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_State":
+        return cls(
+            int(data["size"]),
+            data.get("ceiling"),
+            {int(size): value for size, value in data.get("latency", {}).items()},
+            bool(data.get("converged", False)),
+        )
+
+
+class DynamicBatcher:
+    """
+    Splits model requests into adaptively sized batches.
+
+    Per (model, task) the batcher starts at ``initial_size`` (or the size
+    tuned by a previous run) and multiplies it by ``growth`` after every full
+    batch whose per-sample latency is at least ``tolerance`` better than at
+    the next smaller size. Once a larger batch stops paying off, it settles on
+    the best size. A batch that runs out of memory caps the size below the
+    failed batch, is halved and retried. When fewer requests are pending than
+    the tuned size, all of them form one batch, which counts as a full batch
+    so that tuning continues at the size callers can actually fill.
+    """
+
+    def __init__(
+        self,
+        initial_size: int = 8,
+        min_size: int = 1,
+        max_size: int = 256,
+        growth: float = 2.0,
+        tolerance: float = 0.05,
+        state_path: Optional[str] = None,
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            initial_size: Batch size for models and tasks without tuned state
+            min_size: Smallest batch size
+            max_size: Largest batch size
+            growth: Factor the batch size grows by while latency improves
+            tolerance: Relative per-sample latency gain required to keep growing
+            state_path: JSON file the tuned sizes are loaded from and saved to
+        """
+        self.initial_size = max(min_size, initial_size)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.growth = growth
+        self.tolerance = tolerance
+        self.state_path = Path(state_path) if state_path else None
+        self._states: Dict[str, _State] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if self.state_path is not None and self.state_path.exists():
+            try:
+                with open(self.state_path, "r") as f:
+                    self._states = {
+                        key: _State.from_dict(value)
+                        for key, value in json.load(f).items()
+                    }
+            except (OSError, ValueError, KeyError):
+                self._states = {}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["DynamicBatcher"]:
+        """
+        Create a batcher from ``evaluation.dynamic_batching``, or None if disabled.
+
+        The initial size defaults to ``models.default_config.batch_size``.
+        """
+        batching = config.get("evaluation", {}).get("dynamic_batching", {})
+        if not batching.get("enabled", False):
+            return None
+        default_size = (
+            config.get("models", {}).get("default_config", {}).get("batch_size", 8)
+        )
+        return cls(
+            initial_size=batching.get("initial_size") or default_size,
+            min_size=batching.get("min_size", 1),
+            max_size=batching.get("max_size", 256),
+            growth=batching.get("growth", 2.0),
+            tolerance=batching.get("tolerance", 0.05),
+            state_path=batching.get("state_path"),
+        )
+
+    def batch_size(self, key: str) -> int:
+        """Current batch size for a model and task key."""
+        return self._state(key).size
+
+    def _state(self, key: str) -> _State:
+        with self._lock:
+            if key not in self._states:
+                self._states[key] = _State(min(self.initial_size, self.max_size))
+            return self._states[key]
+
+    def _limit(self, state: _State) -> int:
+        limit = self.max_size
+        if state.ceiling is not None:
+            limit = min(limit, state.ceiling - 1)
+        return max(self.min_size, limit)
+
+    def _observe(self, state: _State, size: int, seconds: float, pending: int):
+        per_sample = seconds / size
+        with self._lock:
+            previous = state.latency.get(size)
+            state.latency[size] = (
+                per_sample if previous is None else 0.5 * (previous + per_sample)
+            )
+            self._dirty = True
+            if state.converged or size != min(state.size, pending):
+                return
+            smaller = [s for s in state.latency if s < size]
+            if smaller:
+                best_smaller = max(smaller)
+                if state.latency[size] > state.latency[best_smaller] * (
+                    1 - self.tolerance
+                ):
+                    # Growing no longer pays off: settle on the best size seen
+                    state.size = min(state.latency, key=state.latency.get)
+                    state.converged = True
+                    return
+            limit = self._limit(state)
+            if size >= limit:
+                state.converged = True
+            elif size < pending:
+                state.size = min(
+                    limit, max(size + 1, int(math.ceil(size * self.growth)))
+                )
+            else:
+                # Larger batches cannot be filled yet: keep tuning at this size
+                state.size = size
+
+    def _oom(self, state: _State, size: int):
+        with self._lock:
+            state.ceiling = size if state.ceiling is None else min(state.ceiling, size)
+            state.size = max(self.min_size, min(state.size, size // 2))
+            state.latency = {s: v for s, v in state.latency.items() if s < size}
+            self._dirty = True
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def run(
+        self,
+        key: str,
+        images: Sequence,
+        prompts: Sequence[str],
+        call: Callable[[List, List[str]], List],
+    ) -> List:
+        """
+        Run requests through ``call`` in adaptively sized batches.
+
+        Args:
+            key: Model and task the tuned size is stored under
+            images: Images (or embeddings), one per prompt
+            prompts: Prompt texts
+            call: Runs one batch, e.g. ``model.generate_batch`` with bound kwargs
+
+        Returns:
+            Outputs in input order
+        """
+        state = self._state(key)
+        # Similar requests batch together: same image shape, then prompt length
+        order = sorted(
+            range(len(prompts)),
+            key=lambda i: (str(_image_shape(images[i])), len(prompts[i])),
+        )
+        outputs: List[Any] = [None] * len(prompts)
+        position = 0
+        while position < len(order):
+            size = min(state.size, len(order))
+            chunk = order[position : position + size]
+            self._run_chunk(state, chunk, images, prompts, call, outputs, len(order))
+            position += len(chunk)
+        self.save()
+        return outputs
+
+    def _run_chunk(
+        self,
+        state: _State,
+        chunk: List[int],
+        images: Sequence,
+        prompts: Sequence[str],
+        call: Callable,
+        outputs: List,
+        pending: int,
+    ):
+        try:
+            start = time.perf_counter()
+            results = call([images[i] for i in chunk], [prompts[i] for i in chunk])
+            elapsed = time.perf_counter() - start
+        except Exception as error:
+            if not is_oom_error(error) or len(chunk) <= self.min_size:
+                raise
+            profiling.count("batching.oom")
+            self._oom(state, len(chunk))
+            half = max(self.min_size, len(chunk) // 2)
+            for start_index in range(0, len(chunk), half):
+                self._run_chunk(
+                    state,
+                    chunk[start_index : start_index + half],
+                    images,
+                    prompts,
+                    call,
+                    outputs,
+                    pending,
+                )
+            return
+        if len(results) != len(chunk):
+            raise RuntimeError(
+                f"generate_batch returned {len(results)} outputs "
+                f"for {len(chunk)} prompts"
+            )
+        for i, result in zip(chunk, results):
+            outputs[i] = result
+        if len(chunk) == min(state.size, pending):
+            self._observe(state, len(chunk), elapsed, pending)
+
+    def save(self):
+        """Persist the tuned sizes to ``state_path``, if set and changed."""
+        if self.state_path is None or not self._dirty:
+            return
+        with self._lock:
+            data = {key: state.to_dict() for key, state in self._states.items()}
+            self._dirty = False
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_name(self.state_path.name + f".tmp{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.state_path)
@@ -2,12 +2,14 @@
 Main benchmark class for MMCSBench
 """
 
-import yaml
-from typing import Dict, List, Optional, Union
+import contextlib
+import tempfile
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
+from .cache import model_identity
+from .datasets import CamouflageDataset, DatasetRegistry
 from .evaluation import Evaluator
-from .datasets import CamouflageDataset
 from .models import ModelRegistry
 
 
@@ -16,7 +18,7 @@ class MMCSBenchmark:
     Main benchmark class for evaluating Large Vision-Language Models 
     on camouflage scene understanding tasks.
     """
-    
+
     def __init__(self, config: Union[str, Dict], data_dir: Optional[str] = None):
         """
         Initialize the benchmark.
@@ -26,48 +28,342 @@ class MMCSBenchmark:
             data_dir: Path to data directory
         """
         if isinstance(config, str):
+            import yaml
+
             with open(config, 'r') as f:
                 self.config = yaml.safe_load(f)
         else:
             self.config = config
-            
+
         self.data_dir = data_dir or self.config.get('data_dir', 'data/')
+        pool_config = self.config.get("models", {}).get("pool")
+        if pool_config:
+            budget = pool_config.get("memory_budget_gb")
+            ModelRegistry.configure_pool(
+                memory_budget=int(budget * 2**30) if budget else None,
+                max_models=pool_config.get("max_models"),
+            )
         self.evaluator = Evaluator(self.config)
-        self.dataset = CamouflageDataset(self.data_dir)
-        
-    def evaluate(self, model, tasks: Optional[List[str]] = None, split: str = 'test') -> Dict:
+        self.datasets = DatasetRegistry(self.config, self.data_dir)
+
+    @property
+    def dataset(self) -> CamouflageDataset:
+        """Dataset of the test split."""
+        return self.get_dataset("test")
+
+    def get_dataset(self, split: str = "test") -> CamouflageDataset:
+        """
+        Get the dataset of a split.
+
+        Each split is loaded on first use and kept, with its memoized task
+        views, until its annotation file changes.
+
+        Args:
+            split: Data split ('train', 'val', 'test')
+
+        Returns:
+            Dataset of the split
+        """
+        return self.datasets.get(split)
+
+    def evaluate(
+        self,
+        model,
+        tasks: Optional[List[str]] = None,
+        split: str = "test",
+        output_dir: Optional[str] = None,
+        resume: bool = False,
+        shard: Optional[Tuple[int, int]] = None,
+        subset: Optional[Union[int, float]] = None,
+        subset_reference: Optional[Dict] = None,
+    ) -> Dict:
         """
         Evaluate a model on the benchmark tasks.
-        
+
         Args:
             model: Model to evaluate
             tasks: List of tasks to evaluate on. If None, evaluates on all tasks.
             split: Data split to use ('train', 'val', 'test')
-            
+            output_dir: Directory to stream per-sample predictions to, with
+                periodic checkpoints. Predictions are kept in memory if not given.
+            resume: Continue an interrupted run from the checkpoints in ``output_dir``
+            shard: ``(shard_id, num_shards)`` to evaluate one shard of the split.
+                Combine the shards with :func:`mmcsbench.sharding.merge_shards`
+                (``mmcsbench merge``).
+            subset: Evaluate a stratified sample of this many items (or this
+                fraction of the split, if below 1) instead of the whole split,
+                and report how far its metrics can be from the full split's
+                (see :mod:`mmcsbench.subsets`)
+            subset_reference: Full-split results of the same model, to report
+                the actual differences of the subset metrics
+
         Returns:
             Dictionary containing evaluation results
         """
         if tasks is None:
             tasks = ['detection', 'classification', 'reasoning', 'description']
-            
+
+        dataset = self.get_dataset(split)
+        if subset is not None:
+            name = model_identity(model)["name"]
+            reference = {name: subset_reference} if subset_reference else None
+            return self._evaluate_subset(
+                [model], tasks, dataset, subset, output_dir, resume, shard, reference
+            )[name]
+        self._warm_images(dataset, tasks, shard)
+
+        if self.config.get("evaluation", {}).get("fused", True) and len(tasks) > 1:
+            print(f"Evaluating on {', '.join(tasks)} tasks in a single pass...")
+            return self.evaluator.evaluate_tasks(
+                model,
+                tasks,
+                split,
+                dataset=dataset,
+                output_dir=output_dir,
+                resume=resume,
+                shard=shard,
+            )
+
         results = {}
         for task in tasks:
             print(f"Evaluating on {task} task...")
-            task_results = self.evaluator.evaluate_task(model, task, split)
+            task_results = self.evaluator.evaluate_task(
+                model,
+                task,
+                split,
+                dataset=dataset,
+                output_dir=output_dir,
+                resume=resume,
+                shard=shard,
+            )
             results[task] = task_results
-            
+
         return results
-    
-    def generate_report(self, results: Dict, output_dir: str = 'results/'):
+
+    def evaluate_many(
+        self,
+        models: Sequence,
+        tasks: Optional[List[str]] = None,
+        split: str = "test",
+        output_dir: Optional[str] = None,
+        resume: bool = False,
+        shard: Optional[Tuple[int, int]] = None,
+        concurrent: Optional[bool] = None,
+        subset: Optional[Union[int, float]] = None,
+        subset_reference: Optional[Dict[str, Dict]] = None,
+    ) -> Dict[str, Dict]:
+        """
+        Evaluate several models in one pass over the data and rank them.
+
+        Annotations are read and every image is decoded once per batch for
+        all models, instead of once per model and run. Unless a shard is
+        evaluated, a leaderboard is printed and, with ``output_dir``, written
+        to ``leaderboard.json`` and ``leaderboard.md`` (see
+        :mod:`mmcsbench.leaderboard`).
+
+        Args:
+            models: Models to evaluate, with distinct names
+            tasks: List of tasks to evaluate on. If None, evaluates on all tasks.
+            split: Data split to use ('train', 'val', 'test')
+            output_dir: Directory to stream per-sample predictions of every model to
+            resume: Continue an interrupted run from the checkpoints in ``output_dir``
+            shard: ``(shard_id, num_shards)`` to evaluate one shard of the split
+            concurrent: Run the models on each batch in parallel threads.
+                Defaults to ``evaluation.concurrent_models``.
+            subset: Evaluate a stratified sample of the split, see :meth:`evaluate`
+            subset_reference: Full-split results per model name
+
+        Returns:
+            Dictionary containing evaluation results per model name
+        """
+        from .leaderboard import format_leaderboard, leaderboard, write_leaderboard
+
+        if tasks is None:
+            tasks = ["detection", "classification", "reasoning", "description"]
+        dataset = self.get_dataset(split)
+        if subset is not None:
+            results = self._evaluate_subset(
+                models,
+                tasks,
+                dataset,
+                subset,
+                output_dir,
+                resume,
+                shard,
+                subset_reference,
+                concurrent,
+            )
+        else:
+            self._warm_images(dataset, tasks, shard)
+            print(
+                f"Evaluating {len(models)} models on {', '.join(tasks)} tasks "
+                f"in a single pass..."
+            )
+            results = self.evaluator.evaluate_many(
+                models,
+                tasks,
+                split,
+                dataset=dataset,
+                output_dir=output_dir,
+                resume=resume,
+                shard=shard,
+                concurrent=concurrent,
+            )
+        if shard is None:
+            rows = leaderboard(results, self.config)
+            print(format_leaderboard(rows, self.config))
+            if output_dir is not None:
+                write_leaderboard(rows, output_dir, self.config)
+        return results
+
+    def _evaluate_subset(
+        self,
+        models: Sequence,
+        tasks: List[str],
+        dataset: CamouflageDataset,
+        size: Union[int, float],
+        output_dir: Optional[str],
+        resume: bool,
+        shard: Optional[Tuple[int, int]] = None,
+        reference: Optional[Dict[str, Dict]] = None,
+        concurrent: Optional[bool] = None,
+    ) -> Dict[str, Dict]:
+        """
+        Evaluate models on a stratified subset and report the expected error.
+
+        Predictions are streamed to ``{output_dir}/{subset name}`` (a
+        temporary directory if not given), apart from those of full-split
+        runs, so the report can bootstrap over them; with ``output_dir`` the
+        report is also written to ``subset_report.json``.
+
+        Returns:
+            Results per task, per model name
+        """
+        import json
+
+        from .predictions import prediction_path, read_predictions
+        from .subsets import format_subset_report, load_subset, subset_report
+
+        if shard is not None:
+            raise ValueError("A subset evaluation cannot be sharded")
+        if resume and output_dir is None:
+            raise ValueError("resume=True requires an output_dir")
+        evaluation = self.config.get("evaluation", {})
+        sample = load_subset(
+            dataset, size, tasks, seed=evaluation.get("subset_seed", 0)
+        )
+        print(
+            f"Evaluating {', '.join(tasks)} on subset {sample['name']}: "
+            f"{len(sample['indices'])} of {sample['total']} items"
+        )
+        self._warm_images(dataset, tasks, subset=sample["indices"])
+
+        options = evaluation.get("report", {})
+        corpora = {task: self.evaluator.cider_corpus(task, dataset) for task in tasks}
+        with contextlib.ExitStack() as stack:
+            run_dir = (
+                str(Path(output_dir) / sample["name"])
+                if output_dir is not None
+                else stack.enter_context(tempfile.TemporaryDirectory())
+            )
+            results = self.evaluator.evaluate_many(
+                models,
+                tasks,
+                dataset.split,
+                dataset=dataset,
+                output_dir=run_dir,
+                resume=resume,
+                concurrent=concurrent,
+                subset=sample["indices"],
+            )
+            reports = {}
+            keep = set(sample["indices"])
+            for name in results:
+                records = {
+                    task: (
+                        record
+                        for record in read_predictions(
+                            prediction_path(run_dir, name, dataset.split, task)
+                        )
+                        if record["index"] in keep
+                    )
+                    for task in tasks
+                }
+                reports[name] = subset_report(
+                    records,
+                    sample,
+                    self.config,
+                    corpora=corpora,
+                    reference=(reference or {}).get(name),
+                    num_bootstrap=options.get("bootstrap", 1000),
+                    confidence=options.get("confidence", 0.95),
+                    seed=options.get("seed", 0),
+                )
+                print(f"\n[{name}] " + format_subset_report(reports[name]))
+        if output_dir is not None:
+            with open(Path(output_dir) / "subset_report.json", "w") as f:
+                json.dump(reports, f, indent=2, default=float)
+        return results
+
+    def _warm_images(
+        self,
+        dataset: CamouflageDataset,
+        tasks: List[str],
+        shard: Optional[Tuple[int, int]] = None,
+        subset: Optional[Sequence[int]] = None,
+    ):
+        """Decode the images of every evaluated item once, ahead of the tasks."""
+        if dataset.image_cache is None:
+            return
+        indices = set()
+        for task in tasks:
+            indices.update(Evaluator.task_indices(dataset, task, shard, subset))
+        evaluation = self.config.get("evaluation", {})
+        dataset.warm_image_cache(
+            sorted(indices),
+            batch_size=evaluation.get("batch_size", 32),
+            num_workers=evaluation.get("num_workers", 4),
+        )
+
+    def generate_report(
+        self, results: Dict, output_dir: str = "results/", split: str = "test"
+    ):
         """
         Generate a detailed evaluation report.
-        
+
+        Writes the overall results to ``results.json`` and, for the models
+        whose predictions were streamed to ``output_dir``, every metric per
+        category, difficulty and question type with bootstrap confidence
+        intervals to ``slices.json`` and ``report.md`` (see
+        :mod:`mmcsbench.slices`).
+
         Args:
             results: Evaluation results dictionary
             output_dir: Directory to save the report
+            split: Data split the predictions were made on
         """
+        import json
+
+        from .slices import load_predictions, slice_report, write_report
+
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
-        
-        # Generate report logic here
-        print(f"Report generated in {output_dir}")
\ No newline at end of file
+        with open(output_path / "results.json", "w") as f:
+            json.dump(results, f, indent=2, default=float)
+
+        predictions = load_predictions(output_path, split)
+        if not predictions:
+            print(
+                f"Report generated in {output_dir} (no streamed predictions to slice)"
+            )
+            return
+        options = self.config.get("evaluation", {}).get("report", {})
+        report = slice_report(
+            predictions,
+            self.config,
+            num_bootstrap=options.get("bootstrap", 1000),
+            confidence=options.get("confidence", 0.95),
+            seed=options.get("seed", 0),
+        )
+        path = write_report(report, output_path)
+        print(f"Report generated in {output_dir}: {path}")
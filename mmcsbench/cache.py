@@ -0,0 +1,243 @@
+"""
+Persistent prediction cache for MMCSBench
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def model_identity(model) -> Dict[str, Any]:
+    """
+    Describe a model for cache keying.
+
+    Uses the ``name`` and ``config`` attributes set by :func:`load_model`,
+    falling back to the class name and an empty config.
+    """
+    name = getattr(model, "name", None) or type(model).__qualname__
+    config = getattr(model, "config", None) or {}
+    return {"name": name, "config": config}
+
+
+def cache_identity(model) -> Optional[Dict[str, Any]]:
+    """
+    Describe a model for keying cached predictions and embeddings.
+
+    Uses :meth:`BaseModel.cache_identity` if the model defines one, and
+    otherwise the ``name`` and ``config`` attributes set by :func:`load_model`.
+    The class name alone does not tell apart instances with different
+    checkpoints or settings, so a model with neither has no identity.
+
+    Returns:
+        Identity like :func:`model_identity`, or None if the model cannot be cached
+    """
+    hook = getattr(model, "cache_identity", None)
+    identity = hook() if callable(hook) else None
+    name = getattr(model, "name", None)
+    if identity is not None:
+        return {"name": name or type(model).__qualname__, "config": identity}
+    config = getattr(model, "config", None)
+    if name is None or config is None:
+        return None
+    return {"name": name, "config": config}
+
+
+def make_key(
+    identity: Dict[str, Any],
+    prompt: str,
+    kwargs: Dict[str, Any],
+    image_hash: str,
+    view: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Build a content-addressed cache key.
+
+    Args:
+        identity: Model name and config, see :func:`model_identity`
+        prompt: Prompt text
+        kwargs: Generation keyword arguments
+        image_hash: Hash of the image bytes
+        view: Resize and transform applied to the image, see
+            :attr:`CamouflageDataset.image_view`
+
+    Returns:
+        Hex digest identifying the prediction
+    """
+    content = {
+        "model": identity,
+        "prompt": prompt,
+        "kwargs": kwargs,
+        "image": image_hash,
+    }
+    if view is not None:
+        content["view"] = view
+    payload = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+    """
+    On-disk SQLite cache of model predictions with size-based LRU eviction.
+
+    Values are stored as JSON; predictions that cannot be serialized are not
+    cached. The cache is safe to share between threads of one process.
+    """
+
+    def __init__(
+        self, path: str, max_bytes: Optional[int] = None, refresh: bool = False
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite database file
+            max_bytes: Maximum total size of cached values (None for unbounded)
+            refresh: Ignore existing entries on lookup but still store new ones
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed)"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["PredictionCache"]:
+        """
+        Create a cache from the ``cache`` section of a config.
+
+        Returns:
+            Cache instance, or None when caching is disabled or not configured
+        """
+        cache_config = config.get("cache") or {}
+        if not cache_config.get("enabled", False):
+            return None
+        max_size_mb = cache_config.get("max_size_mb")
+        return cls(
+            cache_config.get("path", "cache/predictions.sqlite"),
+            max_bytes=int(max_size_mb * 1024 * 1024) if max_size_mb else None,
+            refresh=cache_config.get("refresh", False),
+        )
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        Look up several keys at once.
+
+        Args:
+            keys: Cache keys
+
+        Returns:
+            Mapping of the keys that were found to their cached values
+        """
+        if self.refresh or not keys:
+            return {}
+        hits = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM predictions WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                hits.update((key, json.loads(value)) for key, value in rows)
+            if hits:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE predictions SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in hits],
+                )
+                self._conn.commit()
+        return hits
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Look up a single key."""
+        return self.get_many([key]).get(key, default)
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]):
+        """
+        Store several predictions in one transaction and evict if over budget.
+
+        Args:
+            items: ``(key, value)`` pairs
+        """
+        now = time.time()
+        rows = []
+        for key, value in items:
+            try:
+                encoded = json.dumps(value)
+            except (TypeError, ValueError):
+                continue
+            rows.append((key, encoded, len(encoded), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO predictions (key, value, size, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def put(self, key: str, value: Any):
+        """Store a single prediction."""
+        self.put_many([(key, value)])
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM predictions"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% of the budget so eviction does not run on every insert
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM predictions ORDER BY accessed ASC"
+        ):
+            victims.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self._conn.executemany("DELETE FROM predictions WHERE key = ?", victims)
+
+    def size_bytes(self) -> int:
+        """Return the total size of cached values."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM predictions"
+            ).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def clear(self):
+        """Remove all cached predictions."""
+        with self._lock:
+            self._conn.execute("DELETE FROM predictions")
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
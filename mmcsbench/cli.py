@@ -0,0 +1,113 @@
+"""
+Command line interface for MMCSBench
+"""
+
+import argparse
+from typing import Any, Dict, List, Optional
+
+from .metrics import build_metric, records_corpus, select_metrics
+from .predictions import read_predictions
+from .sharding import merge_shards
+from .tasks import TASKS
+
+
+def _load_config(path: Optional[str]) -> Dict[str, Any]:
+    if not path:
+        return {}
+    import yaml
+
+    with open(path, "r") as f:
+        return yaml.safe_load(f) or {}
+
+
+def _print_results(results: Dict[str, Dict[str, float]]):
+    print("\nEvaluation Results:")
+    print("=" * 50)
+    for task, metrics in results.items():
+        print(f"\n{task.upper()} Task:")
+        for metric, value in metrics.items():
+            print(f"  {metric}: {value:.4f}")
+
+
+def _merge(args: argparse.Namespace):
+    results = merge_shards(
+        args.output_dir,
+        args.model,
+        args.split,
+        tasks=args.tasks,
+        config=_load_config(args.config),
+    )
+    _print_results(results)
+
+
+def _rescore(args: argparse.Namespace):
+    config = _load_config(args.config)
+    results = {}
+    for path in args.predictions:
+        records = read_predictions(path)
+        first = next(records, None)
+        records.close()
+        if first is None:
+            raise ValueError(f"No committed predictions in {path}")
+        task = first["task"]
+        # Two streaming passes: document frequencies first, then the scores
+        corpus = records_corpus(task, read_predictions(path), config)
+        metric = build_metric(task, config, corpus=corpus).update(
+            read_predictions(path)
+        )
+        results[task] = select_metrics(task, metric.compute(), config)
+    _print_results(results)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="mmcsbench", description="MMCSBench utilities"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser(
+        "merge", help="Merge shard predictions and compute metrics"
+    )
+    merge.add_argument("--model", required=True, help="Name of the evaluated model")
+    merge.add_argument(
+        "--output-dir",
+        default="results/",
+        help="Output directory the shards were written to",
+    )
+    merge.add_argument(
+        "--split",
+        default="test",
+        choices=["train", "val", "test"],
+        help="Data split of the shards",
+    )
+    merge.add_argument(
+        "--tasks",
+        nargs="+",
+        choices=list(TASKS),
+        help="Tasks to merge (default: every sharded task)",
+    )
+    merge.add_argument(
+        "--config", default=None, help="Configuration file used for the run"
+    )
+    merge.set_defaults(func=_merge)
+
+    rescore = commands.add_parser(
+        "rescore", help="Recompute metrics from saved predictions"
+    )
+    rescore.add_argument(
+        "predictions",
+        nargs="+",
+        help="Prediction JSONL files, "
+        "e.g. results/predictions/<model>/test/reasoning.jsonl",
+    )
+    rescore.add_argument(
+        "--config", default=None, help="Configuration file used for the run"
+    )
+    rescore.set_defaults(func=_rescore)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
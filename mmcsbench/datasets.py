@@ -2,58 +2,223 @@
 Dataset classes for MMCSBench
 """
 
+import hashlib
+import io
 import json
 import os
-from typing import Dict, List, Tuple, Optional
+import threading
+import warnings
+from collections import deque
+from collections.abc import Sequence as SequenceABC
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 try:
     from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import numpy as np
     import torch
-    from torch.utils.data import Dataset
+    from torch.utils.data import DataLoader, Dataset
 except ImportError:
     # Make imports optional for basic functionality
-    Image = None
     torch = None
+    DataLoader = None
     Dataset = object
 
+from . import profiling
+from .images import ImageCache, decode_image, parse_image_size
+
+try:
+    from .annotation_store import AnnotationStore
+    from .packed import PackedSplit
+except ImportError:
+    # The indexed annotation store and packed splits need numpy
+    AnnotationStore = None
+    PackedSplit = None
+
 
 class CamouflageDataset(Dataset):
     """
     Main dataset class for MMCSBench camouflage scenes.
     """
-    
-    def __init__(self, data_dir: str, split: str = 'train', transform=None):
+
+    def __init__(
+        self,
+        data_dir: str,
+        split: str = "train",
+        transform=None,
+        use_store: bool = True,
+        image_size: Optional[Union[int, Sequence[int]]] = None,
+        image_cache: Optional[Union[bool, str]] = None,
+        packed: Optional[Union[bool, str]] = None,
+    ):
         """
         Initialize the dataset.
-        
+
         Args:
             data_dir: Path to dataset directory
             split: Data split ('train', 'val', 'test')
             transform: Optional image transformations
+            use_store: Read annotations through the memory-mapped
+                :class:`AnnotationStore`, converting the JSON file on first use
+            image_size: ``[height, width]`` to decode images to. Images are
+                kept at full resolution if None.
+            image_cache: Keep resized images in a memory-mapped
+                :class:`ImageCache`. True puts it under ``{data_dir}/cache``,
+                a string names the directory. Requires ``image_size``.
+            packed: Read images and annotations from a :class:`PackedSplit`
+                written by ``scripts/pack_dataset.py``. True uses
+                ``{data_dir}/packed/{split}`` if it exists, a string names the
+                pack directory.
         """
         self.data_dir = Path(data_dir)
         self.split = split
         self.transform = transform
-        
+        self.use_store = use_store and AnnotationStore is not None
+        self.image_size = parse_image_size(image_size)
+        self.pack = self._open_pack(packed)
+
         # Load annotations
         self.annotations = self._load_annotations()
         self.images_dir = self.data_dir / 'images' / split
-        
-    def _load_annotations(self) -> List[Dict]:
-        """Load dataset annotations."""
+        self._image_hashes: Dict[int, str] = {}
+        self._image_sizes: Dict[int, Optional[Tuple[int, int]]] = {}
+        self._task_views: Dict[str, "TaskView"] = {}
+        self.image_cache = self._open_image_cache(image_cache)
+
+    @classmethod
+    def from_config(
+        cls,
+        config: Dict[str, Any],
+        split: str = "test",
+        data_dir: Optional[str] = None,
+        **kwargs,
+    ) -> "CamouflageDataset":
+        """
+        Create a dataset from the ``data_dir`` and ``dataset`` sections of a config.
+
+        Args:
+            config: Benchmark configuration
+            split: Data split
+            data_dir: Overrides the configured data directory
+            **kwargs: Further constructor arguments
+
+        Returns:
+            Dataset for the split
+        """
+        dataset_config = config.get("dataset", {})
+        kwargs.setdefault("image_size", dataset_config.get("image_size"))
+        kwargs.setdefault("image_cache", dataset_config.get("image_cache"))
+        kwargs.setdefault("packed", dataset_config.get("packed"))
+        return cls(data_dir or config.get("data_dir", "data/"), split=split, **kwargs)
+
+    def _open_pack(self, packed: Optional[Union[bool, str]]) -> Optional["PackedSplit"]:
+        """Open the packed split, if enabled, present and as new as the annotations."""
+        if not packed or PackedSplit is None:
+            return None
+        if isinstance(packed, bool):
+            pack_dir = self.data_dir / "packed" / self.split
+            if not (pack_dir / "meta.json").exists():
+                return None
+        else:
+            pack_dir = Path(packed)
+        pack = PackedSplit(pack_dir)
         annotation_file = self.data_dir / 'annotations' / f'{self.split}.json'
         if annotation_file.exists():
-            with open(annotation_file, 'r') as f:
-                return json.load(f)
+            stat = annotation_file.stat()
+            if pack.source != {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}:
+                warnings.warn(
+                    f"Ignoring stale pack {pack_dir}: {annotation_file} has changed"
+                )
+                return None
+        return pack
+
+    def _source_signature(self) -> Dict[str, Any]:
+        """
+        Size and mtime of the split's annotations, as recorded in the pack if
+        packed, and a digest of its images: the packed content hashes, or the
+        size and mtime of every image file, so replaced images are noticed.
+        """
+        digest = hashlib.sha256()
+        if self.pack is not None:
+            digest.update(np.ascontiguousarray(self.pack.index["sha256"]).tobytes())
+            return {**self.pack.source, "images": digest.hexdigest()}
+        stat = (self.data_dir / "annotations" / f"{self.split}.json").stat()
+        for idx in range(len(self.annotations)):
+            image_file = self.annotations[idx].get("image_file", "")
+            try:
+                image_stat = (
+                    os.stat(self.images_dir / image_file) if image_file else None
+                )
+            except OSError:
+                image_stat = None
+            entry = (
+                "missing"
+                if image_stat is None
+                else f"{image_stat.st_size}:{image_stat.st_mtime_ns}"
+            )
+            digest.update(f"{image_file}\0{entry}\n".encode("utf-8"))
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "images": digest.hexdigest(),
+        }
+
+    def _open_image_cache(
+        self, image_cache: Optional[Union[bool, str]]
+    ) -> Optional[ImageCache]:
+        """Open the resized-image cache of the split, if enabled."""
+        if not image_cache or self.image_size is None or not len(self.annotations):
+            return None
+        if isinstance(image_cache, bool):
+            cache_dir = self.data_dir / "cache"
         else:
+            cache_dir = Path(image_cache)
+        height, width = self.image_size
+        try:
+            return ImageCache(
+                cache_dir / f"{self.split}-{height}x{width}",
+                len(self.annotations),
+                self.image_size,
+                source=self._source_signature(),
+            )
+        except (ImportError, OSError) as e:
+            warnings.warn(f"Could not open image cache in {cache_dir}: {e}")
+            return None
+
+    def _load_annotations(self) -> Sequence[Dict]:
+        """Load dataset annotations."""
+        if self.pack is not None:
+            self.use_store = True
+            return self.pack.annotations
+        annotation_file = self.data_dir / "annotations" / f"{self.split}.json"
+        if not annotation_file.exists():
             # Return empty list if annotation file doesn't exist
+            self.use_store = False
             return []
-    
+        if self.use_store:
+            try:
+                return AnnotationStore.open(annotation_file)
+            except OSError as e:
+                # Read-only data directory: fall back to the JSON file
+                warnings.warn(
+                    f"Could not build annotation store for {annotation_file}: {e}"
+                )
+                self.use_store = False
+        with open(annotation_file, "r") as f:
+            annotations = json.load(f)
+        if isinstance(annotations, dict):
+            annotations = annotations.get("annotations", [])
+        return annotations
+
     def __len__(self) -> int:
         """Return dataset size."""
         return len(self.annotations)
-    
+
     def __getitem__(self, idx: int) -> Dict:
         """
         Get a dataset item.
@@ -75,40 +240,437 @@ class CamouflageDataset(Dataset):
                 'image_id': f'dummy_{idx}',
                 'annotations': {}
             }
-            
+
         annotation = self.annotations[idx]
-        
+
         # Load image
-        image_path = self.images_dir / annotation['image_file']
-        if image_path.exists() and Image:
-            image = Image.open(image_path).convert('RGB')
-            if self.transform:
-                image = self.transform(image)
+        source = self._image_source(idx) if self.image_size is None and Image else None
+        if self.image_size is not None:
+            with profiling.timer("dataset.load"):
+                image = self._to_image(self.load_image(idx))
+        elif source is not None:
+            with profiling.timer("dataset.load"):
+                with profiling.timer("dataset.decode"):
+                    image = Image.open(source).convert("RGB")
+                if self.transform:
+                    with profiling.timer("dataset.transform"):
+                        image = self.transform(image)
         else:
             # Return dummy image if file doesn't exist or PIL not available
             if torch:
                 image = torch.zeros(3, 224, 224)
             else:
                 image = None
-        
+
         return {
             'image': image,
             'image_id': annotation.get('image_id', f'item_{idx}'),
             'annotations': annotation
         }
-    
-    def get_task_data(self, task: str) -> List[Dict]:
+
+    def load_image(self, idx: int, out=None):
+        """
+        Load an item's image resized to ``image_size``, decoding it at most once
+        when the image cache is enabled.
+
+        Args:
+            idx: Item index
+            out: ``(H, W, 3)`` uint8 array to load the pixels into, e.g. a
+                :class:`~mmcsbench.shared_images.SharedImageRing` slot
+
+        Returns:
+            ``(H, W, 3)`` uint8 array (``out`` if given), or None if the image
+            file is missing
+        """
+        if self.image_cache is not None:
+            cached = self.image_cache.get(idx)
+            if cached is not None:
+                profiling.count("image_cache.hit")
+                if out is not None:
+                    out[...] = cached
+                    return out
+                return cached
+            profiling.count("image_cache.miss")
+        source = self._image_source(idx) if Image is not None else None
+        if source is None:
+            return None
+        with profiling.timer("dataset.decode"):
+            if out is None:
+                image = decode_image(source, self.image_size)
+            else:
+                image = decode_image(source, self.image_size, out=out)
+        if self.image_cache is not None:
+            self.image_cache.put(idx, image)
+        return image
+
+    def _image_source(self, idx: int) -> Optional[Union[Path, io.BytesIO]]:
+        """Image file of an item, or its bytes read from the pack; None if missing."""
+        if self.pack is not None:
+            data = self.pack.read(idx)
+            return io.BytesIO(data) if data is not None else None
+        image_path = self.images_dir / self.annotations[idx].get("image_file", "")
+        return image_path if image_path.is_file() else None
+
+    def _to_image(self, array):
+        """Convert a decoded array into the image returned by ``__getitem__``."""
+        if array is None:
+            return torch.zeros(3, *(self.image_size or (224, 224))) if torch else None
+        if self.transform:
+            with profiling.timer("dataset.transform"):
+                return self.transform(Image.fromarray(array))
+        if torch:
+            return torch.from_numpy(np.ascontiguousarray(array.transpose(2, 0, 1)))
+        return array
+
+    def image_loader(
+        self,
+        indices: Optional[Sequence[int]] = None,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        pin_memory: Optional[bool] = None,
+    ):
+        """
+        DataLoader decoding resized images in worker processes.
+
+        Workers fill the shared image cache as they go, so a later pass over
+        the split reads the memory-mapped pixels instead of decoding again.
+
+        Args:
+            indices: Item indices to load. Defaults to the whole split.
+            batch_size: Images per batch
+            num_workers: Decoding worker processes
+            pin_memory: Return batches in pinned memory. Defaults to whether CUDA
+                is available.
+
+        Returns:
+            DataLoader yielding ``{'index': (B,) int64, 'image': (B, 3, H, W) uint8}``
+        """
+        if DataLoader is None:
+            raise ImportError("image_loader requires torch")
+        if self.image_size is None:
+            raise ValueError("image_loader requires an image_size")
+        if indices is None:
+            indices = range(len(self))
+        if pin_memory is None:
+            pin_memory = torch.cuda.is_available()
+        return DataLoader(
+            _ImageItems(self, list(indices)),
+            batch_size=batch_size,
+            num_workers=num_workers,
+            pin_memory=pin_memory,
+            collate_fn=_collate_images,
+        )
+
+    def warm_image_cache(
+        self,
+        indices: Optional[Sequence[int]] = None,
+        batch_size: int = 32,
+        num_workers: int = 0,
+    ) -> int:
+        """
+        Decode every image that is not in the image cache yet.
+
+        Uses :meth:`image_loader` worker processes when torch is available and
+        ``num_workers > 0``, otherwise a thread pool.
+
+        Args:
+            indices: Item indices to decode. Defaults to the whole split.
+            batch_size: Images per DataLoader batch
+            num_workers: Decoding workers
+
+        Returns:
+            Number of images decoded
+        """
+        if self.image_cache is None:
+            return 0
+        missing = self.image_cache.missing(indices)
+        if not missing:
+            return 0
+        with profiling.timer("dataset.warm_cache", images=len(missing)):
+            self._decode_missing(missing, batch_size, num_workers)
+        return len(missing)
+
+    def _decode_missing(self, missing: List[int], batch_size: int, num_workers: int):
+        """Decode images into the cache with DataLoader workers or a thread pool."""
+        if DataLoader is not None and num_workers > 0:
+            for _ in self.image_loader(
+                missing, batch_size, num_workers, pin_memory=False
+            ):
+                pass
+        elif self.pack is not None:
+            # Stream the shards sequentially, with a bounded number of decodes in flight
+            def decode(idx: int, data: Optional[bytes]):
+                if data is not None:
+                    with profiling.timer("dataset.decode"):
+                        self.image_cache.put(
+                            idx, decode_image(io.BytesIO(data), self.image_size)
+                        )
+
+            workers = max(1, num_workers)
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="mmcsbench-decode"
+            ) as pool:
+                pending = deque()
+                for idx, data in self.pack.iter_images(missing):
+                    pending.append(pool.submit(decode, idx, data))
+                    if len(pending) >= 2 * workers:
+                        pending.popleft().result()
+                for future in pending:
+                    future.result()
+        else:
+            with ThreadPoolExecutor(
+                max_workers=max(1, num_workers), thread_name_prefix="mmcsbench-decode"
+            ) as pool:
+                for _ in pool.map(self.load_image, missing):
+                    pass
+        self.image_cache.flush()
+
+    def get_annotation(self, idx: int) -> Dict:
+        """
+        Get the annotation of an item without loading its image.
+
+        Args:
+            idx: Item index
+
+        Returns:
+            Annotation dictionary
+        """
+        return self.annotations[idx]
+
+    def get_image_hash(self, idx: int) -> str:
+        """
+        Get a content hash of an item's image file.
+
+        Args:
+            idx: Item index
+
+        Returns:
+            SHA-256 hex digest of the image bytes, or of the file name if the
+            image is missing
+        """
+        if self.pack is not None:
+            return self.pack.image_hash(idx)
+        if idx not in self._image_hashes:
+            image_file = self.annotations[idx].get("image_file", "")
+            image_path = self.images_dir / image_file
+            digest = hashlib.sha256()
+            if image_file and image_path.is_file():
+                with open(image_path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+            else:
+                digest.update(f"missing:{self.split}/{image_file}".encode("utf-8"))
+            self._image_hashes[idx] = digest.hexdigest()
+        return self._image_hashes[idx]
+
+    def get_image_size(self, idx: int) -> Optional[Tuple[int, int]]:
+        """
+        Get the full-resolution size of an item's image.
+
+        Read from the annotation's ``width`` and ``height`` when present,
+        otherwise from the image header without decoding the pixels.
+
+        Args:
+            idx: Item index
+
+        Returns:
+            ``(width, height)``, or None if the image is missing
+        """
+        annotation = self.annotations[idx]
+        if annotation.get("width") and annotation.get("height"):
+            return int(annotation["width"]), int(annotation["height"])
+        if idx not in self._image_sizes:
+            source = self._image_source(idx) if Image is not None else None
+            size = None
+            if source is not None:
+                with Image.open(source) as image:
+                    size = image.size
+            self._image_sizes[idx] = size
+        return self._image_sizes[idx]
+
+    @property
+    def image_view(self) -> Optional[Dict[str, Any]]:
+        """
+        How images are presented to models: the ``image_size`` they are
+        resized to and the transform applied. Part of prediction and
+        embedding cache keys; None for untransformed full-resolution images.
+        """
+        if self.image_size is None and self.transform is None:
+            return None
+        return {
+            "size": list(self.image_size) if self.image_size else None,
+            "transform": repr(self.transform) if self.transform is not None else None,
+        }
+
+    def get_task_indices(self, task: str) -> List[int]:
+        """
+        Get dataset indices of items annotated for a specific task.
+
+        Args:
+            task: Task name ('detection', 'classification', 'reasoning', 'description')
+
+        Returns:
+            List of dataset indices
+        """
+        if self.use_store:
+            return self.annotations.task_indices(task).tolist()
+        return [
+            idx
+            for idx, annotation in enumerate(self.annotations)
+            if task in annotation.get("tasks", {})
+        ]
+
+    def get_indices(
+        self,
+        task: Optional[str] = None,
+        category: Optional[Any] = None,
+        difficulty: Optional[Any] = None,
+    ) -> List[int]:
+        """
+        Get dataset indices matching a task, category and difficulty.
+
+        Args:
+            task: Task name, or None for any task
+            category: Camouflage category, or None for any category
+            difficulty: Difficulty level, or None for any difficulty
+
+        Returns:
+            Sorted list of dataset indices
+        """
+        if self.use_store:
+            return self.annotations.select(task, category, difficulty).tolist()
+        return [
+            idx
+            for idx, annotation in enumerate(self.annotations)
+            if (task is None or task in annotation.get("tasks", {}))
+            and (category is None or annotation.get("category") == category)
+            and (difficulty is None or annotation.get("difficulty") == difficulty)
+        ]
+
+    def get_task_data(self, task: str) -> "TaskView":
         """
         Get data for a specific task.
-        
+
+        The view is built once per task and holds only the item indices;
+        annotations are read from the dataset when accessed.
+
         Args:
             task: Task name ('detection', 'classification', 'reasoning', 'description')
-            
+
         Returns:
-            List of task-specific data items
+            Read-only sequence of task-specific data items
+        """
+        view = self._task_views.get(task)
+        if view is None:
+            if self.use_store:
+                indices = self.annotations.task_indices(task)
+            else:
+                indices = self.get_task_indices(task)
+            view = self._task_views[task] = TaskView(self, task, indices)
+        return view
+
+
+class TaskView(SequenceABC):
+    """Task annotations of the dataset items selected by an index array."""
+
+    def __init__(self, dataset: CamouflageDataset, task: str, indices: Sequence[int]):
+        self.dataset = dataset
+        self.task = task
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return TaskView(self.dataset, self.task, self.indices[i])
+        return self.dataset.annotations[int(self.indices[i])]["tasks"][self.task]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (SequenceABC, list)) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+
+def _annotation_signature(
+    data_dir: Union[str, Path], split: str
+) -> Optional[Tuple[int, int]]:
+    """Size and mtime of a split's annotation file, or None if it does not exist."""
+    try:
+        stat = (Path(data_dir) / "annotations" / f"{split}.json").stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class DatasetRegistry:
+    """
+    One :class:`CamouflageDataset` per split, loaded on first use.
+
+    A split is reloaded, dropping its memoized task views, when the size or
+    mtime of its annotation file changes.
+    """
+
+    def __init__(self, config: Dict[str, Any], data_dir: Optional[str] = None):
+        """
+        Args:
+            config: Benchmark configuration, see :meth:`CamouflageDataset.from_config`
+            data_dir: Overrides the configured data directory
         """
-        task_data = []
-        for annotation in self.annotations:
-            if task in annotation.get('tasks', {}):
-                task_data.append(annotation['tasks'][task])
-        return task_data
\ No newline at end of file
+        self.config = config
+        self.data_dir = data_dir or config.get("data_dir", "data/")
+        self._datasets: Dict[
+            str, Tuple[Optional[Tuple[int, int]], CamouflageDataset]
+        ] = {}
+        self._lock = threading.Lock()
+
+    def get(self, split: str) -> CamouflageDataset:
+        """Dataset of a split, (re)loaded if its annotations are new or have changed."""
+        signature = _annotation_signature(self.data_dir, split)
+        with self._lock:
+            loaded = self._datasets.get(split)
+            if loaded is None or loaded[0] != signature:
+                dataset = CamouflageDataset.from_config(
+                    self.config, split=split, data_dir=self.data_dir
+                )
+                loaded = self._datasets[split] = (signature, dataset)
+            return loaded[1]
+
+    def __contains__(self, split: str) -> bool:
+        return split in self._datasets
+
+    def clear(self):
+        """Drop every loaded split."""
+        with self._lock:
+            self._datasets.clear()
+
+
+class _ImageItems(Dataset):
+    """Resized images of a subset of a :class:`CamouflageDataset`, for DataLoaders."""
+
+    def __init__(self, dataset: CamouflageDataset, indices: List[int]):
+        self.dataset = dataset
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, i: int) -> Tuple[int, Any]:
+        idx = self.indices[i]
+        image = self.dataset.load_image(idx)
+        if image is None:
+            image = np.zeros((*self.dataset.image_size, 3), dtype=np.uint8)
+        return idx, image
+
+
+def _collate_images(items: List[Tuple[int, Any]]) -> Dict[str, Any]:
+    indices, images = zip(*items)
+    batch = torch.empty((len(images), *images[0].shape), dtype=torch.uint8)
+    for row, image in zip(batch.numpy(), images):
+        row[...] = image
+    return {
+        "index": torch.as_tensor(indices, dtype=torch.int64),
+        "image": batch.permute(0, 3, 1, 2),
+    }
@@ -0,0 +1,654 @@
+"""
+Parallel, verified, resumable dataset download for MMCSBench
+
+The dataset is published as a manifest listing its files with their size and
+SHA-256::
+
+    {
+        "version": 1,
+        "base_url": "https://example.org/mmcsbench/v1/",
+        "files": [
+            {"path": "annotations/test.json", "size": 1234, "sha256": "..."},
+            {"path": "archives/test-00000.tar", "size": 1073741824, "sha256": "...",
+             "extract": "images/test"}
+        ]
+    }
+
+:class:`Downloader` splits every file into ranges of ``chunk_size`` bytes and
+fetches all ranges of all files through one pool of worker threads, each
+keeping persistent HTTP connections, so a fast link is filled by many
+concurrent streams. Ranges are written in place into a preallocated
+``.part`` file, and the completed ranges are recorded next to it, so an
+interrupted download resumes with only the missing ranges. Finished files
+are hashed in a separate pool while other files are still downloading, and
+verified archives (tar, optionally compressed, or zip) are extracted as soon
+as they are verified. Archives that are removed after extraction leave an
+``.extracted`` marker, so a rerun skips them.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+MANIFEST_VERSION = 1
+
+#: Bytes read from a response (and hashed) at a time
+BLOCK_SIZE = 1 << 20
+
+
+class _RangeIgnored(Exception):
+    """A server ignored Range while another worker already streams the whole file."""
+
+
+class DownloadError(RuntimeError):
+    """A file could not be downloaded or failed verification."""
+
+
+def load_manifest(source: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Load a dataset manifest from a URL or a local file.
+
+    Args:
+        source: ``http(s)://`` URL or path of the manifest JSON
+
+    Returns:
+        ``(manifest, base URL)``. File paths are resolved against the
+        manifest's ``base_url``, or else the URL of the manifest; local
+        manifests need a ``base_url``.
+    """
+    if urlsplit(source).scheme in ("http", "https"):
+        pool = _ConnectionPool(timeout=60)
+        try:
+            data = pool.get(source)
+        finally:
+            pool.close()
+        manifest = json.loads(data)
+        default_base = source
+    else:
+        with open(source, "r") as f:
+            manifest = json.load(f)
+        default_base = None
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+    base_url = manifest.get("base_url") or default_base
+    if base_url is None:
+        raise ValueError(f"Manifest {source} has no base_url")
+    return manifest, base_url
+
+
+def sha256_file(path: Union[str, Path]) -> str:
+    """SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(8 * BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path: Path, data: Dict[str, Any]):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _safe_target(root: Path, name: str) -> Optional[Path]:
+    """Destination of an archive member, or None if it would escape ``root``."""
+    parts = PurePosixPath(name).parts
+    if not parts or PurePosixPath(name).is_absolute() or ".." in parts:
+        return None
+    return root.joinpath(*parts)
+
+
+class _ConnectionPool:
+    """Persistent HTTP(S) connections, one per thread and host."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: List[http.client.HTTPConnection] = []
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = (scheme, netloc)
+        if key not in connections:
+            cls = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connections[key] = cls(netloc, timeout=self.timeout)
+            with self._lock:
+                self._all.append(connections[key])
+        return connections[key]
+
+    def _drop(self, scheme: str, netloc: str):
+        connection = self._local.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def request(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        stream: Optional[Callable[[http.client.HTTPResponse], Any]] = None,
+    ) -> Any:
+        """
+        GET a URL, following redirects.
+
+        Args:
+            url: ``http(s)://`` URL
+            headers: Request headers
+            stream: Consumes the response; the body is returned if not given
+
+        Returns:
+            ``(status, result of stream or body)``
+        """
+        for _ in range(5):
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            connection = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path, headers=headers or {})
+                response = connection.getresponse()
+                if response.status in (301, 302, 303, 307, 308):
+                    response.read()
+                    url = urljoin(url, response.getheader("Location"))
+                    continue
+                if response.status >= 400:
+                    response.read()
+                    return response.status, None
+                return response.status, stream(response) if stream else response.read()
+            except BaseException:
+                # The response may be partly read: the connection cannot be reused
+                self._drop(parts.scheme, parts.netloc)
+                raise
+        raise DownloadError(f"Too many redirects for {url}")
+
+    def get(self, url: str) -> bytes:
+        status, body = self.request(url)
+        if status >= 400:
+            raise DownloadError(f"GET {url} failed with HTTP {status}")
+        return body
+
+    def close(self):
+        with self._lock:
+            for connection in self._all:
+                connection.close()
+            self._all = []
+
+
+class _FileState:
+    """Download progress of one manifest file."""
+
+    def __init__(self, entry: Dict[str, Any], url: str, target: Path, chunk_size: int):
+        self.entry = entry
+        self.url = url
+        self.target = target
+        self.size = int(entry["size"])
+        self.part = target.with_name(target.name + ".part")
+        self.progress_file = target.with_name(target.name + ".part.json")
+        self.chunk_size = chunk_size
+        self.num_chunks = max(1, -(-self.size // chunk_size))
+        self.done: set = set()
+        # Set by the worker that received the whole file from a server ignoring Range
+        self.whole = False
+        self.streamer: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def chunk(self, index: int) -> Tuple[int, int]:
+        start = index * self.chunk_size
+        return start, min(self.size, start + self.chunk_size)
+
+    def resume(self, restart: bool = False) -> List[int]:
+        """Prepare the ``.part`` file and return the chunks still to fetch."""
+        signature = {
+            "size": self.size,
+            "sha256": self.entry.get("sha256"),
+            "chunk_size": self.chunk_size,
+        }
+        if not restart and self.part.exists() and self.progress_file.exists():
+            try:
+                with open(self.progress_file, "r") as f:
+                    progress = json.load(f)
+                if (
+                    progress.get("signature") == signature
+                    and self.part.stat().st_size == self.size
+                ):
+                    self.done = set(progress.get("done", []))
+            except (OSError, ValueError):
+                self.done = set()
+        if not self.done:
+            self.target.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.part, "wb") as f:
+                f.truncate(self.size)
+        self._signature = signature
+        self.save()
+        return [i for i in range(self.num_chunks) if i not in self.done]
+
+    def save(self):
+        _write_json(
+            self.progress_file,
+            {"signature": self._signature, "done": sorted(self.done)},
+        )
+
+
+class _FetchRun:
+    """Futures of one :meth:`Downloader.fetch` call and what follows when each ends."""
+
+    def __init__(
+        self,
+        downloader: "Downloader",
+        extract: bool,
+        keep_archives: bool,
+        total: int,
+        force: bool = False,
+    ):
+        self.downloader = downloader
+        self.extract = extract
+        self.keep_archives = keep_archives
+        self.force = force
+        self.total = total
+        self.fetched = 0
+        self.summary: Dict[str, Any] = {
+            "downloaded": [],
+            "skipped": [],
+            "extracted": [],
+            "bytes": 0,
+        }
+        self.io_pool = ThreadPoolExecutor(
+            downloader.num_workers, thread_name_prefix="mmcsbench-download"
+        )
+        self.cpu_pool = ThreadPoolExecutor(
+            downloader.verify_workers, thread_name_prefix="mmcsbench-verify"
+        )
+        self.pending: Dict[Future, Tuple[str, _FileState, Optional[int]]] = {}
+        self.remaining: Dict[str, int] = {}
+
+    def submit(
+        self,
+        kind: str,
+        state: _FileState,
+        pool: ThreadPoolExecutor,
+        fn,
+        *args,
+        index: Optional[int] = None,
+    ):
+        self.pending[pool.submit(fn, *args)] = (kind, state, index)
+
+    def start_download(self, state: _FileState):
+        chunks = state.resume(restart=self.force)
+        self.fetched += sum(state.chunk(i)[1] - state.chunk(i)[0] for i in state.done)
+        self.remaining[state.entry["path"]] = len(chunks)
+        if not chunks:
+            self.submit(
+                "verify",
+                state,
+                self.cpu_pool,
+                self.downloader._verify,
+                state.part,
+                state,
+            )
+        for index in chunks:
+            self.submit(
+                "chunk",
+                state,
+                self.io_pool,
+                self.downloader._fetch_chunk,
+                state,
+                index,
+                index=index,
+            )
+
+    def wait(self):
+        while self.pending:
+            finished, _ = wait(list(self.pending), return_when=FIRST_COMPLETED)
+            error = None
+            for future in finished:
+                if future not in self.pending:  # dropped by an earlier handler
+                    continue
+                kind, state, index = self.pending.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                # Record the rest of the batch first, so a resumed run skips it
+                getattr(self, f"_on_{kind}")(state, future.result(), index)
+            if error is not None:
+                raise error
+
+    def _on_chunk(self, state: _FileState, written: Optional[int], index: int):
+        path = state.entry["path"]
+        if state.whole and written == 0:
+            return
+        if written is None:
+            # No range support: the whole file came in one response
+            for future in [
+                f
+                for f, (kind, s, _) in self.pending.items()
+                if s is state and kind == "chunk"
+            ]:
+                future.cancel()
+                del self.pending[future]
+            written = state.size - sum(
+                state.chunk(i)[1] - state.chunk(i)[0] for i in state.done
+            )
+            state.done = set(range(state.num_chunks))
+            self.remaining[path] = 0
+        else:
+            state.done.add(index)
+            self.remaining[path] -= 1
+        state.save()
+        self.fetched += written
+        self.summary["bytes"] += written
+        if self.downloader.progress:
+            self.downloader.progress(self.fetched, self.total)
+        if self.remaining[path] == 0:
+            self.submit(
+                "verify",
+                state,
+                self.cpu_pool,
+                self.downloader._verify,
+                state.part,
+                state,
+            )
+
+    def _on_existing(self, state: _FileState, valid: bool, _):
+        if not valid:
+            self.start_download(state)
+            return
+        self.summary["skipped"].append(state.entry["path"])
+        self.fetched += state.size
+        self._maybe_extract(state)
+
+    def _on_verify(self, state: _FileState, valid: bool, _):
+        if not valid:
+            for stale in (state.part, state.progress_file):
+                if stale.exists():
+                    stale.unlink()
+            raise DownloadError(
+                f"Checksum mismatch for {state.entry['path']}; the partial "
+                f"download was removed, run again to retry"
+            )
+        os.replace(state.part, state.target)
+        state.progress_file.unlink()
+        self.summary["downloaded"].append(state.entry["path"])
+        self._maybe_extract(state)
+
+    def _on_extract(self, state: _FileState, result, _):
+        self.summary["extracted"].append(state.entry["path"])
+
+    def _maybe_extract(self, state: _FileState):
+        if self.extract and state.entry.get("extract"):
+            self.submit(
+                "extract",
+                state,
+                self.cpu_pool,
+                self.downloader._extract,
+                state,
+                self.keep_archives,
+            )
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.io_pool.shutdown(wait=True)
+        self.cpu_pool.shutdown(wait=True)
+
+
+class Downloader:
+    """
+    Fetches the files of a manifest into a data directory.
+
+    Args:
+        data_dir: Directory the manifest paths are relative to
+        num_workers: Concurrent range requests
+        chunk_size: Bytes per range request
+        verify_workers: Threads hashing finished files
+        max_retries: Retries of a failed range request
+        retry_backoff: Seconds before the first retry, doubled for each further one
+        timeout: Socket timeout in seconds
+        progress: Called with ``(bytes downloaded, bytes to download)`` after
+            every range
+    """
+
+    def __init__(
+        self,
+        data_dir: Union[str, Path],
+        num_workers: int = 16,
+        chunk_size: int = 32 << 20,
+        verify_workers: Optional[int] = None,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        timeout: float = 60.0,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.data_dir = Path(data_dir)
+        self.num_workers = max(1, num_workers)
+        self.chunk_size = max(BLOCK_SIZE, int(chunk_size))
+        self.verify_workers = verify_workers or min(8, os.cpu_count() or 1)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.progress = progress
+        self._pool = _ConnectionPool(timeout)
+
+    def fetch(
+        self,
+        manifest: Dict[str, Any],
+        base_url: str,
+        extract: bool = True,
+        keep_archives: bool = True,
+        force: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Download, verify and extract every file of a manifest.
+
+        Files already present with the right checksum are skipped, partial
+        downloads are resumed.
+
+        Args:
+            manifest: Manifest, see :func:`load_manifest`
+            base_url: URL the manifest paths are relative to
+            extract: Extract archives with an ``extract`` destination
+            keep_archives: Keep archives after extracting them
+            force: Download every file again, ignoring present files,
+                extracted archives and partial downloads
+
+        Returns:
+            Summary with ``downloaded``, ``skipped`` and ``extracted`` paths,
+            ``bytes`` downloaded and ``seconds``
+        """
+        entries = manifest.get("files", [])
+        for entry in entries:
+            if _safe_target(self.data_dir, entry["path"]) is None:
+                raise DownloadError(f"Unsafe path in manifest: {entry['path']}")
+        if not base_url.endswith("/"):
+            base_url += "/"
+        start = time.perf_counter()
+        run = _FetchRun(
+            self,
+            extract,
+            keep_archives,
+            sum(int(e["size"]) for e in entries),
+            force=force,
+        )
+        try:
+            for entry in entries:
+                state = _FileState(
+                    entry,
+                    urljoin(base_url, entry["path"]),
+                    _safe_target(self.data_dir, entry["path"]),
+                    self.chunk_size,
+                )
+                if force:
+                    run.start_download(state)
+                elif self._extracted(state):
+                    run.summary["skipped"].append(entry["path"])
+                    run.total -= state.size
+                elif (
+                    state.target.exists() and state.target.stat().st_size == state.size
+                ):
+                    run.submit(
+                        "existing",
+                        state,
+                        run.cpu_pool,
+                        self._verify,
+                        state.target,
+                        state,
+                    )
+                else:
+                    run.start_download(state)
+            run.wait()
+        finally:
+            run.close()
+            self._pool.close()
+        run.summary["seconds"] = time.perf_counter() - start
+        return run.summary
+
+    def _fetch_chunk(self, state: _FileState, index: int) -> Optional[int]:
+        """
+        Fetch one range into the ``.part`` file.
+
+        Returns:
+            Bytes written, or None if the server sent the whole file
+        """
+        if state.whole:
+            return 0
+        start, end = state.chunk(index)
+        headers = {"Range": f"bytes={start}-{end - 1}"} if state.size else {}
+        error: Optional[BaseException] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                status, result = self._pool.request(
+                    state.url,
+                    headers,
+                    stream=lambda response: self._write(state, response, start),
+                )
+            except _RangeIgnored:
+                return 0
+            except (OSError, http.client.HTTPException, DownloadError) as e:
+                error = e
+                continue
+            if status == 206 or (status == 200 and not state.size):
+                written, expected_start = result
+                if expected_start == start and written == end - start:
+                    return written
+                error = DownloadError(f"Short range response for {state.entry['path']}")
+                continue
+            if status == 200:
+                written, _ = result
+                if written == state.size:
+                    return None
+                error = DownloadError(f"Incomplete response for {state.entry['path']}")
+                continue
+            error = DownloadError(f"GET {state.url} failed with HTTP {status}")
+            if status < 500 and status != 429:
+                break
+        raise DownloadError(
+            f"Could not download {state.entry['path']} "
+            f"bytes {start}-{end - 1}: {error}"
+        )
+
+    @staticmethod
+    def _write(
+        state: _FileState, response: http.client.HTTPResponse, start: int
+    ) -> Tuple[int, int]:
+        """Stream a response body into the ``.part`` file at its offset."""
+        offset = start
+        if response.status == 200:
+            if state.size:
+                # The server ignored Range: the first worker to notice streams the
+                # whole file, the others abort their responses before reading them
+                with state.lock:
+                    if state.whole and state.streamer != threading.get_ident():
+                        raise _RangeIgnored()
+                    state.whole = True
+                    state.streamer = threading.get_ident()
+            offset = 0
+        else:
+            content_range = response.getheader("Content-Range", "")
+            if content_range.startswith("bytes "):
+                offset = int(content_range[6:].split("-", 1)[0])
+        first = offset
+        fd = os.open(state.part, os.O_WRONLY)
+        try:
+            while True:
+                block = response.read(BLOCK_SIZE)
+                if not block:
+                    break
+                os.pwrite(fd, block, offset)
+                offset += len(block)
+        finally:
+            os.close(fd)
+        return offset - first, first
+
+    @staticmethod
+    def _verify(path: Path, state: _FileState) -> bool:
+        expected = state.entry.get("sha256")
+        if path.stat().st_size != state.size:
+            return False
+        return expected is None or sha256_file(path) == expected.lower()
+
+    def _marker(self, state: _FileState) -> Path:
+        return state.target.with_name(state.target.name + ".extracted")
+
+    def _extracted(self, state: _FileState) -> bool:
+        marker = self._marker(state)
+        if not state.entry.get("extract") or not marker.exists():
+            return False
+        with open(marker, "r") as f:
+            return json.load(f).get("sha256") == state.entry.get("sha256")
+
+    def _extract(self, state: _FileState, keep_archive: bool):
+        """Extract a verified archive into its ``extract`` directory."""
+        destination = _safe_target(self.data_dir, state.entry["extract"])
+        if destination is None:
+            raise DownloadError(
+                f"Unsafe extract path in manifest: {state.entry['extract']}"
+            )
+        destination.mkdir(parents=True, exist_ok=True)
+        if zipfile.is_zipfile(state.target):
+            with zipfile.ZipFile(state.target) as archive:
+                for info in archive.infolist():
+                    target = _safe_target(destination, info.filename)
+                    if target is None or info.is_dir():
+                        continue
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    with archive.open(info) as source, open(target, "wb") as out:
+                        shutil.copyfileobj(source, out, BLOCK_SIZE)
+        else:
+            # Streaming mode: one sequential pass, members written as they are read
+            with tarfile.open(state.target, mode="r|*") as archive:
+                for member in archive:
+                    target = _safe_target(destination, member.name)
+                    if target is None or not member.isfile():
+                        continue
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    source = archive.extractfile(member)
+                    with open(target, "wb") as out:
+                        shutil.copyfileobj(source, out, BLOCK_SIZE)
+        _write_json(
+            self._marker(state),
+            {"sha256": state.entry.get("sha256"), "extract": state.entry["extract"]},
+        )
+        if not keep_archive:
+            state.target.unlink()
@@ -0,0 +1,190 @@
+"""
+Vision-embedding cache for MMCSBench
+
+Models that split generation into :meth:`BaseModel.encode_image` and
+:meth:`BaseModel.generate_from_embedding` have each image encoded once; the
+embedding is kept in an :class:`EmbeddingCache` and reused for every prompt,
+task and pass over the same image.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .models import BaseModel
+
+
+def supports_embeddings(model) -> bool:
+    """Return whether a model can generate from a cached image embedding."""
+    if getattr(model, "shares_image_features", False):
+        return True
+    encode_image = getattr(type(model), "encode_image", None)
+    return encode_image is not None and encode_image is not BaseModel.encode_image
+
+
+def embedding_key(
+    identity: Dict[str, Any], image_hash: str, view: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Build the cache key of an image embedding.
+
+    Args:
+        identity: Model name and config, see :func:`model_identity`
+        image_hash: Hash of the image bytes
+        view: Resize and transform applied to the image, see
+            :attr:`CamouflageDataset.image_view`
+
+    Returns:
+        Hex digest identifying the embedding
+    """
+    content = {"model": identity, "image": image_hash}
+    if view is not None:
+        content["view"] = view
+    payload = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def embedding_nbytes(embedding: Any) -> int:
+    """
+    Estimate the memory held by an embedding.
+
+    Understands numpy arrays and torch tensors (``nbytes``), and containers
+    of them; anything else is measured with ``sys.getsizeof``.
+    """
+    nbytes = getattr(embedding, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if hasattr(embedding, "element_size") and hasattr(embedding, "nelement"):
+        return embedding.element_size() * embedding.nelement()
+    if isinstance(embedding, dict):
+        return sum(embedding_nbytes(value) for value in embedding.values())
+    if isinstance(embedding, (list, tuple)):
+        return sum(embedding_nbytes(value) for value in embedding)
+    return sys.getsizeof(embedding)
+
+
+class EmbeddingCache:
+    """
+    Thread-safe in-memory LRU cache of image embeddings, bounded by size.
+
+    With a ``spill_dir``, embeddings evicted from memory are pickled to disk
+    and promoted back on their next lookup instead of being re-encoded.
+    """
+
+    def __init__(
+        self, max_bytes: Optional[int] = None, spill_dir: Optional[str] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Maximum total size of embeddings kept in memory (None for
+                unbounded)
+            spill_dir: Directory for embeddings evicted from memory
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["EmbeddingCache"]:
+        """Create a cache from ``embedding_cache`` in a config, or None if disabled."""
+        cache_config = config.get("embedding_cache", {})
+        if not cache_config.get("enabled", False):
+            return None
+        max_size_mb = cache_config.get("max_size_mb")
+        return cls(
+            max_bytes=int(max_size_mb * 1024 * 1024) if max_size_mb else None,
+            spill_dir=cache_config.get("spill_dir"),
+        )
+
+    def _spill_path(self, key: str) -> Path:
+        return self.spill_dir / f"{key}.pkl"
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up an embedding, promoting it to most recently used.
+
+        Returns:
+            The embedding, or None on a miss
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        if self.spill_dir is not None:
+            try:
+                with open(self._spill_path(key), "rb") as f:
+                    embedding = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+            else:
+                with self._lock:
+                    self.spill_hits += 1
+                self.put(key, embedding)
+                return embedding
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, embedding: Any):
+        """Store an embedding, evicting the least recently used beyond ``max_bytes``."""
+        size = embedding_nbytes(embedding)
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+            if self.max_bytes is not None:
+                while self._bytes > self.max_bytes and len(self._entries) > 1:
+                    old_key, old = self._entries.popitem(last=False)
+                    self._bytes -= self._sizes.pop(old_key)
+                    evicted.append((old_key, old))
+        if self.spill_dir is not None:
+            for old_key, old in evicted:
+                path = self._spill_path(old_key)
+                if path.exists():
+                    continue
+                tmp = path.with_name(
+                    path.name + f".tmp{os.getpid()}.{threading.get_ident()}"
+                )
+                with open(tmp, "wb") as f:
+                    pickle.dump(old, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+
+    def size_bytes(self) -> int:
+        """Total size of the embeddings held in memory."""
+        with self._lock:
+            return self._bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """Remove all embeddings, including spilled ones."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+        if self.spill_dir is not None:
+            for path in self.spill_dir.glob("*.pkl"):
+                path.unlink()
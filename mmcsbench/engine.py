@@ -0,0 +1,527 @@
+"""
+Batched, streaming inference engine for MMCSBench
+"""
+
+import queue
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import profiling
+from .batching import DynamicBatcher, batch_key
+from .cache import PredictionCache, cache_identity, make_key, model_identity
+from .embeddings import EmbeddingCache, embedding_key, supports_embeddings
+from .scheduler import GenerationScheduler, supports_concurrency
+from .tasks import build_prompt, generation_kwargs, task_queries
+
+_DONE = object()
+
+
+class _Failure:
+    """Wraps an exception raised inside the prefetch thread."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def iter_batches(
+    dataset,
+    indices: Sequence[int],
+    batch_size: int,
+    num_workers: int = 0,
+    prefetch: int = 1,
+    loader: Optional[Callable[[int], Dict]] = None,
+) -> Iterator[List[Dict]]:
+    """
+    Stream dataset items in batches, loading ahead in a background thread.
+
+    While the caller works on one batch, the next ``prefetch`` batches are
+    decoded by a pool of ``num_workers`` threads.
+
+    Args:
+        dataset: Dataset supporting ``__getitem__``
+        indices: Dataset indices to load, in order
+        batch_size: Number of items per batch
+        num_workers: Threads used to load items of a batch (0 loads inline)
+        prefetch: Number of batches loaded ahead of the consumer
+        loader: Function loading one item by index. Defaults to ``dataset[idx]``.
+
+    Yields:
+        Lists of dataset items, each tagged with its dataset ``index``
+    """
+    batch_size = max(1, int(batch_size))
+    chunks = [
+        list(indices[i : i + batch_size]) for i in range(0, len(indices), batch_size)
+    ]
+    if not chunks:
+        return
+
+    def load(idx):
+        item = loader(idx) if loader else dataset[idx]
+        item["index"] = idx
+        return item
+
+    buffer: queue.Queue = queue.Queue(maxsize=max(1, int(prefetch)))
+    stop = threading.Event()
+    pool = None
+    if num_workers > 0:
+        pool = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="mmcsbench-load"
+        )
+
+    def put(value) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                batch = (
+                    list(pool.map(load, chunk)) if pool else [load(i) for i in chunk]
+                )
+                if not put(batch):
+                    return
+            put(_DONE)
+        except BaseException as error:  # surfaced in the consumer
+            put(_Failure(error))
+
+    producer = threading.Thread(target=produce, name="mmcsbench-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            with profiling.timer("engine.wait"):
+                batch = buffer.get()
+            if batch is _DONE:
+                break
+            if isinstance(batch, _Failure):
+                raise batch.error
+            yield batch
+    finally:
+        stop.set()
+        producer.join()
+        if pool:
+            pool.shutdown(wait=True)
+
+
+class _ModelState:
+    """Per-model settings of a run."""
+
+    __slots__ = ("identity", "use_embeddings", "embeddings", "cache")
+
+    def __init__(
+        self,
+        identity: Optional[Dict[str, Any]],
+        use_embeddings: bool,
+        embeddings: Optional[EmbeddingCache],
+        cache: Optional[PredictionCache],
+    ):
+        self.identity = identity
+        self.use_embeddings = use_embeddings
+        self.embeddings = embeddings
+        self.cache = cache
+
+
+class InferenceEngine:
+    """
+    Runs a model over a dataset task in batches.
+
+    Items are streamed through :func:`iter_batches`, expanded into one query
+    per task annotation and sent to :meth:`BaseModel.generate_batch`, or to a
+    :class:`GenerationScheduler` for models that accept concurrent calls.
+    With a :class:`PredictionCache`, cached queries are answered without
+    calling the model, and images are only decoded for items with misses.
+    Models with an ``encode_image``/``generate_from_embedding`` split have
+    each image encoded once, with embeddings kept in an :class:`EmbeddingCache`.
+    A :class:`DynamicBatcher` splits the pending queries of each task into
+    model calls of a tuned size.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 32,
+        num_workers: int = 4,
+        prefetch: int = 2,
+        config: Optional[Dict[str, Any]] = None,
+        scheduler: Optional[GenerationScheduler] = None,
+        cache: Optional[PredictionCache] = None,
+        embeddings: Optional[EmbeddingCache] = None,
+        batcher: Optional[DynamicBatcher] = None,
+    ):
+        """
+        Initialize the engine.
+
+        Args:
+            batch_size: Number of images loaded and sent to the model at once
+            num_workers: Threads used for image loading
+            prefetch: Number of batches loaded ahead of the model
+            config: Benchmark configuration used for prompts and generation kwargs
+            scheduler: Scheduler for concurrent generation
+            cache: Persistent prediction cache
+            embeddings: Cache of image embeddings
+            batcher: Adaptive batching of model calls (not used with the scheduler)
+        """
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.config = config or {}
+        self.scheduler = scheduler
+        self.cache = cache
+        self.embeddings = embeddings
+        self.batcher = batcher
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "InferenceEngine":
+        """Create an engine from the ``evaluation`` section of a config."""
+        evaluation = config.get("evaluation", {})
+        return cls(
+            batch_size=evaluation.get("batch_size", 32),
+            num_workers=evaluation.get("num_workers", 4),
+            prefetch=evaluation.get("prefetch_batches", 2),
+            config=config,
+            scheduler=GenerationScheduler.from_config(config),
+            cache=PredictionCache.from_config(config),
+            embeddings=EmbeddingCache.from_config(config),
+            batcher=DynamicBatcher.from_config(config),
+        )
+
+    def run(
+        self, model, dataset, task: str, indices: Optional[Sequence[int]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Generate predictions for every query of a task.
+
+        Args:
+            model: Model implementing :class:`BaseModel`
+            dataset: Dataset to iterate
+            task: Task name
+            indices: Dataset indices to evaluate. Defaults to items annotated for
+                the task.
+
+        Yields:
+            Prediction records in dataset order
+        """
+        yield from self.run_tasks(
+            model, dataset, [task], indices=None if indices is None else {task: indices}
+        )
+
+    def run_tasks(
+        self,
+        model,
+        dataset,
+        tasks: Sequence[str],
+        indices: Optional[Dict[str, Sequence[int]]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Generate predictions for several tasks in a single pass over the dataset.
+
+        Each image is loaded once and the prompts of all its tasks are issued
+        together (one model call per task and batch, since generation kwargs
+        differ between tasks). For models that support embeddings, the image
+        is encoded once with :meth:`BaseModel.encode_image` and the embedding
+        is passed to every generation call instead of the image.
+
+        Args:
+            model: Model implementing :class:`BaseModel`
+            dataset: Dataset to iterate
+            tasks: Task names
+            indices: Dataset indices to evaluate per task. Defaults to items
+                annotated for each task.
+
+        Yields:
+            Prediction records in dataset order, grouped by item and then by task
+        """
+        for _, record in self.run_models(
+            [model], dataset, tasks, indices=None if indices is None else [indices]
+        ):
+            yield record
+
+    def run_models(
+        self,
+        models: Sequence,
+        dataset,
+        tasks: Sequence[str],
+        indices: Optional[Sequence[Dict[str, Sequence[int]]]] = None,
+        concurrent: bool = False,
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Generate predictions of several models in a single pass over the dataset.
+
+        Each batch is loaded, and its images decoded, once and handed to every
+        model, one after another or with ``concurrent`` in one thread per
+        model. Cache lookups and image embeddings are per model; an image is
+        decoded if any model has to be called for it.
+
+        Args:
+            models: Models implementing :class:`BaseModel`
+            dataset: Dataset to iterate
+            tasks: Task names
+            indices: Dataset indices to evaluate per task, one dict per model.
+                Defaults to items annotated for each task.
+            concurrent: Run the models on a batch in parallel threads
+
+        Yields:
+            ``(model position, record)``. The records of each model are in
+            dataset order, grouped by item and then by task.
+        """
+        if indices is None:
+            default = {task: dataset.get_task_indices(task) for task in tasks}
+            indices = [default] * len(models)
+        selected = [
+            {task: set(model_indices.get(task, ())) for task in tasks}
+            for model_indices in indices
+        ]
+        order = sorted(set().union(*(ids for sel in selected for ids in sel.values())))
+        task_kwargs = {task: generation_kwargs(task, self.config) for task in tasks}
+        states = [self._model_state(model) for model in models]
+        view = getattr(dataset, "image_view", None)
+        resized = getattr(dataset, "image_size", None)
+
+        def load(idx: int) -> Dict[str, Any]:
+            annotation = dataset.get_annotation(idx)
+            queries = []
+            for task in tasks:
+                if any(idx in sel[task] for sel in selected):
+                    annotations = task_queries(
+                        task, annotation.get("tasks", {}).get(task)
+                    )
+                    for query_id, query in enumerate(annotations):
+                        queries.append(
+                            (
+                                task,
+                                query_id,
+                                query,
+                                build_prompt(task, query, self.config),
+                            )
+                        )
+            image_hash = None
+            needs_image = False
+            runs = []
+            for state, sel in zip(states, selected):
+                mine = [
+                    q for q, (task, _, _, _) in enumerate(queries) if idx in sel[task]
+                ]
+                run = {
+                    "queries": mine,
+                    "keys": [None] * len(mine),
+                    "cached": {},
+                    "embedding": None,
+                    "embedding_key": None,
+                }
+                if state.cache is not None and mine:
+                    image_hash = image_hash or dataset.get_image_hash(idx)
+                    run["keys"] = [
+                        make_key(
+                            state.identity,
+                            queries[q][3],
+                            task_kwargs[queries[q][0]],
+                            image_hash,
+                            view,
+                        )
+                        for q in mine
+                    ]
+                    with profiling.timer("cache.get"):
+                        run["cached"] = state.cache.get_many(run["keys"])
+                    profiling.count("cache.hit", len(run["cached"]))
+                    profiling.count("cache.miss", len(mine) - len(run["cached"]))
+                if len(run["cached"]) < len(mine):
+                    if state.embeddings is not None:
+                        image_hash = image_hash or dataset.get_image_hash(idx)
+                        run["embedding_key"] = embedding_key(
+                            state.identity, image_hash, view
+                        )
+                        run["embedding"] = state.embeddings.get(run["embedding_key"])
+                        profiling.count(
+                            "embedding_cache.hit"
+                            if run["embedding"] is not None
+                            else "embedding_cache.miss"
+                        )
+                    if run["embedding"] is None:
+                        needs_image = True
+                runs.append(run)
+            geometry = None
+            if resized is not None and any(q[0] == "detection" for q in queries):
+                # Models see the image at image_size; detection boxes are
+                # scaled back to the full-resolution ground truth
+                original = dataset.get_image_size(idx)
+                if original is not None:
+                    geometry = {
+                        "image_size": list(original),
+                        "input_size": [resized[1], resized[0]],
+                    }
+            return {
+                "image_id": annotation.get("image_id", f"item_{idx}"),
+                "category": annotation.get("category"),
+                "difficulty": annotation.get("difficulty"),
+                "queries": queries,
+                "runs": runs,
+                "geometry": geometry,
+                "image": dataset[idx]["image"] if needs_image else None,
+            }
+
+        pool = None
+        if concurrent and len(models) > 1:
+            pool = ThreadPoolExecutor(
+                max_workers=len(models), thread_name_prefix="mmcsbench-model"
+            )
+        try:
+            for batch in iter_batches(
+                dataset,
+                order,
+                self.batch_size,
+                self.num_workers,
+                self.prefetch,
+                loader=load,
+            ):
+                if pool is not None:
+                    outputs = pool.map(
+                        lambda position: self._answer(
+                            models[position],
+                            states[position],
+                            position,
+                            batch,
+                            task_kwargs,
+                        ),
+                        range(len(models)),
+                    )
+                else:
+                    outputs = (
+                        self._answer(model, state, position, batch, task_kwargs)
+                        for position, (model, state) in enumerate(zip(models, states))
+                    )
+                for position, records in enumerate(outputs):
+                    for record in records:
+                        yield position, record
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+    def _model_state(self, model) -> "_ModelState":
+        use_embeddings = supports_embeddings(model) and not (
+            self.scheduler is not None and supports_concurrency(model)
+        )
+        embeddings = self.embeddings if use_embeddings else None
+        cache = self.cache
+        identity = None
+        if cache is not None or embeddings is not None:
+            identity = cache_identity(model)
+            if identity is None:
+                warnings.warn(
+                    f"Not caching predictions or embeddings of "
+                    f"{type(model).__qualname__}: load it with load_model or define "
+                    f"cache_identity() so that instances with different weights or "
+                    f"settings get different cache keys"
+                )
+                cache = embeddings = None
+        if identity is None and self.batcher is not None:
+            identity = model_identity(model)
+        return _ModelState(identity, use_embeddings, embeddings, cache)
+
+    def _answer(
+        self,
+        model,
+        state: "_ModelState",
+        position: int,
+        batch: List[Dict],
+        task_kwargs: Dict[str, Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        """Build one model's records for a batch, generating missing predictions."""
+        records = []
+        pending: Dict[str, List] = {}
+        for item in batch:
+            run = item["runs"][position]
+            image = item["image"]
+            if state.use_embeddings and len(run["cached"]) < len(run["queries"]):
+                image = run["embedding"]
+                if image is None:
+                    with profiling.timer("model.encode_image"):
+                        image = model.encode_image(item["image"])
+                    if state.embeddings is not None:
+                        state.embeddings.put(run["embedding_key"], image)
+            for q, key in zip(run["queries"], run["keys"]):
+                task, query_id, query, prompt = item["queries"][q]
+                record = {
+                    "index": item["index"],
+                    "image_id": item["image_id"],
+                    "query_id": query_id,
+                    "task": task,
+                    "category": item["category"],
+                    "difficulty": item["difficulty"],
+                    "reference": query,
+                    "prompt": prompt,
+                }
+                if task == "detection" and item["geometry"] is not None:
+                    record.update(item["geometry"])
+                if key in run["cached"]:
+                    record["prediction"] = run["cached"][key]
+                else:
+                    pending.setdefault(task, []).append((record, image, key))
+                records.append(record)
+
+        for task, calls in pending.items():
+            images = [image for _, image, _ in calls]
+            prompts = [record["prompt"] for record, _, _ in calls]
+            profiling.observe("model.batch_size", len(prompts))
+            with profiling.timer("model.generate", task=task, batch=len(prompts)):
+                if state.use_embeddings:
+                    generate = model.generate_batch_from_embeddings
+                else:
+                    generate = model.generate_batch
+                outputs = self._generate(
+                    model,
+                    generate,
+                    images,
+                    prompts,
+                    task_kwargs[task],
+                    (
+                        batch_key(state.identity, task)
+                        if self.batcher is not None
+                        else None
+                    ),
+                )
+            for (record, _, _), output in zip(calls, outputs):
+                record["prediction"] = output
+            if state.cache is not None:
+                with profiling.timer("cache.put"):
+                    state.cache.put_many(
+                        (key, record["prediction"]) for record, _, key in calls
+                    )
+        return records
+
+    def _generate(
+        self,
+        model,
+        generate: Callable,
+        images: List,
+        prompts: List[str],
+        kwargs: Dict[str, Any],
+        key: Optional[str] = None,
+    ) -> List:
+        if self.scheduler is not None and supports_concurrency(model):
+            outputs = self.scheduler.map(model, images, prompts, **kwargs)
+        elif self.batcher is not None:
+            outputs = self.batcher.run(
+                key,
+                images,
+                prompts,
+                lambda batch, texts: generate(batch, texts, **kwargs),
+            )
+        else:
+            outputs = generate(images, prompts, **kwargs)
+        self._check_outputs(outputs, prompts)
+        return outputs
+
+    @staticmethod
+    def _check_outputs(outputs: List, prompts: List[str]):
+        if len(outputs) != len(prompts):
+            raise RuntimeError(
+                f"generate_batch returned {len(outputs)} outputs "
+                f"for {len(prompts)} prompts"
+            )
@@ -2,87 +2,527 @@
 Evaluation framework for MMCSBench
 """
 
-from typing import Dict, Any, List
+import contextlib
+from collections import Counter
 from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-try:
-    import numpy as np
-except ImportError:
-    np = None
+from . import profiling
+from .cache import model_identity
+from .engine import InferenceEngine
+from .metrics import (
+    TASK_METRICS,
+    CaptionMetric,
+    CiderCorpus,
+    Metric,
+    build_corpus,
+    build_metric,
+    select_metrics,
+)
+from .predictions import (
+    PredictionWriter,
+    completed_indices,
+    prediction_path,
+    read_predictions,
+)
+from .sharding import shard_indices
+from .tasks import TASKS
+
+if TYPE_CHECKING:
+    from .datasets import CamouflageDataset
+
+
+def print_progress(task: str, count: int, results: Dict[str, float]):
+    """Print partial metrics of a running evaluation."""
+    values = ", ".join(f"{name}={value:.4f}" for name, value in results.items())
+    print(f"  [{task}] {count} samples: {values}")
 
 
 class Evaluator:
     """Main evaluator class for benchmark tasks."""
-    
-    def __init__(self, config: Dict[str, Any]):
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        progress: Optional[Callable[[str, int, Dict[str, float]], None]] = None,
+    ):
         """
         Initialize evaluator with configuration.
-        
+
         Args:
             config: Evaluation configuration
+            progress: Called with ``(task, samples, partial metrics)`` every
+                ``evaluation.report_every`` samples of a task. Prints them by default.
         """
         self.config = config
-        
-    def evaluate_task(self, model, task: str, split: str = 'test') -> Dict[str, Any]:
+        self.engine = InferenceEngine.from_config(config)
+        self.report_every = config.get("evaluation", {}).get("report_every") or 0
+        self.progress = progress or print_progress
+        self._corpora: Dict[Tuple[str, str, str], CiderCorpus] = {}
+
+    def evaluate_task(
+        self,
+        model,
+        task: str,
+        split: str = "test",
+        dataset: Optional["CamouflageDataset"] = None,
+        output_dir: Optional[str] = None,
+        resume: bool = False,
+        shard: Optional[Tuple[int, int]] = None,
+        subset: Optional[Sequence[int]] = None,
+    ) -> Dict[str, Any]:
         """
         Evaluate model on a specific task.
-        
+
         Args:
             model: Model to evaluate
             task: Task name ('detection', 'classification', 'reasoning', 'description')
             split: Data split to use
-            
+            dataset: Dataset for the split. Loaded from ``data_dir`` if not given.
+            output_dir: Directory to stream per-sample predictions to. Predictions
+                are kept in memory if not given.
+            resume: Skip samples already committed to the prediction shard in
+                ``output_dir`` by a previous run
+            shard: ``(shard_id, num_shards)`` to evaluate only one deterministic
+                shard of the split. Requires ``output_dir``; the returned metrics
+                cover this shard only, use :func:`merge_shards` for the split.
+            subset: Item indices to evaluate instead of the whole split, e.g.
+                from :func:`mmcsbench.subsets.load_subset`. CIDEr-D is still
+                scored against the whole split's references.
+
         Returns:
             Task evaluation results
         """
-        if task == 'detection':
-            return self._evaluate_detection(model, split)
-        elif task == 'classification':
-            return self._evaluate_classification(model, split)
-        elif task == 'reasoning':
-            return self._evaluate_reasoning(model, split)
-        elif task == 'description':
-            return self._evaluate_description(model, split)
-        else:
+        if task not in TASKS:
             raise ValueError(f"Unknown task: {task}")
-    
-    def _evaluate_detection(self, model, split: str) -> Dict[str, float]:
-        """Evaluate object detection performance."""
-        # Placeholder implementation
-        return {
-            'mAP': 0.0,
-            'precision': 0.0,
-            'recall': 0.0,
-            'f1_score': 0.0
-        }
-    
-    def _evaluate_classification(self, model, split: str) -> Dict[str, float]:
-        """Evaluate classification performance."""
-        # Placeholder implementation
-        return {
-            'accuracy': 0.0,
-            'top5_accuracy': 0.0,
-            'macro_f1': 0.0,
-            'weighted_f1': 0.0
-        }
-    
-    def _evaluate_reasoning(self, model, split: str) -> Dict[str, float]:
-        """Evaluate visual reasoning performance."""
-        # Placeholder implementation
-        return {
-            'accuracy': 0.0,
-            'bleu_score': 0.0,
-            'rouge_l': 0.0,
-            'cider_score': 0.0
-        }
-    
-    def _evaluate_description(self, model, split: str) -> Dict[str, float]:
-        """Evaluate description generation performance."""
-        # Placeholder implementation
-        return {
-            'bleu_1': 0.0,
-            'bleu_4': 0.0,
-            'meteor': 0.0,
-            'cider': 0.0,
-            'rouge_l': 0.0
-        }
\ No newline at end of file
+        if resume and output_dir is None:
+            raise ValueError("resume=True requires an output_dir")
+        if shard is not None and output_dir is None:
+            raise ValueError("Sharded evaluation requires an output_dir")
+        if dataset is None:
+            dataset = self._load_dataset(split)
+
+        # Shards are scored against the whole split's document frequencies
+        corpus = self.cider_corpus(task, dataset)
+        metric = build_metric(task, self.config, corpus=corpus)
+        if output_dir is None:
+            indices = (
+                None
+                if subset is None
+                else self.task_indices(dataset, task, subset=subset)
+            )
+            records = self.engine.run(model, dataset, task, indices=indices)
+            # Only the metric updates are timed: pulling a record runs the model
+            for record in self._live(records, [task], {task: corpus}, {task: metric}):
+                with profiling.timer(f"metrics.{task}.update"):
+                    metric.update((record,))
+        else:
+            records = self._run_to_shard(
+                model, task, split, dataset, output_dir, resume, shard, subset
+            )
+            with profiling.timer(f"metrics.{task}.update"):
+                metric.update(records)
+        with profiling.timer(f"metrics.{task}.compute"):
+            return select_metrics(task, metric.compute(), self.config)
+
+    @staticmethod
+    def task_indices(
+        dataset: "CamouflageDataset",
+        task: str,
+        shard: Optional[Tuple[int, int]] = None,
+        subset: Optional[Sequence[int]] = None,
+    ) -> List[int]:
+        """
+        Dataset indices of a task's items, restricted to a subset and then a shard.
+
+        Shards are cut from the split's items, not from each task's list, so
+        an item lands in the same shard for every task and its image is only
+        loaded by that shard.
+
+        Args:
+            dataset: Dataset of the split
+            task: Task name
+            shard: ``(shard_id, num_shards)``
+            subset: Item indices to keep
+
+        Returns:
+            Dataset indices, in order
+        """
+        indices = dataset.get_task_indices(task)
+        if subset is not None:
+            keep = set(subset)
+            indices = [idx for idx in indices if idx in keep]
+        if shard is not None:
+            items = set(shard_indices(range(len(dataset)), *shard))
+            indices = [idx for idx in indices if idx in items]
+        return indices
+
+    def _load_dataset(self, split: str) -> "CamouflageDataset":
+        # Imported here: the dataset module pulls in torch
+        from .datasets import CamouflageDataset
+
+        return CamouflageDataset.from_config(self.config, split=split)
+
+    def cider_corpus(
+        self, task: str, dataset: "CamouflageDataset"
+    ) -> Optional[CiderCorpus]:
+        """
+        CIDEr-D document frequencies of a split, computed once and reused.
+
+        Args:
+            task: Task name
+            dataset: Dataset of the split
+
+        Returns:
+            Corpus over the split's references, or None for tasks without
+            captioning metrics
+        """
+        if not issubclass(TASK_METRICS[task], CaptionMetric):
+            return None
+        key = (str(dataset.data_dir), dataset.split, task)
+        if key not in self._corpora:
+            self._corpora[key] = build_corpus(task, dataset, self.config)
+        return self._corpora[key]
+
+    def _live(
+        self,
+        records: Iterable[Dict],
+        tasks: Sequence[str],
+        corpora: Dict[str, Optional[CiderCorpus]],
+        metrics: Optional[Dict[str, Metric]] = None,
+    ) -> Iterator[Dict]:
+        """
+        Pass records through, reporting partial metrics every ``report_every`` samples.
+
+        Args:
+            records: Prediction records
+            tasks: Tasks of the records
+            corpora: CIDEr-D corpus per task
+            metrics: Accumulators the consumer updates with each record. Live
+                accumulators are kept here if not given.
+
+        Yields:
+            The records
+        """
+        if not self.report_every:
+            yield from records
+            return
+        live = metrics is None
+        if live:
+            metrics = {
+                task: build_metric(task, self.config, corpus=corpora.get(task))
+                for task in tasks
+            }
+        counts: Counter = Counter()
+        for record in records:
+            task = record["task"]
+            if live:
+                metrics[task].update((record,))
+            # The consumer's update of ``metrics`` runs before the generator resumes
+            yield record
+            counts[task] += 1
+            if counts[task] % self.report_every == 0:
+                self.progress(
+                    task,
+                    counts[task],
+                    select_metrics(task, metrics[task].compute(), self.config),
+                )
+
+    def evaluate_tasks(
+        self,
+        model,
+        tasks: Sequence[str],
+        split: str = "test",
+        dataset: Optional["CamouflageDataset"] = None,
+        output_dir: Optional[str] = None,
+        resume: bool = False,
+        shard: Optional[Tuple[int, int]] = None,
+        subset: Optional[Sequence[int]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Evaluate several tasks in a single pass over the dataset.
+
+        Every image is loaded (and, for models that share image features,
+        encoded) once, the prompts of all its tasks are issued together and
+        the outputs are routed to per-task metric accumulators. Arguments and
+        prediction files are the same as for :meth:`evaluate_task`.
+
+        Returns:
+            Dictionary containing evaluation results per task
+        """
+        for task in tasks:
+            if task not in TASKS:
+                raise ValueError(f"Unknown task: {task}")
+        if resume and output_dir is None:
+            raise ValueError("resume=True requires an output_dir")
+        if shard is not None and output_dir is None:
+            raise ValueError("Sharded evaluation requires an output_dir")
+        if dataset is None:
+            dataset = self._load_dataset(split)
+
+        corpora = {task: self.cider_corpus(task, dataset) for task in tasks}
+        if output_dir is None:
+            metrics = {
+                task: build_metric(task, self.config, corpus=corpora[task])
+                for task in tasks
+            }
+            indices = (
+                None
+                if subset is None
+                else {
+                    task: self.task_indices(dataset, task, subset=subset)
+                    for task in tasks
+                }
+            )
+            records = self.engine.run_tasks(model, dataset, tasks, indices=indices)
+            for record in self._live(records, tasks, corpora, metrics):
+                with profiling.timer(f"metrics.{record['task']}.update"):
+                    metrics[record["task"]].update((record,))
+        else:
+            paths = self._run_to_shards(
+                model, tasks, split, dataset, output_dir, resume, shard, subset
+            )
+            metrics = {}
+            for task in tasks:
+                with profiling.timer(f"metrics.{task}.update"):
+                    metrics[task] = self.accumulate(
+                        task, read_predictions(paths[task]), corpora[task]
+                    )
+        results = {}
+        for task in tasks:
+            with profiling.timer(f"metrics.{task}.compute"):
+                results[task] = select_metrics(
+                    task, metrics[task].compute(), self.config
+                )
+        return results
+
+    def _run_to_shard(
+        self,
+        model,
+        task: str,
+        split: str,
+        dataset: "CamouflageDataset",
+        output_dir: str,
+        resume: bool,
+        shard: Optional[Tuple[int, int]] = None,
+        subset: Optional[Sequence[int]] = None,
+    ) -> Iterable[Dict]:
+        """Stream predictions into the task's JSONL shard; return a reader over it."""
+        paths = self._run_to_shards(
+            model, [task], split, dataset, output_dir, resume, shard, subset
+        )
+        return read_predictions(paths[task])
+
+    def _run_to_shards(
+        self,
+        model,
+        tasks: Sequence[str],
+        split: str,
+        dataset: "CamouflageDataset",
+        output_dir: str,
+        resume: bool,
+        shard: Optional[Tuple[int, int]] = None,
+        subset: Optional[Sequence[int]] = None,
+    ) -> Dict[str, Path]:
+        """Stream predictions of one or more tasks into their JSONL shards."""
+        return self._run_models_to_shards(
+            [model], tasks, split, dataset, output_dir, resume, shard, subset=subset
+        )[0]
+
+    def _run_models_to_shards(
+        self,
+        models: Sequence,
+        tasks: Sequence[str],
+        split: str,
+        dataset: "CamouflageDataset",
+        output_dir: str,
+        resume: bool,
+        shard: Optional[Tuple[int, int]] = None,
+        concurrent: bool = False,
+        subset: Optional[Sequence[int]] = None,
+    ) -> List[Dict[str, Path]]:
+        """Stream several models' predictions into their shards, loading items once."""
+        evaluation = self.config.get("evaluation", {})
+        paths: List[Dict[str, Path]] = []
+        indices: List[Dict[str, Sequence[int]]] = []
+        writers: List[Dict[str, PredictionWriter]] = []
+        with contextlib.ExitStack() as stack:
+            for model in models:
+                identity = model_identity(model)
+                paths.append({})
+                indices.append({})
+                writers.append({})
+                for task in tasks:
+                    path = prediction_path(
+                        output_dir, identity["name"], split, task, shard=shard
+                    )
+                    metadata = {"model": identity, "split": split, "task": task}
+                    if shard is not None:
+                        metadata["shard"] = list(shard)
+
+                    task_indices = self.task_indices(dataset, task, shard, subset)
+                    if resume:
+                        done = completed_indices(path)
+                        task_indices = [idx for idx in task_indices if idx not in done]
+
+                    paths[-1][task] = path
+                    indices[-1][task] = task_indices
+                    writers[-1][task] = stack.enter_context(
+                        PredictionWriter(
+                            path,
+                            resume=resume,
+                            metadata=metadata,
+                            checkpoint_every=evaluation.get("checkpoint_every", 256),
+                            checkpoint_interval=evaluation.get(
+                                "checkpoint_interval", 30.0
+                            ),
+                        )
+                    )
+
+            current: List[Optional[int]] = [None] * len(models)
+            records = self.engine.run_models(
+                models, dataset, tasks, indices=indices, concurrent=concurrent
+            )
+            if len(models) == 1:
+                corpora = {task: self.cider_corpus(task, dataset) for task in tasks}
+                records = (
+                    (0, record)
+                    for record in self._live((r for _, r in records), tasks, corpora)
+                )
+            for position, record in records:
+                if record["index"] != current[position]:
+                    for writer in writers[position].values():
+                        writer.commit()
+                    current[position] = record["index"]
+                with profiling.timer("predictions.write"):
+                    writers[position][record["task"]].write(record)
+
+        return paths
+
+    def evaluate_many(
+        self,
+        models: Sequence,
+        tasks: Sequence[str],
+        split: str = "test",
+        dataset: Optional["CamouflageDataset"] = None,
+        output_dir: Optional[str] = None,
+        resume: bool = False,
+        shard: Optional[Tuple[int, int]] = None,
+        concurrent: Optional[bool] = None,
+        subset: Optional[Sequence[int]] = None,
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Evaluate several models on the same tasks in a single pass over the dataset.
+
+        Every batch is loaded and its images decoded once, then run through
+        each model (see :meth:`InferenceEngine.run_models`). Arguments and
+        prediction files are the same as for :meth:`evaluate_tasks`, with one
+        set of prediction files per model.
+
+        Args:
+            concurrent: Run the models on a batch in parallel threads.
+                Defaults to ``evaluation.concurrent_models``.
+            subset: Item indices to evaluate instead of the whole split
+
+        Returns:
+            Results per task, per model name
+        """
+        for task in tasks:
+            if task not in TASKS:
+                raise ValueError(f"Unknown task: {task}")
+        if resume and output_dir is None:
+            raise ValueError("resume=True requires an output_dir")
+        if shard is not None and output_dir is None:
+            raise ValueError("Sharded evaluation requires an output_dir")
+        names = [model_identity(model)["name"] for model in models]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(
+                f"Models must have distinct names, got duplicates: {duplicates}"
+            )
+        if concurrent is None:
+            concurrent = self.config.get("evaluation", {}).get(
+                "concurrent_models", False
+            )
+        if dataset is None:
+            dataset = self._load_dataset(split)
+
+        corpora = {task: self.cider_corpus(task, dataset) for task in tasks}
+        if output_dir is None:
+            metrics = [
+                {
+                    task: build_metric(task, self.config, corpus=corpora[task])
+                    for task in tasks
+                }
+                for _ in models
+            ]
+            indices = None
+            if subset is not None:
+                indices = [
+                    {
+                        task: self.task_indices(dataset, task, subset=subset)
+                        for task in tasks
+                    }
+                ] * len(models)
+            for position, record in self.engine.run_models(
+                models, dataset, tasks, indices=indices, concurrent=concurrent
+            ):
+                with profiling.timer(f"metrics.{record['task']}.update"):
+                    metrics[position][record["task"]].update((record,))
+        else:
+            paths = self._run_models_to_shards(
+                models,
+                tasks,
+                split,
+                dataset,
+                output_dir,
+                resume,
+                shard,
+                concurrent,
+                subset,
+            )
+            metrics = []
+            for model_paths in paths:
+                metrics.append({})
+                for task in tasks:
+                    with profiling.timer(f"metrics.{task}.update"):
+                        metrics[-1][task] = self.accumulate(
+                            task, read_predictions(model_paths[task]), corpora[task]
+                        )
+        results = {}
+        for name, model_metrics in zip(names, metrics):
+            results[name] = {}
+            for task in tasks:
+                with profiling.timer(f"metrics.{task}.compute"):
+                    results[name][task] = select_metrics(
+                        task, model_metrics[task].compute(), self.config
+                    )
+        return results
+
+    def accumulate(
+        self, task: str, records: Iterable[Dict], corpus: Optional[CiderCorpus] = None
+    ) -> Metric:
+        """
+        Accumulate the metric statistics of a task over prediction records.
+
+        Args:
+            task: Task name
+            records: Prediction records
+            corpus: Precomputed CIDEr-D document frequencies of the split
+
+        Returns:
+            Metric accumulator, which can be merged with accumulators of other shards
+            built on the same corpus
+        """
+        return build_metric(task, self.config, corpus=corpus).update(records)
@@ -0,0 +1,207 @@
+"""
+Image decoding and resized-image cache for MMCSBench
+
+Images are decoded straight to the configured ``image_size``: JPEGs use
+PIL's draft mode, which lets libjpeg scale by 1/2, 1/4 or 1/8 during the
+DCT instead of decoding at full resolution, and the remainder is resized.
+The resulting uint8 arrays can be kept in an :class:`ImageCache`, a
+memory-mapped ``(N, H, W, 3)`` array next to the data, so each image of a
+split is decoded once and then shared by every task, model and worker.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+CACHE_VERSION = 1
+
+
+def parse_image_size(
+    size: Optional[Union[int, Sequence[int]]],
+) -> Optional[Tuple[int, int]]:
+    """
+    Normalize an ``image_size`` setting to ``(height, width)``.
+
+    Args:
+        size: Single side length, ``[height, width]`` or None
+
+    Returns:
+        ``(height, width)``, or None to keep images at full resolution
+    """
+    if size is None:
+        return None
+    if isinstance(size, int):
+        return size, size
+    height, width = (int(side) for side in size)
+    if height <= 0 or width <= 0:
+        raise ValueError(f"Invalid image size: {size}")
+    return height, width
+
+
+def decode_image(
+    path: Union[str, Path], size: Optional[Tuple[int, int]] = None, out=None
+):
+    """
+    Decode an image file to an RGB uint8 array.
+
+    Args:
+        path: Image file
+        size: Target ``(height, width)``. Full resolution if None.
+        out: ``(H, W, 3)`` uint8 array to write the pixels to, e.g. a
+            shared-memory slot. Requires ``size``.
+
+    Returns:
+        ``(H, W, 3)`` uint8 array (``out`` if given)
+    """
+    if Image is None or np is None:
+        raise ImportError("Decoding images requires Pillow and numpy")
+    with Image.open(path) as image:
+        if size is not None:
+            height, width = size
+            # JPEG only: decode at the smallest DCT scale that is still >= size
+            image.draft("RGB", (width, height))
+        image = image.convert("RGB")
+        if size is not None and image.size != (size[1], size[0]):
+            image = image.resize((size[1], size[0]), Image.BILINEAR)
+        if out is not None:
+            out[...] = np.asarray(image, dtype=np.uint8)
+            return out
+        return np.asarray(image, dtype=np.uint8)
+
+
+class ImageCache:
+    """
+    Memory-mapped cache of resized RGB images of one split.
+
+    The cache directory holds ``images.npy`` (``(N, H, W, 3)`` uint8),
+    ``filled.npy`` (one flag per item) and ``meta.json``. Both arrays are
+    mapped shared and writable, so items decoded by DataLoader worker
+    processes are visible to every other process. An item's flag is only set
+    after its pixels are written.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        num_items: int,
+        size: Tuple[int, int],
+        source: Optional[Dict] = None,
+    ):
+        """
+        Open a cache, creating it if it is missing or was built for another
+        split layout.
+
+        Args:
+            path: Cache directory
+            num_items: Number of items in the split
+            size: Image ``(height, width)``
+            source: Signature of the annotation file the item indices refer to
+                and of the image files; a different signature rebuilds the cache
+        """
+        if np is None:
+            raise ImportError("The image cache requires numpy")
+        self.path = Path(path)
+        self.num_items = num_items
+        self.size = tuple(size)
+        self.meta = {
+            "version": CACHE_VERSION,
+            "num_items": num_items,
+            "size": list(self.size),
+            "source": source,
+        }
+        if not self._is_current():
+            self._create()
+        self._pid = None
+        self._images = None
+        self._filled = None
+
+    def _is_current(self) -> bool:
+        meta_file = self.path / "meta.json"
+        if not meta_file.exists():
+            return False
+        with open(meta_file, "r") as f:
+            return json.load(f) == self.meta
+
+    def _create(self):
+        tmp = self.path.with_name(self.path.name + f".tmp{os.getpid()}")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        height, width = self.size
+        np.lib.format.open_memmap(
+            tmp / "images.npy",
+            mode="w+",
+            dtype=np.uint8,
+            shape=(self.num_items, height, width, 3),
+        ).flush()
+        np.save(tmp / "filled.npy", np.zeros(self.num_items, dtype=np.uint8))
+        with open(tmp / "meta.json", "w") as f:
+            json.dump(self.meta, f)
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        os.replace(tmp, self.path)
+
+    def _arrays(self):
+        # Map lazily and once per process, so forked workers get their own mapping
+        if self._pid != os.getpid():
+            self._images = np.load(self.path / "images.npy", mmap_mode="r+")
+            self._filled = np.load(self.path / "filled.npy", mmap_mode="r+")
+            self._pid = os.getpid()
+        return self._images, self._filled
+
+    def __len__(self) -> int:
+        return self.num_items
+
+    def __contains__(self, idx: int) -> bool:
+        return bool(self._arrays()[1][idx])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_pid=None, _images=None, _filled=None)
+        return state
+
+    def get(self, idx: int):
+        """
+        Get a cached image.
+
+        Returns:
+            Read-only ``(H, W, 3)`` view into the cache, or None if the item
+            has not been decoded yet
+        """
+        images, filled = self._arrays()
+        if not filled[idx]:
+            return None
+        view = images[idx]
+        view.flags.writeable = False
+        return view
+
+    def put(self, idx: int, image):
+        """Store a decoded ``(H, W, 3)`` uint8 image."""
+        images, filled = self._arrays()
+        images[idx] = image
+        filled[idx] = 1
+
+    def missing(self, indices: Optional[Sequence[int]] = None) -> list:
+        """Indices (all items by default) that are not cached yet."""
+        filled = self._arrays()[1]
+        if indices is None:
+            return np.flatnonzero(np.asarray(filled) == 0).tolist()
+        return [idx for idx in indices if not filled[idx]]
+
+    def flush(self):
+        """Write cached pixels and flags back to disk."""
+        if self._images is not None:
+            self._images.flush()
+            self._filled.flush()
@@ -0,0 +1,110 @@
+"""
+Leaderboard of several models evaluated on the same split
+
+Models are ranked per task on the task's primary metric (the first metric
+listed under ``evaluation.metrics``) and ordered by their mean rank over the
+tasks, which does not depend on the scale of the individual metrics.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from .metrics import TASK_METRICS
+from .tasks import TASKS
+
+
+def primary_metric(task: str, config: Optional[Dict[str, Any]] = None) -> str:
+    """Metric a task is ranked on: the first one configured, else the metric's first."""
+    configured = (config or {}).get("evaluation", {}).get("metrics", {}).get(task)
+    return configured[0] if configured else TASK_METRICS[task].names[0]
+
+
+def leaderboard(
+    results: Dict[str, Dict[str, Dict[str, float]]],
+    config: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Rank models by their mean per-task rank.
+
+    Args:
+        results: Results per task, per model name
+        config: Benchmark configuration
+
+    Returns:
+        One row per model, best first, with ``rank``, ``model``,
+        ``mean_rank``, ``scores`` (primary metric per task) and ``results``
+    """
+    tasks = [task for task in TASKS if any(task in tasks for tasks in results.values())]
+    ranks: Dict[str, List[int]] = {model: [] for model in results}
+    scores: Dict[str, Dict[str, float]] = {model: {} for model in results}
+    for task in tasks:
+        metric = primary_metric(task, config)
+        values = {
+            model: tasks_results[task][metric]
+            for model, tasks_results in results.items()
+            if metric in tasks_results.get(task, {})
+        }
+        for model, value in values.items():
+            scores[model][task] = value
+            # Tied models share the better rank
+            ranks[model].append(1 + sum(other > value for other in values.values()))
+
+    rows = [
+        {
+            "model": model,
+            "mean_rank": (
+                sum(ranks[model]) / len(ranks[model]) if ranks[model] else float("inf")
+            ),
+            "scores": scores[model],
+            "results": results[model],
+        }
+        for model in results
+    ]
+    rows.sort(key=lambda row: (row["mean_rank"], row["model"]))
+    for position, row in enumerate(rows):
+        row["rank"] = position + 1
+    return rows
+
+
+def format_leaderboard(
+    rows: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None
+) -> str:
+    """Format leaderboard rows as a Markdown table."""
+    tasks = [task for task in TASKS if any(task in row["scores"] for row in rows)]
+    header = [f"{task} ({primary_metric(task, config)})" for task in tasks]
+    lines = [
+        "| rank | model | mean rank | " + " | ".join(header) + " |",
+        "|---:|---|---:|" + "---:|" * len(tasks),
+    ]
+    for row in rows:
+        cells = [
+            f"{row['scores'][task]:.4f}" if task in row["scores"] else "-"
+            for task in tasks
+        ]
+        lines.append(
+            f"| {row['rank']} | {row['model']} | {row['mean_rank']:.2f} | "
+            + " | ".join(cells)
+            + " |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_leaderboard(
+    rows: List[Dict[str, Any]],
+    output_dir: Union[str, Path],
+    config: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """
+    Write ``leaderboard.json`` and ``leaderboard.md`` to a directory.
+
+    Returns:
+        Path of the Markdown leaderboard
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / "leaderboard.json", "w") as f:
+        json.dump(rows, f, indent=2, default=float)
+    path = output_dir / "leaderboard.md"
+    path.write_text(format_leaderboard(rows, config))
+    return path
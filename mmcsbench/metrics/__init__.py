@@ -0,0 +1,143 @@
+"""
+Mergeable metric accumulators for MMCSBench tasks
+"""
+
+from typing import Any, Dict, Iterable, Optional
+
+from ..tasks import task_queries
+from .answers import AnswerIndex, answer_index
+from .base import Metric
+from .captioning import CaptionMetric, CiderCorpus, ReasoningMetric, score_captions
+from .classification import ClassificationMetric
+from .detection import DetectionMetric
+
+TASK_METRICS = {
+    "detection": DetectionMetric,
+    "classification": ClassificationMetric,
+    "reasoning": ReasoningMetric,
+    "description": CaptionMetric,
+}
+
+
+def build_metric(
+    task: str,
+    config: Optional[Dict[str, Any]] = None,
+    corpus: Optional[CiderCorpus] = None,
+) -> Metric:
+    """
+    Create the metric accumulator of a task.
+
+    Args:
+        task: Task name
+        config: Benchmark configuration
+        corpus: Precomputed CIDEr-D document frequencies for the reasoning
+            and description tasks
+
+    Returns:
+        Empty accumulator
+    """
+    if task not in TASK_METRICS:
+        raise ValueError(f"Unknown task: {task}")
+    if corpus is not None and issubclass(TASK_METRICS[task], CaptionMetric):
+        return TASK_METRICS[task](config, corpus=corpus)
+    return TASK_METRICS[task](config)
+
+
+def build_corpus(
+    task: str, dataset, config: Optional[Dict[str, Any]] = None
+) -> Optional[CiderCorpus]:
+    """
+    CIDEr-D document frequencies over the references of a dataset split.
+
+    Args:
+        task: Task name
+        dataset: Dataset of the split
+        config: Benchmark configuration
+
+    Returns:
+        Corpus over the split's references, or None for tasks without
+        captioning metrics. For the reasoning task, the split's answers are
+        also added to the shared answer index.
+    """
+    queries = (
+        query
+        for idx in dataset.get_task_indices(task)
+        for query in task_queries(
+            task, dataset.get_annotation(idx).get("tasks", {}).get(task)
+        )
+    )
+    return _query_corpus(task, queries, config)
+
+
+def records_corpus(
+    task: str, records: Iterable[Dict], config: Optional[Dict[str, Any]] = None
+) -> Optional[CiderCorpus]:
+    """
+    CIDEr-D document frequencies over the references of prediction records.
+
+    Used when the split's annotations are not at hand, e.g. to rescore or
+    merge saved predictions: one streaming pass over the records, keeping
+    only the n-gram counts, so the metrics can then score as they go.
+
+    Args:
+        task: Task name
+        records: Prediction records of the whole split, one per query
+        config: Benchmark configuration
+
+    Returns:
+        Corpus over the records' references, or None for tasks without
+        captioning metrics
+    """
+    return _query_corpus(
+        task, (record.get("reference") or {} for record in records), config
+    )
+
+
+def _query_corpus(
+    task: str, queries: Iterable[Dict], config: Optional[Dict[str, Any]]
+) -> Optional[CiderCorpus]:
+    if task not in TASK_METRICS or not issubclass(TASK_METRICS[task], CaptionMetric):
+        return None
+    metric = build_metric(task, config)
+
+    def documents():
+        for query in queries:
+            if isinstance(metric, ReasoningMetric):
+                # Index the split's answers once, so matching only scans them
+                metric.index_answers((query,))
+            yield metric.references(query)
+
+    return CiderCorpus.from_references(documents())
+
+
+def select_metrics(
+    task: str, values: Dict[str, float], config: Optional[Dict[str, Any]] = None
+) -> Dict[str, float]:
+    """
+    Keep the metrics listed under ``evaluation.metrics.{task}``, in that order.
+
+    Tasks without a list keep every computed metric; listed names the task
+    does not compute are skipped.
+    """
+    names = (config or {}).get("evaluation", {}).get("metrics", {}).get(task)
+    if not names:
+        return values
+    return {name: values[name] for name in names if name in values}
+
+
+__all__ = [
+    "AnswerIndex",
+    "Metric",
+    "CaptionMetric",
+    "CiderCorpus",
+    "ClassificationMetric",
+    "DetectionMetric",
+    "ReasoningMetric",
+    "TASK_METRICS",
+    "answer_index",
+    "build_corpus",
+    "build_metric",
+    "records_corpus",
+    "score_captions",
+    "select_metrics",
+]
@@ -0,0 +1,234 @@
+"""
+Answer normalization and matching for reasoning accuracy
+
+Free-form answers are matched against the gold answer through an
+:class:`AnswerIndex`, a token trie over every answer phrase seen so far and
+their configured synonyms. A prediction is scanned once for all phrases it
+mentions; it is correct when, among the gold answer and the query's options,
+it mentions the gold answer and nothing else:
+
+* ``"It is a stick insect."`` matches ``"stick insect"``;
+* ``"a walking stick"`` matches it too if configured as a synonym;
+* ``"three"`` matches ``"3"``;
+* ``"a moth, not a leaf"`` is wrong when both are options;
+* ``"B."`` or ``"The answer is (B)"`` select the second option.
+
+Normalizing and scanning are memoized per distinct string, and answer phrases
+are tokenized and inserted once, so the repeated short answers LVLMs give cost
+a dictionary lookup each.
+
+Synonyms are configured per canonical answer::
+
+    tasks:
+      reasoning:
+        synonyms:
+          stick insect: ["walking stick", "phasmid"]
+"""
+
+import functools
+import json
+import re
+from typing import Any, Dict, FrozenSet, Optional, Sequence, Tuple
+
+from .text import normalize_answer
+
+#: Distinct predictions whose scan an index keeps
+SCAN_CACHE_SIZE = 1 << 18
+
+_NUMBER_WORDS = {
+    word: str(value)
+    for value, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen "
+        "fourteen fifteen sixteen seventeen eighteen nineteen twenty".split()
+    )
+}
+_NUMBER_WORDS.update(
+    {
+        word: str(10 * tens)
+        for tens, word in enumerate(
+            "thirty forty fifty sixty seventy eighty ninety".split(), start=3
+        )
+    }
+)
+
+# An option letter leading the answer ("B", "B. a moth", "(B) ..."), given
+# alone ("b") or introduced by "answer"/"option" ("The answer is (B)").
+# Letters followed by a word are not options, so the article in "A moth" is
+# not read as option A.
+_LEADING_LETTER = re.compile(r"^\W*\(?([A-Z])(?:[.):,]|\s*$)")
+_BARE_LETTER = re.compile(r"^\W*\(?([a-z])\)?\W*$")
+_NAMED_LETTER = re.compile(
+    r"\b(?i:answer|option|choice)\s*(?:is\s*)?:?\s*\(?([A-Z])(?:[.):,]|\s*$)"
+)
+
+_END = ""
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def answer_tokens(text: str) -> Tuple[str, ...]:
+    """Normalized tokens, with number words written as digits, memoized."""
+    return tuple(
+        _NUMBER_WORDS.get(token, token) for token in normalize_answer(text).split()
+    )
+
+
+def option_letter(text: str, num_options: int) -> Optional[int]:
+    """Index of the option a prediction selects by letter, or None."""
+    if not num_options:
+        return None
+    for pattern in (_LEADING_LETTER, _BARE_LETTER, _NAMED_LETTER):
+        match = pattern.search(text)
+        if match:
+            index = ord(match.group(1).lower()) - ord("a")
+            if 0 <= index < num_options:
+                return index
+    return None
+
+
+class AnswerIndex:
+    """
+    Token trie over answer phrases, mapping every phrase and synonym to a
+    canonical answer id.
+
+    Phrases are added as they are first seen, so one index serves every
+    split. Matching only considers the gold answer and the options of a
+    query, which are always added before the scan, so results do not depend
+    on which other phrases the index holds.
+    """
+
+    def __init__(self, synonyms: Optional[Dict[str, Sequence[str]]] = None):
+        """
+        Args:
+            synonyms: Alternative phrasings per canonical answer
+        """
+        self._trie: Dict[str, Any] = {}
+        self._ids: Dict[Tuple[str, ...], int] = {}
+        self._aliases: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        self._queries: Dict[
+            Tuple[str, Tuple[str, ...]], Tuple[int, Tuple[int, ...]]
+        ] = {}
+        self._scans: Dict[str, Tuple[Tuple[int, int, int], ...]] = {}
+        self._next_id = 0
+        for canonical, aliases in (synonyms or {}).items():
+            canonical_tokens = answer_tokens(str(canonical))
+            for alias in aliases:
+                self._aliases[answer_tokens(str(alias))] = canonical_tokens
+            self.add(str(canonical))
+
+    def __len__(self) -> int:
+        return self._next_id
+
+    def _insert(self, tokens: Tuple[str, ...], answer_id: int):
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if node.get(_END) != answer_id:
+            node[_END] = answer_id
+            self._scans.clear()
+
+    def add(self, phrase: str) -> Optional[int]:
+        """
+        Add an answer phrase and its synonyms.
+
+        Returns:
+            Canonical answer id, or None if the phrase is empty after normalization
+        """
+        tokens = answer_tokens(phrase)
+        if not tokens:
+            return None
+        canonical = self._aliases.get(tokens, tokens)
+        if canonical in self._ids:
+            answer_id = self._ids[canonical]
+            if tokens != canonical and tokens not in self._ids:
+                self._ids[tokens] = answer_id
+                self._insert(tokens, answer_id)
+            return answer_id
+        answer_id = self._ids[canonical] = self._next_id
+        self._next_id += 1
+        self._insert(canonical, answer_id)
+        for alias, target in self._aliases.items():
+            if target == canonical:
+                self._ids[alias] = answer_id
+                self._insert(alias, answer_id)
+        if tokens != canonical:
+            self._ids[tokens] = answer_id
+        return answer_id
+
+    def mentions(self, text: str) -> Tuple[Tuple[int, int, int], ...]:
+        """Every ``(start, end, answer id)`` phrase occurrence, including overlaps."""
+        if text in self._scans:
+            return self._scans[text]
+        tokens = answer_tokens(text)
+        found = []
+        for start in range(len(tokens)):
+            node = self._trie
+            for end in range(start, len(tokens)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                if _END in node:
+                    found.append((start, end + 1, node[_END]))
+        if len(self._scans) >= SCAN_CACHE_SIZE:
+            self._scans.clear()
+        found = self._scans[text] = tuple(found)
+        return found
+
+    def add_query(
+        self, answer: str, options: Sequence[str] = ()
+    ) -> Tuple[Optional[int], Tuple]:
+        """Canonical ids of a gold answer and of the options, added on first use."""
+        key = (answer, tuple(options))
+        if key not in self._queries:
+            self._queries[key] = (self.add(answer), tuple(self.add(o) for o in options))
+        return self._queries[key]
+
+    def matches(
+        self, prediction: str, answer: str, options: Sequence[str] = ()
+    ) -> bool:
+        """
+        Check a free-form prediction against a gold answer.
+
+        Args:
+            prediction: Model output
+            answer: Gold answer text
+            options: Option texts of a multiple-choice question
+
+        Returns:
+            True if the prediction selects the gold option by letter, or
+            mentions the gold answer and no other option
+        """
+        gold, option_ids = self.add_query(answer, options)
+        if gold is None:
+            return False
+        letter = option_letter(prediction, len(options))
+        if letter is not None:
+            return option_ids[letter] == gold
+        return self._mentioned(prediction, frozenset(option_ids) | {gold}) == {gold}
+
+    def _mentioned(self, prediction: str, candidates: FrozenSet[int]) -> set:
+        spans = [m for m in self.mentions(prediction) if m[2] in candidates]
+        # "leaf moth" mentions "moth" only as part of the longer option
+        return {
+            answer_id
+            for start, end, answer_id in spans
+            if not any(
+                s <= start and end <= e and (s, e) != (start, end) for s, e, _ in spans
+            )
+        }
+
+
+#: Synonym configurations whose answer index is kept
+INDEX_CACHE_SIZE = 8
+
+
+@functools.lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _shared_index(synonyms: str) -> AnswerIndex:
+    return AnswerIndex(json.loads(synonyms))
+
+
+def answer_index(config: Optional[Dict[str, Any]] = None) -> AnswerIndex:
+    """Shared answer index for the synonyms of one of the last few configurations."""
+    synonyms = (config or {}).get("tasks", {}).get("reasoning", {}).get(
+        "synonyms"
+    ) or {}
+    return _shared_index(json.dumps(synonyms, sort_keys=True))
@@ -0,0 +1,75 @@
+"""
+Base class for mergeable metric accumulators
+"""
+
+from typing import Any, Dict, Iterable, Optional
+
+
+def prediction_text(prediction: Any) -> str:
+    """Convert a model prediction to text."""
+    if prediction is None:
+        return ""
+    if isinstance(prediction, dict):
+        for key in ("text", "answer", "output"):
+            if key in prediction:
+                return str(prediction[key])
+    return str(prediction)
+
+
+class Metric:
+    """
+    Accumulates sufficient statistics over prediction records.
+
+    Subclasses keep only statistics that can be summed, so accumulators built
+    on different shards of a split can be merged and computed once, giving
+    exactly the same result as a single run over the whole split.
+    """
+
+    #: Names of the values returned by :meth:`compute`
+    names = ()
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Initialize the accumulator.
+
+        Args:
+            config: Benchmark configuration
+        """
+        self.config = config or {}
+
+    def update(self, records: Iterable[Dict]) -> "Metric":
+        """
+        Add prediction records.
+
+        Args:
+            records: Records with ``prediction`` and ``reference`` fields
+
+        Returns:
+            The accumulator itself
+        """
+        for record in records:
+            self.add(record.get("prediction"), record.get("reference") or {})
+        return self
+
+    def add(self, prediction: Any, reference: Dict):
+        """Add a single prediction and its reference annotation."""
+        raise NotImplementedError
+
+    def merge(self, other: "Metric") -> "Metric":
+        """
+        Merge the statistics of another accumulator of the same type.
+
+        Returns:
+            The accumulator itself
+        """
+        raise NotImplementedError
+
+    def compute(self) -> Dict[str, float]:
+        """Compute the final metric values."""
+        raise NotImplementedError
+
+    def _check_mergeable(self, other: "Metric"):
+        if type(other) is not type(self):
+            raise TypeError(
+                f"Cannot merge {type(other).__name__} into {type(self).__name__}"
+            )
@@ -0,0 +1,523 @@
+"""
+Captioning metrics (BLEU, METEOR, ROUGE-L, CIDEr-D) for reasoning and description tasks
+
+Native Python implementation of the COCO caption metrics. Every distinct
+text is tokenized and counted once (see :func:`analyze`), ROUGE-L uses a
+bit-parallel LCS, and CIDEr-D document frequencies can be computed once per
+split with :class:`CiderCorpus` and shared by every model scored on it.
+:func:`score_captions` scores a whole corpus in one pass, e.g. to rescore
+cached predictions.
+"""
+
+import functools
+import math
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .answers import answer_index
+from .base import Metric, prediction_text
+from .text import all_ngram_counts, tokenize
+
+MAX_N = 4
+CIDER_SIGMA = 6.0
+
+#: Per-sample statistics returned by :meth:`CaptionMetric.sample_statistics`
+SAMPLE_STATISTICS = tuple(
+    [f"match_{n}" for n in range(1, MAX_N + 1)]
+    + [f"total_{n}" for n in range(1, MAX_N + 1)]
+    + ["hyp_len", "ref_len", "rouge_l", "meteor", "cider"]
+)
+ROUGE_BETA = 1.2
+
+
+class TextEntry:
+    """Tokens and n-gram count tables of one text."""
+
+    __slots__ = ("tokens", "counts", "bigrams", "_masks")
+
+    def __init__(self, text: str):
+        self.tokens = tuple(tokenize(text))
+        self.counts = all_ngram_counts(self.tokens, MAX_N)
+        # CIDEr-D measures length by the number of bigrams
+        self.bigrams = max(len(self.tokens) - 1, 0)
+        self._masks = None
+
+    @property
+    def masks(self) -> Dict[str, int]:
+        """Bit mask of the positions of every token, for bit-parallel LCS."""
+        if self._masks is None:
+            masks: Dict[str, int] = {}
+            for position, token in enumerate(self.tokens):
+                masks[token] = masks.get(token, 0) | (1 << position)
+            self._masks = masks
+        return self._masks
+
+
+@functools.lru_cache(maxsize=1 << 17)
+def analyze(text: str) -> TextEntry:
+    """Tokenize and count a text, memoized across calls and models."""
+    return TextEntry(text)
+
+
+def bleu_from_stats(
+    matches: Sequence[int], totals: Sequence[int], hyp_len: int, ref_len: int, n: int
+) -> float:
+    """
+    Corpus BLEU-n from clipped n-gram match counts.
+
+    Args:
+        matches: Clipped matches per n-gram order
+        totals: Candidate n-grams per order
+        hyp_len: Total candidate length
+        ref_len: Total closest-reference length
+        n: Maximum n-gram order
+
+    Returns:
+        BLEU score in [0, 1]
+    """
+    if hyp_len == 0:
+        return 0.0
+    tiny = 1e-9
+    log_precision = (
+        sum(math.log((matches[k] + tiny) / (totals[k] + tiny)) for k in range(n)) / n
+    )
+    brevity = 1.0 if hyp_len > ref_len else math.exp(1 - ref_len / hyp_len)
+    return brevity * math.exp(log_precision)
+
+
+def lcs_length(
+    a: Sequence[str], b: Sequence[str], masks: Optional[Dict[str, int]] = None
+) -> int:
+    """
+    Length of the longest common subsequence of two token sequences.
+
+    Bit-parallel algorithm (Hyyrö, 2004): the DP column over ``b`` is one
+    integer, updated with a few word operations per token of ``a``.
+
+    Args:
+        a: First token sequence
+        b: Second token sequence
+        masks: Precomputed token position masks of ``b``
+
+    Returns:
+        LCS length
+    """
+    if not a or not b:
+        return 0
+    if masks is None:
+        masks = {}
+        for position, token in enumerate(b):
+            masks[token] = masks.get(token, 0) | (1 << position)
+    full = (1 << len(b)) - 1
+    v = full
+    for token in a:
+        match = masks.get(token)
+        if match:
+            u = v & match
+            v = ((v + u) | (v - u)) & full
+    return len(b) - bin(v).count("1")
+
+
+def _rouge_l(candidate: TextEntry, references: Sequence[TextEntry]) -> float:
+    if not candidate.tokens:
+        return 0.0
+    precision = recall = 0.0
+    for reference in references:
+        if not reference.tokens:
+            continue
+        lcs = lcs_length(candidate.tokens, reference.tokens, reference.masks)
+        precision = max(precision, lcs / len(candidate.tokens))
+        recall = max(recall, lcs / len(reference.tokens))
+    if precision == 0 or recall == 0:
+        return 0.0
+    beta2 = ROUGE_BETA**2
+    return (1 + beta2) * precision * recall / (recall + beta2 * precision)
+
+
+def rouge_l(candidate: str, references: Sequence[str]) -> float:
+    """Sentence ROUGE-L F-measure against the best-matching references."""
+    return _rouge_l(analyze(candidate), [analyze(r) for r in references])
+
+
+def _meteor(candidate: TextEntry, references: Sequence[TextEntry]) -> float:
+    best = 0.0
+    hyp = candidate.tokens
+    for reference in references:
+        ref = reference.tokens
+        if not hyp or not ref:
+            continue
+        positions: Dict[str, List[int]] = {}
+        for position, token in enumerate(ref):
+            positions.setdefault(token, []).append(position)
+        used = set()
+        aligned = []
+        previous = -2
+        for token in hyp:
+            free = [p for p in positions.get(token, ()) if p not in used]
+            if not free:
+                continue
+            # Prefer extending the current chunk
+            position = previous + 1 if previous + 1 in free else free[0]
+            used.add(position)
+            aligned.append(position)
+            previous = position
+        matches = len(aligned)
+        if not matches:
+            continue
+        chunks = 1 + sum(1 for x, y in zip(aligned, aligned[1:]) if y != x + 1)
+        precision = matches / len(hyp)
+        recall = matches / len(ref)
+        fmean = 10 * precision * recall / (recall + 9 * precision)
+        penalty = 0.5 * (chunks / matches) ** 3
+        best = max(best, fmean * (1 - penalty))
+    return best
+
+
+def meteor(candidate: str, references: Sequence[str]) -> float:
+    """
+    Sentence METEOR with exact unigram matching.
+
+    Uses the original METEOR F-mean and fragmentation penalty; the stemming
+    and synonym modules of the Java implementation are not applied.
+    """
+    return _meteor(analyze(candidate), [analyze(r) for r in references])
+
+
+class CiderCorpus:
+    """
+    CIDEr-D document frequencies of a reference corpus.
+
+    Build it once per split with :meth:`from_references`; the TF-IDF vectors
+    of reference texts are cached on the corpus.
+    """
+
+    def __init__(self, df: Counter, num_docs: int):
+        """
+        Args:
+            df: Number of documents whose references contain each n-gram
+            num_docs: Number of documents
+        """
+        self.df = df
+        self.num_docs = num_docs
+        self.log_docs = math.log(float(num_docs)) if num_docs else 0.0
+        self._vectors: Dict[str, Tuple[List[Dict], List[float]]] = {}
+
+    @staticmethod
+    def document_ngrams(references: Sequence[str]) -> set:
+        """Distinct n-grams of one document's references."""
+        return {
+            g for text in references for order in analyze(text).counts for g in order
+        }
+
+    @classmethod
+    def from_references(cls, documents: Iterable[Sequence[str]]) -> "CiderCorpus":
+        """
+        Count document frequencies over the references of a split.
+
+        Args:
+            documents: Reference texts of every sample
+
+        Returns:
+            Corpus over the documents that have at least one reference
+        """
+        df: Counter = Counter()
+        num_docs = 0
+        for references in documents:
+            if not references:
+                continue
+            df.update(cls.document_ngrams(references))
+            num_docs += 1
+        return cls(df, num_docs)
+
+    def _vector(self, entry: TextEntry) -> Tuple[List[Dict], List[float]]:
+        vectors, norms = [], []
+        for order in entry.counts:
+            vector = {
+                g: tf * (self.log_docs - math.log(max(1.0, self.df[g])))
+                for g, tf in order.items()
+            }
+            vectors.append(vector)
+            norms.append(math.sqrt(sum(v * v for v in vector.values())))
+        return vectors, norms
+
+    def _reference_vector(self, text: str) -> Tuple[List[Dict], List[float]]:
+        cached = self._vectors.get(text)
+        if cached is None:
+            cached = self._vectors[text] = self._vector(analyze(text))
+        return cached
+
+    def score(self, candidate: str, references: Sequence[str]) -> float:
+        """CIDEr-D of one candidate (x10, as in the reference implementation)."""
+        if not references or not self.num_docs:
+            return 0.0
+        hyp = analyze(candidate)
+        hyp_vec, hyp_norm = self._vector(hyp)
+        score = 0.0
+        for text in references:
+            ref_vec, ref_norm = self._reference_vector(text)
+            delta = hyp.bigrams - analyze(text).bigrams
+            penalty = math.exp(-(delta**2) / (2 * CIDER_SIGMA**2))
+            for n in range(MAX_N):
+                if hyp_norm[n] == 0 or ref_norm[n] == 0:
+                    continue
+                ref_n = ref_vec[n]
+                overlap = sum(
+                    min(v, ref_n[g]) * ref_n[g]
+                    for g, v in hyp_vec[n].items()
+                    if g in ref_n
+                )
+                score += penalty * overlap / (hyp_norm[n] * ref_norm[n])
+        return score / MAX_N / len(references) * 10.0
+
+
+class CaptionMetric(Metric):
+    """
+    Corpus-level BLEU-1..4, METEOR, ROUGE-L and CIDEr-D.
+
+    BLEU keeps clipped n-gram match and length counts; METEOR and ROUGE-L
+    keep running sums of sentence scores. With a fixed :class:`CiderCorpus`
+    CIDEr-D is scored as samples arrive and kept as a sum too. Without one,
+    the accumulator sums reference document frequencies and keeps the
+    sample texts, so shards merge exactly and CIDEr-D is computed once; that
+    fallback grows with the number of samples, so evaluation, merging and
+    rescoring always pass a corpus (see :func:`records_corpus`).
+    """
+
+    names = ("bleu_1", "bleu_4", "meteor", "cider", "rouge_l")
+
+    def __init__(
+        self,
+        config: Optional[Dict[str, Any]] = None,
+        corpus: Optional[CiderCorpus] = None,
+    ):
+        """
+        Args:
+            config: Benchmark configuration
+            corpus: Precomputed CIDEr-D document frequencies of the split
+        """
+        super().__init__(config)
+        self.corpus = corpus
+        self.matches = [0] * MAX_N
+        self.totals = [0] * MAX_N
+        self.hyp_len = 0
+        self.ref_len = 0
+        self.rouge_sum = 0.0
+        self.meteor_sum = 0.0
+        self.cider_sum = 0.0
+        self.count = 0
+        self.df: Counter = Counter()
+        self.samples: List[Tuple[str, List[str]]] = []
+
+    def references(self, reference: Dict) -> List[str]:
+        """Reference texts of an annotation."""
+        if "captions" in reference:
+            return [str(c) for c in reference["captions"]]
+        if "caption" in reference:
+            return [str(reference["caption"])]
+        return []
+
+    def sample_statistics(
+        self, prediction: Any, reference: Dict
+    ) -> Optional[List[float]]:
+        """
+        Additive statistics of one sample, in the order of :data:`SAMPLE_STATISTICS`.
+
+        CIDEr-D is 0 unless the metric has a :class:`CiderCorpus`.
+
+        Returns:
+            Statistics, or None if the reference has no texts
+        """
+        references = self.references(reference)
+        if not references:
+            return None
+        text = prediction_text(prediction)
+        candidate = analyze(text)
+        entries = [analyze(r) for r in references]
+        hyp_len = len(candidate.tokens)
+        matches = []
+        for n in range(MAX_N):
+            matched = 0
+            for gram, count in candidate.counts[n].items():
+                max_ref = max(entry.counts[n].get(gram, 0) for entry in entries)
+                matched += min(count, max_ref)
+            matches.append(matched)
+        totals = [max(hyp_len - n, 0) for n in range(MAX_N)]
+        ref_len = min((abs(len(e.tokens) - hyp_len), len(e.tokens)) for e in entries)[1]
+        cider = self.corpus.score(text, references) if self.corpus is not None else 0.0
+        return (
+            matches
+            + totals
+            + [
+                hyp_len,
+                ref_len,
+                _rouge_l(candidate, entries),
+                _meteor(candidate, entries),
+                cider,
+            ]
+        )
+
+    def add(self, prediction: Any, reference: Dict):
+        self.count += 1
+        stats = self.sample_statistics(prediction, reference)
+        if stats is None:
+            return
+        for n in range(MAX_N):
+            self.matches[n] += stats[n]
+            self.totals[n] += stats[MAX_N + n]
+        hyp_len, ref_len, rouge, meteor_score, cider = stats[2 * MAX_N :]
+        self.hyp_len += hyp_len
+        self.ref_len += ref_len
+        self.rouge_sum += rouge
+        self.meteor_sum += meteor_score
+
+        if self.corpus is not None:
+            self.cider_sum += cider
+        else:
+            references = self.references(reference)
+            self.df.update(CiderCorpus.document_ngrams(references))
+            self.samples.append((prediction_text(prediction), references))
+
+    def merge(self, other: "CaptionMetric") -> "CaptionMetric":
+        self._check_mergeable(other)
+        if (self.corpus is None) != (other.corpus is None) or (
+            self.corpus is not None and self.corpus.df != other.corpus.df
+        ):
+            raise ValueError(
+                "Cannot merge caption metrics scored against different CIDEr corpora"
+            )
+        for n in range(MAX_N):
+            self.matches[n] += other.matches[n]
+            self.totals[n] += other.totals[n]
+        self.hyp_len += other.hyp_len
+        self.ref_len += other.ref_len
+        self.rouge_sum += other.rouge_sum
+        self.meteor_sum += other.meteor_sum
+        self.cider_sum += other.cider_sum
+        self.count += other.count
+        self.df.update(other.df)
+        self.samples.extend(other.samples)
+        return self
+
+    def _cider(self) -> float:
+        if self.corpus is not None:
+            return self.cider_sum / self.count if self.count else 0.0
+        if not self.samples:
+            return 0.0
+        corpus = CiderCorpus(self.df, len(self.samples))
+        return sum(corpus.score(text, refs) for text, refs in self.samples) / len(
+            self.samples
+        )
+
+    def caption_scores(self) -> Dict[str, float]:
+        """Compute all captioning scores."""
+        scores = {
+            f"bleu_{n}": bleu_from_stats(
+                self.matches, self.totals, self.hyp_len, self.ref_len, n
+            )
+            for n in range(1, MAX_N + 1)
+        }
+        scores["rouge_l"] = self.rouge_sum / self.count if self.count else 0.0
+        scores["meteor"] = self.meteor_sum / self.count if self.count else 0.0
+        scores["cider"] = self._cider()
+        return scores
+
+    def compute(self) -> Dict[str, float]:
+        scores = self.caption_scores()
+        return {name: scores[name] for name in self.names}
+
+
+class ReasoningMetric(CaptionMetric):
+    """
+    Answer accuracy plus captioning scores against the gold answers.
+
+    Free-form answers are matched against the gold answer and the options with
+    the configuration's :class:`~.answers.AnswerIndex`; multiple-choice
+    answers given as an option letter select that option.
+    """
+
+    names = ("accuracy", "bleu_score", "rouge_l", "cider_score")
+
+    def __init__(
+        self,
+        config: Optional[Dict[str, Any]] = None,
+        corpus: Optional[CiderCorpus] = None,
+    ):
+        super().__init__(config, corpus)
+        self.correct = 0
+        self.answers = answer_index(config)
+
+    def gold_answer(self, reference: Dict) -> Optional[str]:
+        """Gold answer text, with option letters resolved to the option."""
+        if "answer" not in reference:
+            return None
+        answer = str(reference["answer"])
+        options = reference.get("options") or []
+        letter = answer.strip().rstrip(".)").lower()
+        if len(letter) == 1 and "a" <= letter < chr(ord("a") + len(options)):
+            return str(options[ord(letter) - ord("a")])
+        return answer
+
+    def references(self, reference: Dict) -> List[str]:
+        if reference.get("references"):
+            return [str(r) for r in reference["references"]]
+        answer = self.gold_answer(reference)
+        return [answer] if answer is not None else []
+
+    def add(self, prediction: Any, reference: Dict):
+        super().add(prediction, reference)
+        self.correct += int(self.is_correct(prediction_text(prediction), reference))
+
+    def index_answers(self, references: Iterable[Dict]):
+        """Add the gold answers and options of a split to the answer index up front."""
+        for reference in references:
+            answer = self.gold_answer(reference)
+            if answer is not None:
+                self.answers.add_query(
+                    answer, [str(o) for o in reference.get("options") or []]
+                )
+
+    def is_correct(self, prediction: str, reference: Dict) -> bool:
+        """Check whether a prediction matches the gold answer."""
+        answer = self.gold_answer(reference)
+        if answer is None:
+            return False
+        options = [str(o) for o in reference.get("options") or []]
+        return self.answers.matches(prediction, answer, options)
+
+    def merge(self, other: "ReasoningMetric") -> "ReasoningMetric":
+        super().merge(other)
+        self.correct += other.correct
+        return self
+
+    def compute(self) -> Dict[str, float]:
+        scores = self.caption_scores()
+        return {
+            "accuracy": self.correct / self.count if self.count else 0.0,
+            "bleu_score": scores["bleu_4"],
+            "rouge_l": scores["rouge_l"],
+            "cider_score": scores["cider"],
+        }
+
+
+def score_captions(
+    candidates: Sequence[str],
+    references: Sequence[Sequence[str]],
+    corpus: Optional[CiderCorpus] = None,
+) -> Dict[str, float]:
+    """
+    Score a corpus of captions in one pass.
+
+    Args:
+        candidates: Candidate texts
+        references: Reference texts per candidate
+        corpus: CIDEr-D document frequencies. Computed from ``references`` if not given.
+
+    Returns:
+        BLEU-1..4, METEOR, ROUGE-L and CIDEr-D
+    """
+    if corpus is None:
+        corpus = CiderCorpus.from_references(references)
+    metric = CaptionMetric(corpus=corpus)
+    for candidate, refs in zip(candidates, references):
+        metric.add(candidate, {"captions": list(refs)})
+    return metric.caption_scores()
@@ -0,0 +1,116 @@
+"""
+Classification metrics
+"""
+
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .base import Metric, prediction_text
+
+DEFAULT_CATEGORIES = ["animal", "military", "adaptive", "natural"]
+
+
+def rank_labels(prediction: Any, labels: Sequence[str]) -> List[str]:
+    """
+    Extract a ranked list of labels from a prediction.
+
+    A list prediction is taken as an explicit ranking. For text, labels are
+    ranked by where they are first mentioned.
+
+    Args:
+        prediction: Model prediction
+        labels: Known labels
+
+    Returns:
+        Ranked labels (possibly empty)
+    """
+    if isinstance(prediction, (list, tuple)):
+        return [str(label).strip().lower() for label in prediction]
+    text = prediction_text(prediction).lower()
+    positions = []
+    for label in labels:
+        match = re.search(r"\b" + re.escape(label.lower()) + r"\b", text)
+        if match:
+            positions.append((match.start(), label.lower()))
+    return [label for _, label in sorted(positions)]
+
+
+class ClassificationMetric(Metric):
+    """
+    Accuracy, top-5 accuracy and macro/weighted F1 from a confusion table.
+
+    The state is a sparse confusion matrix keyed on (gold, predicted) labels
+    plus the top-5 hit count, all of which merge by summation.
+    """
+
+    names = ("accuracy", "top5_accuracy", "macro_f1", "weighted_f1")
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        super().__init__(config)
+        task_config = self.config.get("tasks", {}).get("classification", {})
+        self.labels = [
+            c.lower() for c in task_config.get("categories", DEFAULT_CATEGORIES)
+        ]
+        self.confusion: Counter = Counter()
+        self.top5_hits = 0
+        self.total = 0
+
+    def classify(
+        self, prediction: Any, reference: Dict
+    ) -> Tuple[str, Optional[str], bool]:
+        """
+        Classify one sample.
+
+        Returns:
+            ``(gold label, predicted label or None, whether gold is in the top 5)``
+        """
+        gold = str(reference.get("label", reference.get("category", ""))).lower()
+        labels = self.labels if gold in self.labels else self.labels + [gold]
+        ranked = rank_labels(prediction, labels)
+        return gold, ranked[0] if ranked else None, gold in ranked[:5]
+
+    def add(self, prediction: Any, reference: Dict):
+        gold, predicted, top5 = self.classify(prediction, reference)
+        self.confusion[(gold, predicted)] += 1
+        self.top5_hits += int(top5)
+        self.total += 1
+
+    def merge(self, other: "ClassificationMetric") -> "ClassificationMetric":
+        self._check_mergeable(other)
+        self.confusion.update(other.confusion)
+        self.top5_hits += other.top5_hits
+        self.total += other.total
+        return self
+
+    def compute(self) -> Dict[str, float]:
+        if not self.total:
+            return {name: 0.0 for name in self.names}
+
+        true_positive: Counter = Counter()
+        predicted: Counter = Counter()
+        support: Counter = Counter()
+        for (gold, guess), count in self.confusion.items():
+            support[gold] += count
+            if guess is not None:
+                predicted[guess] += count
+            if gold == guess:
+                true_positive[gold] += count
+
+        labels = set(support) | set(predicted)
+        f1 = {}
+        for label in labels:
+            precision = (
+                true_positive[label] / predicted[label] if predicted[label] else 0.0
+            )
+            recall = true_positive[label] / support[label] if support[label] else 0.0
+            total = precision + recall
+            f1[label] = 2 * precision * recall / total if total else 0.0
+
+        return {
+            "accuracy": sum(true_positive.values()) / self.total,
+            "top5_accuracy": self.top5_hits / self.total,
+            "macro_f1": sum(f1.values()) / len(labels),
+            "weighted_f1": sum(f1[label] * support[label] for label in support)
+            / self.total,
+        }
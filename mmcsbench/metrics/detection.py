@@ -0,0 +1,497 @@
+"""
+Detection metrics
+
+Detection is evaluated class-agnostically: every predicted box is matched
+against the ground-truth boxes of its image. Predictions may be
+
+- a dict with ``boxes`` (and optional ``scores``),
+- a list of ``[x1, y1, x2, y2]`` or ``[x1, y1, x2, y2, score]`` entries, or
+- text containing ``[x1, y1, x2, y2]`` boxes, scored by the order in which
+  they are mentioned.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .base import Metric, prediction_text
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+
+_NUMBER = r"-?\d+(?:\.\d+)?"
+_BOX_PATTERN = re.compile(
+    r"[\[(]\s*("
+    + _NUMBER
+    + r")\s*,\s*("
+    + _NUMBER
+    + r")\s*,\s*("
+    + _NUMBER
+    + r")\s*,\s*("
+    + _NUMBER
+    + r")\s*[\])]"
+)
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """
+    Pairwise IoU of two sets of ``[x1, y1, x2, y2]`` boxes.
+
+    Args:
+        boxes1: Array of shape (N, 4)
+        boxes2: Array of shape (M, 4)
+
+    Returns:
+        IoU matrix of shape (N, M)
+    """
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)
+    area1 = np.clip(boxes1[:, 2] - boxes1[:, 0], 0, None) * np.clip(
+        boxes1[:, 3] - boxes1[:, 1], 0, None
+    )
+    area2 = np.clip(boxes2[:, 2] - boxes2[:, 0], 0, None) * np.clip(
+        boxes2[:, 3] - boxes2[:, 1], 0, None
+    )
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    union = area1[:, None] + area2[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def parse_boxes(prediction: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extract boxes and confidence scores from a prediction.
+
+    Args:
+        prediction: Model prediction
+
+    Returns:
+        ``(boxes, scores)`` arrays of shape (K, 4) and (K,)
+    """
+    scores = None
+    if isinstance(prediction, dict) and "boxes" in prediction:
+        boxes = np.asarray(prediction["boxes"], dtype=np.float64).reshape(-1, 4)
+        if prediction.get("scores") is not None:
+            scores = np.asarray(prediction["scores"], dtype=np.float64).reshape(-1)
+    elif isinstance(prediction, np.ndarray) or (
+        isinstance(prediction, (list, tuple))
+        and prediction
+        and all(isinstance(box, (list, tuple)) and len(box) >= 4 for box in prediction)
+    ):
+        try:
+            array = np.asarray(prediction, dtype=np.float64)
+        except ValueError:
+            # Mixed entries with and without scores
+            array = np.asarray([list(box)[:4] for box in prediction], dtype=np.float64)
+        array = array.reshape(len(array), -1)
+        boxes = array[:, :4]
+        if array.shape[1] > 4:
+            scores = array[:, 4]
+    else:
+        matches = _BOX_PATTERN.findall(prediction_text(prediction))
+        boxes = np.asarray(matches, dtype=np.float64).reshape(-1, 4)
+
+    if scores is None or len(scores) != len(boxes):
+        # Without confidences, earlier boxes rank higher
+        scores = 1.0 / (1.0 + np.arange(len(boxes)))
+    return boxes, scores
+
+
+def batched_box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """
+    Per-image pairwise IoU for a batch of padded box sets.
+
+    Args:
+        boxes1: Array of shape (I, N, 4)
+        boxes2: Array of shape (I, M, 4)
+
+    Returns:
+        IoU tensor of shape (I, N, M)
+    """
+    area1 = np.clip(boxes1[..., 2] - boxes1[..., 0], 0, None) * np.clip(
+        boxes1[..., 3] - boxes1[..., 1], 0, None
+    )
+    area2 = np.clip(boxes2[..., 2] - boxes2[..., 0], 0, None) * np.clip(
+        boxes2[..., 3] - boxes2[..., 1], 0, None
+    )
+    top_left = np.maximum(boxes1[:, :, None, :2], boxes2[:, None, :, :2])
+    bottom_right = np.minimum(boxes1[:, :, None, 2:], boxes2[:, None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    union = area1[:, :, None] + area2[:, None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def match_detections_batched(
+    ious: np.ndarray,
+    det_valid: np.ndarray,
+    gt_valid: np.ndarray,
+    thresholds: np.ndarray = IOU_THRESHOLDS,
+) -> np.ndarray:
+    """
+    Greedily match detections to ground truth for a batch of images.
+
+    Detections are processed by rank: at rank ``d`` every image's ``d``-th
+    detection takes its unmatched ground-truth box with the highest IoU above
+    the threshold. Images and IoU thresholds are matched simultaneously, so
+    the Python loop only runs over the maximum number of detections per image.
+
+    Args:
+        ious: IoU tensor of shape (I, D, G), detections sorted by score per image
+        det_valid: Mask of real (non-padding) detections, shape (I, D)
+        gt_valid: Mask of real ground-truth boxes, shape (I, G)
+        thresholds: IoU thresholds of shape (T,)
+
+    Returns:
+        Boolean true-positive tensor of shape (I, T, D)
+    """
+    num_images, num_det, num_gt = ious.shape
+    tp = np.zeros((num_images, len(thresholds), num_det), dtype=bool)
+    if num_det == 0 or num_gt == 0:
+        return tp
+    available = np.repeat(gt_valid[:, None, :], len(thresholds), axis=1)
+    above = ious[:, :, None, :] >= thresholds[None, None, :, None]
+    for d in range(num_det):
+        iou_d = ious[:, d, None, :]
+        candidates = np.where(available & above[:, d], iou_d, -1.0)
+        best = candidates.argmax(axis=2)
+        hit = np.take_along_axis(candidates, best[..., None], axis=2)[..., 0] >= 0
+        hit &= det_valid[:, d, None]
+        tp[:, :, d] = hit
+        image_idx, threshold_idx = np.nonzero(hit)
+        available[image_idx, threshold_idx, best[image_idx, threshold_idx]] = False
+    return tp
+
+
+def match_detections(
+    ious: np.ndarray, thresholds: np.ndarray = IOU_THRESHOLDS
+) -> np.ndarray:
+    """
+    Greedily match score-sorted detections of one image to its ground truth.
+
+    Args:
+        ious: IoU matrix of shape (detections, ground truths), rows sorted by score
+        thresholds: IoU thresholds of shape (T,)
+
+    Returns:
+        Boolean true-positive matrix of shape (T, detections)
+    """
+    num_det, num_gt = ious.shape
+    return match_detections_batched(
+        ious[None],
+        np.ones((1, num_det), dtype=bool),
+        np.ones((1, num_gt), dtype=bool),
+        thresholds,
+    )[0]
+
+
+def prepare_detections(
+    prediction: Any,
+    reference: Dict,
+    image_size: Optional[Sequence[int]] = None,
+    input_size: Optional[Sequence[int]] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parse the detections and ground truth of one image.
+
+    Args:
+        prediction: Model prediction, see :func:`parse_boxes`
+        reference: Reference annotation with ``boxes`` (and ``width``/``height``
+            for predictions in normalized coordinates)
+        image_size: Full-resolution ``(width, height)`` of the image the
+            ground truth refers to
+        input_size: ``(width, height)`` of the resized image the model was
+            given; pixel boxes are scaled from it to ``image_size``
+
+    Returns:
+        ``(boxes, scores, ground truth)``, detections sorted by descending score
+    """
+    gt = np.asarray(reference.get("boxes", []), dtype=np.float64).reshape(-1, 4)
+    boxes, scores = parse_boxes(prediction)
+    if "width" in reference and "height" in reference:
+        image_size = (reference["width"], reference["height"])
+    if len(boxes) and boxes.max() <= 1.0 and image_size is not None:
+        # Normalized coordinates
+        boxes = boxes * np.array(list(image_size) * 2, dtype=np.float64)
+    elif len(boxes) and image_size is not None and input_size is not None:
+        boxes = boxes * np.array(
+            [image_size[0] / input_size[0], image_size[1] / input_size[1]] * 2
+        )
+    order = np.argsort(-scores, kind="mergesort")
+    return boxes[order], scores[order], gt
+
+
+def match_images(
+    detections: Sequence[np.ndarray],
+    ground_truth: Sequence[np.ndarray],
+    batch_size: int = 256,
+) -> List[np.ndarray]:
+    """
+    Match many images in padded batches of similar box counts.
+
+    Args:
+        detections: Score-sorted detection boxes per image, shape (D_i, 4)
+        ground_truth: Ground-truth boxes per image, shape (G_i, 4)
+        batch_size: Images matched at once
+
+    Returns:
+        True-positive flags per image, shape (T, D_i), in input order
+    """
+    order = sorted(
+        range(len(detections)), key=lambda i: (len(detections[i]), len(ground_truth[i]))
+    )
+    results: List[Optional[np.ndarray]] = [None] * len(detections)
+    for start in range(0, len(order), batch_size):
+        chunk = order[start : start + batch_size]
+        num_det = max(1, max(len(detections[i]) for i in chunk))
+        num_gt = max(1, max(len(ground_truth[i]) for i in chunk))
+        det_boxes = np.zeros((len(chunk), num_det, 4))
+        gt_boxes = np.zeros((len(chunk), num_gt, 4))
+        det_valid = np.zeros((len(chunk), num_det), dtype=bool)
+        gt_valid = np.zeros((len(chunk), num_gt), dtype=bool)
+        for row, i in enumerate(chunk):
+            det_boxes[row, : len(detections[i])] = detections[i]
+            det_valid[row, : len(detections[i])] = True
+            gt_boxes[row, : len(ground_truth[i])] = ground_truth[i]
+            gt_valid[row, : len(ground_truth[i])] = True
+        tp = match_detections_batched(
+            batched_box_iou(det_boxes, gt_boxes), det_valid, gt_valid
+        )
+        for row, i in enumerate(chunk):
+            results[i] = tp[row, :, : len(detections[i])]
+    return results
+
+
+def _interpolated_ap(tp_cum: np.ndarray, fp_cum: np.ndarray, num_gt: int) -> np.ndarray:
+    """101-point interpolated AP from cumulative (T, P) counts at each score cutoff."""
+    recall = tp_cum / num_gt
+    precision = tp_cum / np.maximum(tp_cum + fp_cum, np.finfo(np.float64).eps)
+    # Monotone precision envelope
+    precision = np.flip(
+        np.maximum.accumulate(np.flip(precision, axis=1), axis=1), axis=1
+    )
+
+    ap = np.zeros(tp_cum.shape[0])
+    for t in range(tp_cum.shape[0]):
+        idx = np.searchsorted(recall[t], RECALL_THRESHOLDS, side="left")
+        valid = idx < precision.shape[1]
+        sampled = np.zeros(len(RECALL_THRESHOLDS))
+        sampled[valid] = precision[t, idx[valid]]
+        ap[t] = sampled.mean()
+    return ap
+
+
+def average_precision(scores: np.ndarray, tp: np.ndarray, num_gt: int) -> np.ndarray:
+    """
+    COCO-style 101-point interpolated AP.
+
+    Args:
+        scores: Detection scores of shape (D,)
+        tp: True-positive flags of shape (T, D)
+        num_gt: Number of ground-truth boxes
+
+    Returns:
+        AP per threshold, shape (T,)
+    """
+    if num_gt == 0:
+        return np.zeros(tp.shape[0])
+    order = np.argsort(-scores, kind="mergesort")
+    tp = tp[:, order]
+    tp_cum = np.cumsum(tp, axis=1)
+    fp_cum = np.cumsum(~tp, axis=1)
+    # Only evaluate at the end of each group of tied scores, so the result
+    # does not depend on the order in which tied detections were added
+    sorted_scores = scores[order]
+    group_end = (
+        np.append(sorted_scores[1:] != sorted_scores[:-1], True) if len(scores) else []
+    )
+    return _interpolated_ap(tp_cum[:, group_end], fp_cum[:, group_end], num_gt)
+
+
+def histogram_average_precision(
+    counts: np.ndarray, hits: np.ndarray, num_gt: int
+) -> np.ndarray:
+    """
+    COCO-style 101-point interpolated AP from a PR histogram.
+
+    Args:
+        counts: Detections per score bin, shape (B,), bins in ascending score order
+        hits: True positives per IoU threshold and score bin, shape (T, B)
+        num_gt: Number of ground-truth boxes
+
+    Returns:
+        AP per threshold, shape (T,)
+    """
+    if num_gt == 0:
+        return np.zeros(hits.shape[0])
+    occupied = counts > 0
+    counts = counts[occupied][::-1]
+    hits = hits[:, occupied][:, ::-1]
+    tp_cum = np.cumsum(hits, axis=1)
+    fp_cum = np.cumsum(counts)[None, :] - tp_cum
+    return _interpolated_ap(tp_cum, fp_cum, num_gt)
+
+
+class DetectionMetric(Metric):
+    """
+    mAP@[.5:.95], precision, recall and F1 for camouflaged object localization.
+
+    Images are buffered and matched in padded batches with
+    :func:`match_detections_batched`. The matches are then counted into a
+    PR histogram: per difficulty level and score bin, the number of
+    detections and of true positives at each IoU threshold. Scores are
+    binned to ``tasks.detection.score_resolution``, so the state is bounded
+    by the number of bins rather than the number of detections, shard
+    states merge by summation, and AP is exact for scores that differ by at
+    least the resolution. Results are also broken down by the configured
+    ``difficulty_levels``.
+    """
+
+    names = ("mAP", "precision", "recall", "f1_score")
+
+    #: Number of buffered images that triggers batched matching
+    match_batch_size = 1024
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        super().__init__(config)
+        task_config = self.config.get("tasks", {}).get("detection", {})
+        self.difficulty_levels = list(
+            task_config.get("difficulty_levels", ["easy", "medium", "hard"])
+        )
+        self.score_resolution = float(task_config.get("score_resolution", 1e-4))
+        num_levels = len(self.difficulty_levels) + 1
+        #: Sorted score bins (scores divided by the resolution, rounded)
+        self.bins = np.zeros(0, dtype=np.int64)
+        #: Detections per level and bin, shape (levels, bins)
+        self.counts = np.zeros((num_levels, 0), dtype=np.int64)
+        #: True positives per level, IoU threshold and bin, shape (levels, T, bins)
+        self.hits = np.zeros((num_levels, len(IOU_THRESHOLDS), 0), dtype=np.int64)
+        self.num_gt = np.zeros(num_levels, dtype=np.int64)
+        self._level_codes = {
+            level: code for code, level in enumerate(self.difficulty_levels)
+        }
+        self._pending: List[Tuple[np.ndarray, np.ndarray, np.ndarray, int]] = []
+
+    def _level(self, difficulty: Any) -> int:
+        return self._level_codes.get(difficulty, len(self.difficulty_levels))
+
+    def update(self, records: Iterable[Dict]) -> "DetectionMetric":
+        for record in records:
+            reference = dict(record.get("reference") or {})
+            if "difficulty" not in reference and record.get("difficulty") is not None:
+                reference["difficulty"] = record["difficulty"]
+            self.add(
+                record.get("prediction"),
+                reference,
+                record.get("image_size"),
+                record.get("input_size"),
+            )
+        return self
+
+    def add(
+        self,
+        prediction: Any,
+        reference: Dict,
+        image_size: Optional[Sequence[int]] = None,
+        input_size: Optional[Sequence[int]] = None,
+    ):
+        boxes, scores, gt = prepare_detections(
+            prediction, reference, image_size, input_size
+        )
+        level = self._level(reference.get("difficulty"))
+        self.num_gt[level] += len(gt)
+        if not len(boxes):
+            return
+        self._pending.append((boxes, scores, gt, level))
+        if len(self._pending) >= self.match_batch_size:
+            self._flush()
+
+    def _flush(self):
+        """Match the pending images and count them into the histogram."""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        tp = match_images([p[0] for p in pending], [p[2] for p in pending])
+        scores = np.concatenate([p[1] for p in pending])
+        levels = np.concatenate(
+            [np.full(len(p[0]), p[3], dtype=np.int64) for p in pending]
+        )
+        self._count(scores, levels, np.concatenate(tp, axis=1))
+
+    def _count(self, scores: np.ndarray, levels: np.ndarray, tp: np.ndarray):
+        """Add matched detections, with (T, D) true-positive flags, to the histogram."""
+        keys = np.round(scores / self.score_resolution).astype(np.int64)
+        bins, column = np.unique(keys, return_inverse=True)
+        num_levels, num_thresholds = len(self.num_gt), len(IOU_THRESHOLDS)
+        flat = levels * len(bins) + column
+        counts = np.bincount(flat, minlength=num_levels * len(bins)).reshape(
+            num_levels, -1
+        )
+        flat = (
+            levels[None, :] * num_thresholds + np.arange(num_thresholds)[:, None]
+        ) * len(bins) + column[None, :]
+        hits = np.bincount(
+            flat.ravel(),
+            weights=tp.ravel(),
+            minlength=num_levels * num_thresholds * len(bins),
+        )
+        hits = hits.astype(np.int64).reshape(num_levels, num_thresholds, -1)
+        self._add_histogram(bins, counts, hits)
+
+    def _add_histogram(self, bins: np.ndarray, counts: np.ndarray, hits: np.ndarray):
+        if not np.array_equal(bins, self.bins):
+            merged = np.union1d(self.bins, bins)
+            position = np.searchsorted(merged, self.bins)
+            old_counts, old_hits = self.counts, self.hits
+            self.counts = np.zeros((old_counts.shape[0], len(merged)), dtype=np.int64)
+            self.hits = np.zeros((*old_hits.shape[:2], len(merged)), dtype=np.int64)
+            self.counts[:, position] = old_counts
+            self.hits[:, :, position] = old_hits
+            self.bins = merged
+        position = np.searchsorted(self.bins, bins)
+        self.counts[:, position] += counts
+        self.hits[:, :, position] += hits
+
+    def merge(self, other: "DetectionMetric") -> "DetectionMetric":
+        self._check_mergeable(other)
+        if other.score_resolution != self.score_resolution:
+            raise ValueError(
+                "Cannot merge detection metrics with different score resolutions"
+            )
+        self._flush()
+        other._flush()
+        self._add_histogram(other.bins, other.counts, other.hits)
+        self.num_gt += other.num_gt
+        return self
+
+    def compute(self) -> Dict[str, float]:
+        self._flush()
+        counts, hits = self.counts.sum(axis=0), self.hits.sum(axis=0)
+        num_gt = int(self.num_gt.sum())
+        ap = histogram_average_precision(counts, hits, num_gt)
+
+        num_detections = int(counts.sum())
+        true_positives = int(hits[0].sum())
+        precision = true_positives / num_detections if num_detections else 0.0
+        recall = true_positives / num_gt if num_gt else 0.0
+        f1 = (
+            2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        )
+
+        results = {
+            "mAP": float(ap.mean()),
+            "precision": precision,
+            "recall": recall,
+            "f1_score": f1,
+            "AP50": float(ap[0]),
+            "AP75": float(ap[5]),
+        }
+        for code, level in enumerate(self.difficulty_levels):
+            level_ap = histogram_average_precision(
+                self.counts[code], self.hits[code], int(self.num_gt[code])
+            )
+            results[f"mAP_{level}"] = float(level_ap.mean())
+        return results
@@ -0,0 +1,34 @@
+"""
+Text normalization and n-gram helpers shared by text metrics
+"""
+
+import re
+import string
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_ARTICLES = re.compile(r"\b(a|an|the)\b")
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into word tokens."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def normalize_answer(text: str) -> str:
+    """Lowercase, drop punctuation and articles, and collapse whitespace."""
+    text = text.lower().translate(_PUNCTUATION)
+    text = _ARTICLES.sub(" ", text)
+    return " ".join(text.split())
+
+
+def ngram_counts(tokens: Sequence[str], n: int) -> Counter:
+    """Count the n-grams of a token sequence."""
+    return Counter(tuple(tokens[i : i + n]) for i in range(len(tokens) - n + 1))
+
+
+def all_ngram_counts(tokens: Sequence[str], max_n: int = 4) -> Tuple[Counter, ...]:
+    """Count the 1..max_n-grams of a token sequence."""
+    return tuple(ngram_counts(tokens, n) for n in range(1, max_n + 1))
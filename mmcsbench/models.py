@@ -2,57 +2,465 @@
 Model registry and loading utilities
 """
 
-from typing import Dict, Any, Optional
+import contextlib
+import functools
+import gc
+import importlib
+import itertools
+import json
+import sys
+import threading
+import warnings
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 
 class BaseModel(ABC):
     """Base class for all models in the benchmark."""
-    
+
+    #: Set to True when ``generate`` may be called from several threads at
+    #: once, e.g. for models served by an HTTP inference server.
+    concurrent = False
+
+    #: Set to True when ``forward(image)`` returns vision-encoder features that
+    #: ``generate`` accepts in place of the image. Fused multi-task evaluation
+    #: then encodes each image once for the prompts of all tasks.
+    shares_image_features = False
+
     @abstractmethod
     def forward(self, image, text: Optional[str] = None):
         """Forward pass of the model."""
         pass
-    
+
     @abstractmethod
     def generate(self, image, prompt: str, **kwargs):
         """Generate text response given image and prompt."""
         pass
 
+    def generate_batch(
+        self, images: Sequence, prompts: Sequence[str], **kwargs
+    ) -> List:
+        """
+        Generate responses for a batch of image-prompt pairs.
+
+        The default implementation calls :meth:`generate` once per pair. Models
+        that support batched inference should override it.
+
+        Args:
+            images: Images, one per prompt
+            prompts: Prompt texts
+            **kwargs: Generation keyword arguments
+
+        Returns:
+            List of responses in input order
+        """
+        return [
+            self.generate(image, prompt, **kwargs)
+            for image, prompt in zip(images, prompts)
+        ]
+
+    def encode_image(self, image):
+        """
+        Encode an image with the model's vision encoder.
+
+        Models that override this together with :meth:`generate_from_embedding`
+        have every image encoded once; the evaluator caches the embedding and
+        reuses it for all prompts on that image. The default returns
+        ``forward(image)`` for models with ``shares_image_features``.
+        """
+        if self.shares_image_features:
+            return self.forward(image)
+        raise NotImplementedError(
+            f"{type(self).__name__} does not expose its vision encoder"
+        )
+
+    def generate_from_embedding(self, embedding, prompt: str, **kwargs):
+        """Generate a response from an :meth:`encode_image` embedding and a prompt."""
+        if self.shares_image_features:
+            return self.generate(embedding, prompt, **kwargs)
+        raise NotImplementedError(
+            f"{type(self).__name__} does not expose its vision encoder"
+        )
+
+    def generate_batch_from_embeddings(
+        self, embeddings: Sequence, prompts: Sequence[str], **kwargs
+    ) -> List:
+        """
+        Generate responses for a batch of embedding-prompt pairs.
+
+        The default calls :meth:`generate_from_embedding` once per pair, or
+        :meth:`generate_batch` for models with ``shares_image_features``.
+        """
+        if self.shares_image_features:
+            return self.generate_batch(embeddings, prompts, **kwargs)
+        return [
+            self.generate_from_embedding(embedding, prompt, **kwargs)
+            for embedding, prompt in zip(embeddings, prompts)
+        ]
+
+    def cache_identity(self) -> Optional[Any]:
+        """
+        Describe what determines this instance's outputs, for caching them.
+
+        Return something JSON-serializable that differs between instances
+        with different checkpoints or settings, e.g. the weights path and
+        precision. The default returns None: the instance is then identified
+        by the ``name`` and ``config`` set by :func:`load_model`, and models
+        with neither are not cached.
+        """
+        return None
+
+    async def agenerate(self, image, prompt: str, **kwargs):
+        """
+        Asynchronously generate a response given image and prompt.
+
+        Models backed by an async client should override this; the evaluator
+        then drives them from an event loop. The default runs :meth:`generate`
+        in the loop's executor.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.generate, image, prompt, **kwargs)
+        )
+
+
+def resolve_entry_point(spec: str):
+    """
+    Import the object named by an entry-point string.
+
+    Args:
+        spec: ``'package.module:ClassName'`` (attribute paths may be dotted)
+
+    Returns:
+        The referenced object
+    """
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Invalid entry point '{spec}', expected 'module:attribute'")
+    target = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        target = getattr(target, part)
+    return target
+
+
+def model_memory(model) -> int:
+    """
+    Estimate the memory held by a model's weights in bytes.
+
+    Uses a ``memory_bytes`` attribute or method if the model defines one,
+    otherwise sums the parameters and buffers of the model and of its
+    attributes that are torch modules.
+    """
+    size = getattr(model, "memory_bytes", None)
+    if callable(size):
+        size = size()
+    if size is not None:
+        return int(size)
+    # Models with __slots__ have no __dict__
+    modules = [model] + list(getattr(model, "__dict__", {}).values())
+    total = 0
+    seen = set()
+    for module in modules:
+        if not (
+            callable(getattr(module, "parameters", None))
+            and callable(getattr(module, "buffers", None))
+        ):
+            continue
+        for tensor in itertools.chain(module.parameters(), module.buffers()):
+            if id(tensor) not in seen:
+                seen.add(id(tensor))
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class _PoolEntry:
+    __slots__ = ("model", "refs", "memory")
+
+    def __init__(self, model, memory: int):
+        self.model = model
+        self.refs = 0
+        self.memory = memory
+
+
+class ModelPool:
+    """
+    Cache of loaded model instances keyed on name and normalized config.
+
+    Acquired models are reference counted; released models stay loaded and
+    are unloaded least recently used first when the pool exceeds its memory
+    budget or model count. Models in use are never unloaded. Models are
+    loaded outside the pool lock; concurrent requests for a model that is
+    being loaded wait for that load.
+    """
+
+    def __init__(
+        self, memory_budget: Optional[int] = None, max_models: Optional[int] = None
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            memory_budget: Maximum total weight memory in bytes (None for unbounded),
+                see :func:`model_memory`
+            max_models: Maximum number of loaded models (None for unbounded)
+        """
+        self.memory_budget = memory_budget
+        self.max_models = max_models
+        self._entries: "OrderedDict[Tuple[str, str], _PoolEntry]" = OrderedDict()
+        self._loading: Dict[Tuple[str, str], threading.Event] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(name: str, config: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+        """Pool key of a model name and config, independent of key order."""
+        return name, json.dumps(config or {}, sort_keys=True, default=str)
+
+    def acquire(
+        self,
+        name: str,
+        config: Optional[Dict[str, Any]] = None,
+        factory: Optional[Callable[[], Any]] = None,
+    ):
+        """
+        Get a loaded model, loading it on a miss, and take a reference to it.
+
+        Args:
+            name: Registered model name
+            config: Model configuration
+            factory: Builds the model on a miss. Defaults to
+                :meth:`ModelRegistry.get_model`.
+
+        Returns:
+            Model instance; call :meth:`release` when done with it
+        """
+        key = self.key(name, config)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.refs += 1
+                    return entry.model
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Another thread is loading this model: wait for it, then look again
+            loading.wait()
+
+        # Load outside the lock, so hits and releases of other models are not blocked
+        try:
+            if factory is None:
+                model = ModelRegistry.get_model(name, **(config or {}))
+            else:
+                model = factory()
+            entry = _PoolEntry(model, model_memory(model))
+        except BaseException:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+            raise
+        with self._lock:
+            entry.refs = 1
+            self._entries[key] = entry
+            del self._loading[key]
+            evicted = self._shrink(keep=key)
+        loading.set()
+        self._free(evicted)
+        return entry.model
+
+    def release(self, model):
+        """Drop a reference taken by :meth:`acquire`; the model stays loaded."""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.model is model:
+                    if entry.refs <= 0:
+                        raise ValueError("Model released more often than acquired")
+                    entry.refs -= 1
+                    evicted = self._shrink()
+                    break
+            else:
+                raise ValueError("Model was not acquired from this pool")
+        self._free(evicted)
+
+    @contextlib.contextmanager
+    def use(self, name: str, config: Optional[Dict[str, Any]] = None):
+        """Acquire a model for the duration of a block."""
+        model = self.acquire(name, config)
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    def memory(self) -> int:
+        """Total weight memory of the loaded models in bytes."""
+        with self._lock:
+            return sum(entry.memory for entry in self._entries.values())
+
+    def loaded(self) -> List[Tuple[str, str]]:
+        """Keys of the loaded models, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def _over_budget(self) -> bool:
+        if self.max_models is not None and len(self._entries) > self.max_models:
+            return True
+        return self.memory_budget is not None and self.memory() > self.memory_budget
+
+    def _shrink(self, keep: Optional[Tuple[str, str]] = None) -> List[_PoolEntry]:
+        """Remove idle models, least recently used first, until within budget."""
+        evicted = []
+        for key in list(self._entries):
+            if not self._over_budget():
+                return evicted
+            if self._entries[key].refs == 0 and key != keep:
+                evicted.append(self._entries.pop(key))
+        if self._over_budget():
+            warnings.warn(
+                f"Model pool exceeds its budget ({self.memory() / 2 ** 30:.1f} GiB in "
+                f"{len(self._entries)} models); all other models are in use"
+            )
+        return evicted
+
+    @staticmethod
+    def _free(evicted: List[_PoolEntry]):
+        """Unload removed models. Called without the pool lock: collecting is slow."""
+        if not evicted:
+            return
+        while evicted:
+            entry = evicted.pop()
+            unload = getattr(entry.model, "unload", None)
+            if callable(unload):
+                unload()
+            del entry
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def clear(self):
+        """Unload every model that is not in use."""
+        with self._lock:
+            evicted = [
+                self._entries.pop(key)
+                for key in [k for k, e in self._entries.items() if e.refs == 0]
+            ]
+        self._free(evicted)
+
 
 class ModelRegistry:
     """Registry for managing different model implementations."""
-    
+
     _models = {}
-    
+    pool = ModelPool()
+
     @classmethod
     def register(cls, name: str, model_class):
-        """Register a model class."""
+        """
+        Register a model class.
+
+        Args:
+            name: Model name
+            model_class: Model class or factory, or an entry-point string
+                ``'package.module:ClassName'`` that is only imported when the
+                model is first used
+        """
         cls._models[name] = model_class
-    
+
     @classmethod
-    def get_model(cls, name: str, **kwargs):
-        """Get a model instance by name."""
+    def register_entry_points(cls, group: str = "mmcsbench.models"):
+        """
+        Register the models advertised by installed packages under an
+        entry-point group, without importing them.
+
+        Returns:
+            Names of the registered models
+        """
+        from importlib.metadata import entry_points as installed_entry_points
+
+        entry_points = installed_entry_points()
+        if hasattr(entry_points, "select"):
+            found = entry_points.select(group=group)
+        else:  # Python < 3.10
+            found = entry_points.get(group, [])
+        names = []
+        for entry_point in found:
+            cls._models.setdefault(entry_point.name, entry_point.value)
+            names.append(entry_point.name)
+        return names
+
+    @classmethod
+    def _model_class(cls, name: str):
         if name not in cls._models:
             raise ValueError(f"Model {name} not found in registry")
-        return cls._models[name](**kwargs)
-    
+        model_class = cls._models[name]
+        if isinstance(model_class, str):
+            model_class = cls._models[name] = resolve_entry_point(model_class)
+        return model_class
+
+    @classmethod
+    def get_model(cls, name: str, **kwargs):
+        """Get a new model instance by name."""
+        model = cls._model_class(name)(**kwargs)
+        # Identify the instance for prediction caching unless the model does itself
+        if getattr(model, "name", None) is None:
+            model.name = name
+        if getattr(model, "config", None) is None:
+            model.config = dict(kwargs)
+        return model
+
+    @classmethod
+    def acquire(cls, name: str, **kwargs):
+        """Get a pooled model instance by name, see :meth:`ModelPool.acquire`."""
+        return cls.pool.acquire(name, kwargs)
+
+    @classmethod
+    def release(cls, model):
+        """Release a model obtained from :meth:`acquire`."""
+        cls.pool.release(model)
+
+    @classmethod
+    def use(cls, name: str, **kwargs):
+        """Context manager acquiring a pooled model for the duration of a block."""
+        return cls.pool.use(name, kwargs)
+
+    @classmethod
+    def configure_pool(
+        cls, memory_budget: Optional[int] = None, max_models: Optional[int] = None
+    ):
+        """Set the memory budget (bytes) and model limit of the model pool."""
+        with cls.pool._lock:
+            cls.pool.memory_budget = memory_budget
+            cls.pool.max_models = max_models
+            evicted = cls.pool._shrink()
+        cls.pool._free(evicted)
+
     @classmethod
     def list_models(cls):
         """List all registered models."""
         return list(cls._models.keys())
 
 
-def load_model(model_name: str, config: Optional[Dict[str, Any]] = None):
+def load_model(
+    model_name: str, config: Optional[Dict[str, Any]] = None, pooled: bool = False
+):
     """
     Load a model by name.
-    
+
     Args:
         model_name: Name of the model to load
         config: Model configuration
-        
+        pooled: Reuse a loaded instance from the model pool. The caller then
+            holds a reference and should pass the model to
+            :meth:`ModelRegistry.release` when done with it.
+
     Returns:
         Model instance
     """
     config = config or {}
-    return ModelRegistry.get_model(model_name, **config)
\ No newline at end of file
+    if pooled:
+        return ModelRegistry.acquire(model_name, **config)
+    return ModelRegistry.get_model(model_name, **config)
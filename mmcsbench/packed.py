@@ -0,0 +1,321 @@
+"""
+Packed, sharded dataset format for MMCSBench
+
+``scripts/pack_dataset.py`` (:func:`write_pack`) packs a split into a few
+large files, so evaluation nodes on network storage open a handful of
+shards instead of one file per image::
+
+    meta.json           split, source annotation signature, shard names, format version
+    index.npy           per item: shard, byte offset, length, SHA-256 of the image bytes
+    images-00000.bin    encoded images (original file bytes), concatenated
+    annotations/        :class:`AnnotationStore` with annotations and per-task,
+                        per-category and per-difficulty indices
+
+:class:`PackedSplit` reads items by offset. Reads that move forward through
+a shard fetch a whole read-ahead block, so a pass in dataset order turns
+into a few large sequential reads; :meth:`PackedSplit.iter_images` streams
+a shard with the next block read in the background.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .annotation_store import AnnotationStore, _source_signature, load_annotation_list
+
+PACK_VERSION = 1
+
+INDEX_DTYPE = np.dtype(
+    [("shard", "<i4"), ("offset", "<i8"), ("length", "<i8"), ("sha256", "u1", (32,))]
+)
+
+
+def _missing_digest(split: str, image_file: str) -> np.ndarray:
+    # Matches CamouflageDataset.get_image_hash for items without an image file
+    digest = hashlib.sha256(f"missing:{split}/{image_file}".encode("utf-8")).digest()
+    return np.frombuffer(digest, dtype=np.uint8)
+
+
+def write_pack(
+    data_dir: Union[str, Path],
+    split: str,
+    output: Optional[Union[str, Path]] = None,
+    shard_size: int = 1 << 30,
+    num_workers: int = 8,
+) -> Path:
+    """
+    Pack the images and annotations of a split into shard files.
+
+    Args:
+        data_dir: Dataset directory with ``annotations/`` and ``images/``
+        split: Split to pack
+        output: Pack directory to (re)create. Defaults to ``{data_dir}/packed/{split}``.
+        shard_size: Bytes after which a new shard is started
+        num_workers: Threads reading image files ahead of the writer. At most
+            ``4 * num_workers`` files are read ahead, so memory stays bounded
+            however large the split is.
+
+    Returns:
+        The pack directory
+    """
+    data_dir = Path(data_dir)
+    source = data_dir / "annotations" / f"{split}.json"
+    images_dir = data_dir / "images" / split
+    path = Path(output) if output is not None else data_dir / "packed" / split
+    annotations = load_annotation_list(source)
+
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    def read(annotation: Dict) -> Tuple[str, Optional[bytes]]:
+        image_file = annotation.get("image_file", "")
+        image_path = images_dir / image_file
+        if not image_file or not image_path.is_file():
+            return image_file, None
+        with open(image_path, "rb") as f:
+            return image_file, f.read()
+
+    def read_ahead(
+        pool: ThreadPoolExecutor, window: int
+    ) -> Iterator[Tuple[str, Optional[bytes]]]:
+        # Keep a bounded number of reads in flight, in annotation order
+        pending = deque()
+        for annotation in annotations:
+            pending.append(pool.submit(read, annotation))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    index = np.zeros(len(annotations), dtype=INDEX_DTYPE)
+    shards: List[str] = []
+    shard = None
+    workers = max(1, num_workers)
+    try:
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="mmcsbench-pack"
+        ) as pool:
+            for idx, (image_file, data) in enumerate(read_ahead(pool, 4 * workers)):
+                if data is None:
+                    index[idx] = (-1, 0, 0, _missing_digest(split, image_file))
+                    continue
+                if (
+                    shard is None
+                    or shard.tell() + len(data) > shard_size
+                    and shard.tell()
+                ):
+                    if shard is not None:
+                        shard.close()
+                    shards.append(f"images-{len(shards):05d}.bin")
+                    shard = open(tmp / shards[-1], "wb")
+                index[idx] = (
+                    len(shards) - 1,
+                    shard.tell(),
+                    len(data),
+                    np.frombuffer(hashlib.sha256(data).digest(), dtype=np.uint8),
+                )
+                shard.write(data)
+    finally:
+        if shard is not None:
+            shard.close()
+
+    np.save(tmp / "index.npy", index)
+    AnnotationStore.build(source, tmp / "annotations")
+    with open(tmp / "meta.json", "w") as f:
+        json.dump(
+            {
+                "version": PACK_VERSION,
+                "split": split,
+                "source": _source_signature(source),
+                "num_items": len(annotations),
+                "shards": shards,
+            },
+            f,
+        )
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return path
+
+
+class PackedSplit:
+    """
+    Read-only access to a packed split.
+
+    Args:
+        path: Pack directory written by :func:`write_pack`
+        read_ahead: Bytes fetched at once when reads move forward through a shard
+    """
+
+    def __init__(self, path: Union[str, Path], read_ahead: int = 8 << 20):
+        self.path = Path(path)
+        self.read_ahead = read_ahead
+        with open(self.path / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != PACK_VERSION:
+            raise ValueError(f"Unsupported pack version in {self.path}")
+        self.index = np.load(self.path / "index.npy", mmap_mode="r")
+        self.annotations = AnnotationStore(self.path / "annotations")
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._fds: Dict[int, int] = {}
+        self._blocks: Dict[int, Tuple[int, bytes]] = {}
+        self._next: Dict[int, int] = {}
+
+    @property
+    def source(self) -> Dict[str, int]:
+        """Signature of the annotation file the pack was written from."""
+        return self.meta["source"]
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getstate__(self):
+        # File descriptors and buffers are per process
+        state = self.__dict__.copy()
+        state.update(_lock=None, _pid=None, _fds={}, _blocks={}, _next={})
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _fd(self, shard: int) -> int:
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._fds, self._blocks, self._next = {}, {}, {}
+        if shard not in self._fds:
+            fd = os.open(self.path / self.meta["shards"][shard], os.O_RDONLY)
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            self._fds[shard] = fd
+        return self._fds[shard]
+
+    def image_hash(self, idx: int) -> str:
+        """SHA-256 hex digest of an item's image bytes, as computed by the dataset."""
+        return self.index[idx]["sha256"].tobytes().hex()
+
+    def read(self, idx: int) -> Optional[bytes]:
+        """
+        Read the encoded image of an item.
+
+        Args:
+            idx: Item index
+
+        Returns:
+            Image file bytes, or None if the item has no image
+        """
+        row = self.index[idx]
+        shard, offset, length = (
+            int(row["shard"]),
+            int(row["offset"]),
+            int(row["length"]),
+        )
+        if shard < 0:
+            return None
+        with self._lock:
+            fd = self._fd(shard)
+            start, block = self._blocks.get(shard, (0, b""))
+            if start <= offset and offset + length <= start + len(block):
+                return block[offset - start : offset + length - start]
+            expected = self._next.get(shard)
+            self._next[shard] = offset + length
+            if expected is not None and expected <= offset < expected + self.read_ahead:
+                # Moving forward through the shard: fetch the following items too
+                block = os.pread(fd, max(length, self.read_ahead), offset)
+                self._blocks[shard] = (offset, block)
+                return block[:length]
+        return os.pread(fd, length, offset)
+
+    def _runs(self, indices: Sequence[int]) -> List[Tuple[int, int, int, List[int]]]:
+        """
+        Group items into ``(shard, start, end, indices)`` runs of at most
+        ``read_ahead`` bytes.
+        """
+        rows = self.index[np.asarray(indices, dtype=np.int64)]
+        order = np.lexsort((rows["offset"], rows["shard"]))
+        runs: List[Tuple[int, int, int, List[int]]] = []
+        for i in order:
+            shard, offset, length = (
+                int(rows["shard"][i]),
+                int(rows["offset"][i]),
+                int(rows["length"][i]),
+            )
+            if shard < 0:
+                runs.append((shard, 0, 0, [indices[i]]))
+                continue
+            if (
+                runs
+                and runs[-1][0] == shard
+                and offset >= runs[-1][2]
+                and offset + length - runs[-1][1] <= self.read_ahead
+            ):
+                last = runs[-1]
+                runs[-1] = (shard, last[1], offset + length, last[3] + [indices[i]])
+            else:
+                runs.append((shard, offset, offset + length, [indices[i]]))
+        return runs
+
+    def iter_images(
+        self, indices: Optional[Sequence[int]] = None
+    ) -> Iterator[Tuple[int, Optional[bytes]]]:
+        """
+        Stream encoded images in shard order.
+
+        Items are read in runs of up to ``read_ahead`` bytes, with the next run
+        read in a background thread while the current one is consumed.
+
+        Args:
+            indices: Items to read. Defaults to the whole split.
+
+        Yields:
+            ``(index, image bytes or None)`` in storage order
+        """
+        indices = list(range(len(self))) if indices is None else list(indices)
+        if not indices:
+            return
+        runs = self._runs(indices)
+
+        def fetch(run):
+            shard, start, end, _ = run
+            if shard < 0:
+                return b""
+            with self._lock:
+                fd = self._fd(shard)
+            return os.pread(fd, end - start, start)
+
+        with ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="mmcsbench-pack"
+        ) as pool:
+            pending = pool.submit(fetch, runs[0])
+            for position, run in enumerate(runs):
+                block = pending.result()
+                if position + 1 < len(runs):
+                    pending = pool.submit(fetch, runs[position + 1])
+                shard, start, _, run_indices = run
+                for idx in run_indices:
+                    if shard < 0:
+                        yield idx, None
+                        continue
+                    offset, length = int(self.index[idx]["offset"]), int(
+                        self.index[idx]["length"]
+                    )
+                    yield idx, block[offset - start : offset - start + length]
+
+    def close(self):
+        """Close open shard files."""
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds, self._blocks, self._next = {}, {}, {}
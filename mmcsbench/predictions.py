@@ -0,0 +1,231 @@
+"""
+Incremental prediction storage and checkpointing for MMCSBench
+"""
+
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Tuple, Union
+
+
+def prediction_dir(output_dir: Union[str, Path], model_name: str, split: str) -> Path:
+    """
+    Get the directory holding a model's predictions for a split.
+
+    Returns:
+        Path of ``{output_dir}/predictions/{model_name}/{split}``
+    """
+    safe_name = re.sub(r"[^\w.-]+", "_", model_name)
+    return Path(output_dir) / "predictions" / safe_name / split
+
+
+def prediction_path(
+    output_dir: Union[str, Path],
+    model_name: str,
+    split: str,
+    task: str,
+    shard: Optional[Tuple[int, int]] = None,
+) -> Path:
+    """
+    Get the prediction shard path of a task.
+
+    Args:
+        output_dir: Run output directory
+        model_name: Name of the evaluated model
+        split: Data split
+        task: Task name
+        shard: ``(shard_id, num_shards)`` of a sharded run
+
+    Returns:
+        Path of ``{task}.jsonl`` (or ``{task}.shard-{i}-of-{N}.jsonl``) in
+        :func:`prediction_dir`
+    """
+    directory = prediction_dir(output_dir, model_name, split)
+    if shard is None:
+        return directory / f"{task}.jsonl"
+    shard_id, num_shards = shard
+    return directory / f"{task}.shard-{shard_id:03d}-of-{num_shards:03d}.jsonl"
+
+
+def _checkpoint_path(path: Path) -> Path:
+    return path.with_suffix(".ckpt.json")
+
+
+def _fsync_write(path: Path, data: Dict[str, Any]):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class PredictionWriter:
+    """
+    Append-only JSONL writer for per-sample predictions.
+
+    Records are flushed as they are written. At item boundaries signalled by
+    :meth:`commit`, the writer periodically fsyncs the shard and atomically
+    records the committed byte offset in a ``.ckpt.json`` file next to it.
+    On resume everything after the last checkpoint is discarded, so a crash
+    never leaves a partially written item behind.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        resume: bool = False,
+        metadata: Optional[Dict[str, Any]] = None,
+        checkpoint_every: int = 256,
+        checkpoint_interval: float = 30.0,
+    ):
+        """
+        Open a prediction shard.
+
+        Args:
+            path: JSONL shard path
+            resume: Keep committed records from a previous run instead of truncating
+            metadata: Run metadata stored in the checkpoint and checked on resume
+            checkpoint_every: Records between checkpoints
+            checkpoint_interval: Maximum seconds between checkpoints
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_file = _checkpoint_path(self.path)
+        self.metadata = metadata or {}
+        self.checkpoint_every = max(1, int(checkpoint_every))
+        self.checkpoint_interval = checkpoint_interval
+
+        offset = 0
+        if resume and self.checkpoint_file.exists():
+            with open(self.checkpoint_file, "r") as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("metadata", {}) != self.metadata:
+                raise ValueError(
+                    f"Cannot resume {self.path}: it was written with different run "
+                    f"metadata {checkpoint.get('metadata')}"
+                )
+            offset = checkpoint["offset"]
+
+        self._file = open(self.path, "ab" if offset else "wb")
+        # Drop records written after the last checkpoint
+        self._file.truncate(offset)
+        self._file.seek(offset)
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+        if not offset:
+            self._checkpoint()
+
+    def write(self, record: Dict[str, Any]):
+        """Append one prediction record."""
+        line = json.dumps(record, default=str, ensure_ascii=False) + "\n"
+        self._file.write(line.encode("utf-8"))
+        self._pending += 1
+
+    def commit(self, force: bool = False):
+        """
+        Mark an item boundary and checkpoint if one is due.
+
+        Args:
+            force: Checkpoint regardless of the configured frequency
+        """
+        self._file.flush()
+        due = (
+            self._pending >= self.checkpoint_every
+            or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+        )
+        if force or due:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        _fsync_write(
+            self.checkpoint_file,
+            {
+                "offset": self._file.tell(),
+                "metadata": self.metadata,
+            },
+        )
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        """Write a final checkpoint and close the shard."""
+        if not self._file.closed:
+            self._checkpoint()
+            self._file.close()
+
+    def __enter__(self) -> "PredictionWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # The current item may be incomplete: keep the last checkpoint
+            self._file.close()
+
+
+def read_predictions(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream committed prediction records from a shard.
+
+    Only the part covered by the shard's checkpoint is read, so records of an
+    interrupted item are never returned.
+
+    Args:
+        path: JSONL shard path
+
+    Yields:
+        Prediction records in the order they were written
+    """
+    path = Path(path)
+    if not path.exists():
+        return
+    limit = None
+    checkpoint_file = _checkpoint_path(path)
+    if checkpoint_file.exists():
+        with open(checkpoint_file, "r") as f:
+            limit = json.load(f)["offset"]
+    with open(path, "rb") as f:
+        for line in f:
+            if limit is not None:
+                if limit < len(line):
+                    break
+                limit -= len(line)
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_metadata(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Get the run metadata stored in a shard's checkpoint.
+
+    Args:
+        path: JSONL shard path
+
+    Returns:
+        Metadata passed to :class:`PredictionWriter`, empty if the shard has no
+        checkpoint
+    """
+    checkpoint_file = _checkpoint_path(Path(path))
+    if not checkpoint_file.exists():
+        return {}
+    with open(checkpoint_file, "r") as f:
+        return json.load(f).get("metadata", {})
+
+
+def completed_indices(path: Union[str, Path]) -> Set[int]:
+    """
+    Get the dataset indices whose predictions are committed in a shard.
+
+    Args:
+        path: JSONL shard path
+
+    Returns:
+        Set of dataset indices
+    """
+    return {record["index"] for record in read_predictions(path)}
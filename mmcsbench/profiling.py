@@ -0,0 +1,348 @@
+"""
+Lightweight profiling hooks for MMCSBench
+
+The evaluation loop reports into this module through :func:`timer`,
+:func:`count` and :func:`observe`. Nothing is recorded until a
+:class:`Profiler` is activated with :func:`enable`; until then every hook
+returns after a single global check. Example::
+
+    from mmcsbench import profiling
+
+    with profiling.enable(trace=True) as profiler:
+        benchmark.evaluate(model)
+    print(profiler.summary())
+    profiler.write_trace('results/trace.json')  # chrome://tracing or ui.perfetto.dev
+
+Timer names are dotted stages, e.g. ``dataset.decode``, ``model.generate``,
+``cache.get`` or ``metrics.detection``.
+"""
+
+import contextlib
+import cProfile
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+
+_active: Optional["Profiler"] = None
+
+
+class Histogram:
+    """
+    Constant-memory histogram with quarter-octave buckets.
+
+    Percentiles are accurate to within one bucket (about 19%).
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets: Dict[int, int] = defaultdict(int)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        bucket = math.ceil(4 * math.log2(value)) if value > 0 else -(10**6)
+        self.buckets[bucket] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q``-th percentile (0-100)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                value = 2 ** (bucket / 4) if bucket > -(10**6) else 0.0
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class _Timer:
+    """Context manager recording one timed span into the active profiler."""
+
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler: "Profiler", name: str, args: Dict[str, Any]):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class _NullTimer:
+    """Shared no-op context manager used while profiling is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Profiler:
+    """
+    Collects timers, counters and histograms of one run.
+
+    Args:
+        trace: Keep individual timer spans for :meth:`write_trace`
+        max_events: Maximum number of trace events kept
+        cprofile: Also run :mod:`cProfile` while active, see :meth:`write_cprofile`
+    """
+
+    def __init__(
+        self, trace: bool = False, max_events: int = 1_000_000, cprofile: bool = False
+    ):
+        self.trace = trace
+        self.max_events = max_events
+        self.timers: Dict[str, Histogram] = defaultdict(Histogram)
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.histograms: Dict[str, Histogram] = defaultdict(Histogram)
+        self.events: List[Dict[str, Any]] = []
+        self.dropped_events = 0
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+
+    def record(
+        self,
+        name: str,
+        start_ns: int,
+        end_ns: int,
+        args: Optional[Dict[str, Any]] = None,
+    ):
+        """Record a finished span."""
+        with self._lock:
+            self.timers[name].add((end_ns - start_ns) / 1e9)
+            if not self.trace:
+                return
+            if len(self.events) >= self.max_events:
+                self.dropped_events += 1
+                return
+            tid = threading.get_ident()
+            if tid not in self._threads:
+                self._threads[tid] = threading.current_thread().name
+            event = {
+                "name": name,
+                "cat": name.split(".", 1)[0],
+                "ph": "X",
+                "ts": (start_ns - self.start_ns) / 1000,
+                "dur": (end_ns - start_ns) / 1000,
+                "pid": os.getpid(),
+                "tid": tid,
+            }
+            if args:
+                event["args"] = args
+            self.events.append(event)
+
+    def count(self, name: str, value: float = 1):
+        """Increment a counter."""
+        with self._lock:
+            self.counters[name] += value
+            if self.trace and len(self.events) < self.max_events:
+                self.events.append(
+                    {
+                        "name": name,
+                        "ph": "C",
+                        "pid": os.getpid(),
+                        "ts": (time.perf_counter_ns() - self.start_ns) / 1000,
+                        "args": {name: self.counters[name]},
+                    }
+                )
+
+    def observe(self, name: str, value: float):
+        """Add a value to a histogram."""
+        with self._lock:
+            self.histograms[name].add(value)
+
+    @property
+    def wall_time(self) -> float:
+        """Seconds between activation and deactivation (or now)."""
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e9
+
+    def summary(self) -> str:
+        """
+        Format a per-stage summary table.
+
+        Returns:
+            Table of timers (calls, total, share of wall time, mean/p50/p95/max),
+            followed by counters and histograms
+        """
+        wall = self.wall_time
+        lines = [
+            f"{'stage':<28} {'calls':>8} {'total s':>9} {'% wall':>7} "
+            f"{'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+        ]
+        for name in sorted(self.timers):
+            h = self.timers[name]
+            lines.append(
+                f"{name:<28} {h.count:>8} {h.total:>9.3f} "
+                f"{100 * h.total / wall if wall else 0:>6.1f}% "
+                f"{1000 * h.mean:>9.3f} {1000 * h.percentile(50):>9.3f} "
+                f"{1000 * h.percentile(95):>9.3f} {1000 * h.max:>9.3f}"
+            )
+        lines.append(f"{'wall':<28} {'':>8} {wall:>9.3f}")
+        if self.counters:
+            lines.append("")
+            lines.extend(
+                f"{name:<28} {value:>12g}"
+                for name, value in sorted(self.counters.items())
+            )
+        if self.histograms:
+            lines.append("")
+            for name, h in sorted(self.histograms.items()):
+                lines.append(
+                    f"{name:<28} n={h.count} mean={h.mean:.3g} "
+                    f"p50={h.percentile(50):.3g} "
+                    f"p95={h.percentile(95):.3g} max={h.max:.3g}"
+                )
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summary statistics as a JSON-serializable dict."""
+
+        def stats(h: Histogram) -> Dict[str, float]:
+            return {
+                "count": h.count,
+                "total": h.total,
+                "mean": h.mean,
+                "p50": h.percentile(50),
+                "p95": h.percentile(95),
+                "max": h.max,
+            }
+
+        return {
+            "wall_time": self.wall_time,
+            "timers": {name: stats(h) for name, h in self.timers.items()},
+            "counters": dict(self.counters),
+            "histograms": {name: stats(h) for name, h in self.histograms.items()},
+        }
+
+    def write_trace(self, path: str):
+        """
+        Write timer spans and counters as Chrome trace JSON.
+
+        Open the file in ``chrome://tracing`` or https://ui.perfetto.dev.
+        """
+        with self._lock:
+            metadata = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+                for tid, name in self._threads.items()
+            ]
+            trace = {
+                "traceEvents": metadata + list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": {"dropped_events": self.dropped_events},
+            }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(trace, f)
+
+    def write_cprofile(self, path: str):
+        """Write :mod:`cProfile` stats (``pstats`` format, e.g. for snakeviz)."""
+        if self._cprofile is None:
+            raise ValueError("Profiler was created without cprofile=True")
+        self._cprofile.dump_stats(path)
+
+
+def is_enabled() -> bool:
+    """Return whether a profiler is active."""
+    return _active is not None
+
+
+def active() -> Optional[Profiler]:
+    """Return the active profiler, if any."""
+    return _active
+
+
+def timer(name: str, **args):
+    """
+    Time a block under a stage name.
+
+    Args:
+        name: Dotted stage name
+        **args: Extra fields stored with the span in the trace
+
+    Returns:
+        Context manager; a shared no-op while profiling is disabled
+    """
+    profiler = _active
+    if profiler is None:
+        return _NULL_TIMER
+    return _Timer(profiler, name, args)
+
+
+def count(name: str, value: float = 1):
+    """Increment a counter of the active profiler."""
+    profiler = _active
+    if profiler is not None:
+        profiler.count(name, value)
+
+
+def observe(name: str, value: float):
+    """Add a value to a histogram of the active profiler."""
+    profiler = _active
+    if profiler is not None:
+        profiler.observe(name, value)
+
+
+@contextlib.contextmanager
+def enable(profiler: Optional[Profiler] = None, **kwargs) -> Iterator[Profiler]:
+    """
+    Activate a profiler for the duration of a block.
+
+    Args:
+        profiler: Profiler to activate. Created from ``kwargs`` if not given.
+        **kwargs: Arguments of :class:`Profiler`
+
+    Yields:
+        The active profiler
+    """
+    global _active
+    profiler = profiler or Profiler(**kwargs)
+    previous = _active
+    _active = profiler
+    if profiler._cprofile is not None:
+        profiler._cprofile.enable()
+    try:
+        yield profiler
+    finally:
+        if profiler._cprofile is not None:
+            profiler._cprofile.disable()
+        profiler.end_ns = time.perf_counter_ns()
+        _active = previous
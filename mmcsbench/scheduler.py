@@ -0,0 +1,300 @@
+"""
+Concurrent generation scheduler for API-backed and thread-safe models
+"""
+
+import asyncio
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+#: Errors retried by default: network failures and timeouts. Other
+#: ``OSError`` subclasses (missing files, permissions) are not transient.
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    ConnectionError,
+    TimeoutError,
+    socket.timeout,
+    socket.gaierror,
+    asyncio.TimeoutError,
+)
+
+
+def http_status(error: BaseException) -> Optional[int]:
+    """
+    HTTP status code carried by an API client error, if any.
+
+    Looks at the attributes the common clients use: ``code`` (urllib),
+    ``status``/``status_code`` (aiohttp, httpx, openai) and
+    ``response.status_code`` (requests).
+    """
+    for source in (error, getattr(error, "response", None)):
+        for name in ("status_code", "status", "code"):
+            status = getattr(source, name, None)
+            if isinstance(status, int) and 100 <= status < 600:
+                return status
+    return None
+
+
+def transient_status(status: int) -> bool:
+    """Return whether an HTTP status is worth retrying (429 or 5xx)."""
+    return status == 429 or 500 <= status < 600
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``. Every
+    request takes one token; :meth:`reserve` returns how long the caller has to
+    wait before its token becomes available.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Initialize the bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst size. Defaults to ``max(1, rate)``.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return the delay in seconds before it may be used."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Wait asynchronously until a token is available."""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def supports_async(model) -> bool:
+    """Return whether a model overrides :meth:`BaseModel.agenerate`."""
+    from .models import BaseModel
+
+    agenerate = getattr(type(model), "agenerate", None)
+    return agenerate is not None and agenerate is not BaseModel.agenerate
+
+
+def supports_concurrency(model) -> bool:
+    """Return whether a model may receive several generate calls at once."""
+    return supports_async(model) or bool(getattr(model, "concurrent", False))
+
+
+class GenerationScheduler:
+    """
+    Issues generate calls concurrently with rate limiting and retries.
+
+    Models that declare an async ``agenerate`` are driven from one
+    long-lived asyncio event loop on a background thread, so clients bound to
+    a loop (HTTP sessions, queues) keep working across calls; all other
+    models are called from a thread pool. Results are always returned in
+    input order. :meth:`close` stops the loop.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        rate_limit: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        jitter: bool = True,
+        retry_on: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS,
+        retry_status: Optional[Callable[[int], bool]] = transient_status,
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            concurrency: Maximum number of in-flight requests
+            rate_limit: Maximum requests per second (None disables the limit)
+            burst: Token-bucket capacity for the rate limit
+            max_retries: Retries per request after the first failure
+            backoff: Initial retry delay in seconds, doubled on every attempt
+            max_backoff: Upper bound on the retry delay
+            jitter: Randomize retry delays to avoid synchronized retries
+            retry_on: Exception types that trigger a retry. Defaults to
+                network errors and timeouts; pass ``(Exception,)`` to retry
+                everything.
+            retry_status: Decides from its HTTP status (see
+                :func:`http_status`) whether an error of any type is retried,
+                overriding ``retry_on``. None ignores status codes.
+        """
+        self.concurrency = max(1, int(concurrency))
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.max_retries = max(0, int(max_retries))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_on = tuple(retry_on)
+        self.retry_status = retry_status
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["GenerationScheduler"]:
+        """
+        Create a scheduler from the ``evaluation`` section of a config.
+
+        Returns:
+            Scheduler instance, or None when ``concurrency`` is 1 or unset
+        """
+        evaluation = config.get("evaluation", {})
+        concurrency = evaluation.get("concurrency", 1)
+        if not concurrency or concurrency <= 1:
+            return None
+        return cls(
+            concurrency=concurrency,
+            rate_limit=evaluation.get("rate_limit"),
+            max_retries=evaluation.get("max_retries", 3),
+            backoff=evaluation.get("retry_backoff", 0.5),
+        )
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * (2**attempt))
+        if self.jitter:
+            delay *= 0.5 + random.random() / 2
+        return delay
+
+    def _retryable(self, error: BaseException) -> bool:
+        if self.retry_status is not None:
+            status = http_status(error)
+            if status is not None:
+                return self.retry_status(status)
+        # urllib wraps connection failures in URLError(reason=...)
+        return isinstance(error, self.retry_on) or isinstance(
+            getattr(error, "reason", None), self.retry_on
+        )
+
+    def _call(self, model, image, prompt: str, kwargs: Dict[str, Any]):
+        attempt = 0
+        while True:
+            if self.bucket:
+                self.bucket.acquire()
+            try:
+                return model.generate(image, prompt, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._retryable(e):
+                    raise
+                time.sleep(self._delay(attempt))
+                attempt += 1
+
+    async def _acall(
+        self,
+        model,
+        semaphore: asyncio.Semaphore,
+        image,
+        prompt: str,
+        kwargs: Dict[str, Any],
+    ):
+        attempt = 0
+        while True:
+            async with semaphore:
+                if self.bucket:
+                    await self.bucket.acquire_async()
+                try:
+                    return await model.agenerate(image, prompt, **kwargs)
+                except Exception as e:
+                    if attempt >= self.max_retries or not self._retryable(e):
+                        raise
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def _amap(
+        self, model, images: Sequence, prompts: Sequence[str], kwargs: Dict[str, Any]
+    ) -> List:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        calls = [
+            self._acall(model, semaphore, image, prompt, kwargs)
+            for image, prompt in zip(images, prompts)
+        ]
+        return list(await asyncio.gather(*calls))
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the scheduler's event loop thread on first use."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, daemon=True, name="mmcsbench-gen-loop"
+                )
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def close(self):
+        """Stop the event loop thread; it is started again on the next call."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(loop.shutdown_asyncgens(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def __enter__(self) -> "GenerationScheduler":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def map(self, model, images: Sequence, prompts: Sequence[str], **kwargs) -> List:
+        """
+        Generate responses for image-prompt pairs concurrently.
+
+        Args:
+            model: Model to call
+            images: Images, one per prompt
+            prompts: Prompt texts
+            **kwargs: Generation keyword arguments
+
+        Returns:
+            List of responses in input order
+        """
+        if not prompts:
+            return []
+        if supports_async(model):
+            coroutine = self._amap(model, images, prompts, kwargs)
+            return asyncio.run_coroutine_threadsafe(
+                coroutine, self._event_loop()
+            ).result()
+
+        workers = min(self.concurrency, len(prompts))
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="mmcsbench-gen"
+        ) as pool:
+            futures = [
+                pool.submit(self._call, model, image, prompt, kwargs)
+                for image, prompt in zip(images, prompts)
+            ]
+            return [future.result() for future in futures]
@@ -0,0 +1,185 @@
+"""
+Deterministic dataset sharding and shard merging for MMCSBench
+"""
+
+import heapq
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .metrics import build_corpus, build_metric, records_corpus, select_metrics
+from .predictions import (
+    PredictionWriter,
+    prediction_dir,
+    read_metadata,
+    read_predictions,
+)
+from .tasks import TASKS
+
+_SHARD_PATTERN = re.compile(
+    r"^(?P<task>\w+)\.shard-(?P<id>\d+)-of-(?P<total>\d+)\.jsonl$"
+)
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    Parse a ``i/N`` shard specification.
+
+    Args:
+        spec: Zero-based shard id and shard count, e.g. ``'0/4'``
+
+    Returns:
+        ``(shard_id, num_shards)``
+    """
+    try:
+        shard_id, num_shards = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N") from None
+    if num_shards < 1 or not 0 <= shard_id < num_shards:
+        raise ValueError(f"Invalid shard '{spec}': need 0 <= i < N")
+    return shard_id, num_shards
+
+
+def shard_indices(indices: Sequence[int], shard_id: int, num_shards: int) -> List[int]:
+    """
+    Select one shard of a list of dataset indices.
+
+    Items are dealt round-robin, so every shard gets a similar mix of the
+    split and the assignment only depends on the item's position.
+
+    Args:
+        indices: Dataset indices of the whole split, in order
+        shard_id: Zero-based shard id
+        num_shards: Total number of shards
+
+    Returns:
+        Dataset indices of the shard
+    """
+    if not 0 <= shard_id < num_shards:
+        raise ValueError(f"Invalid shard {shard_id}/{num_shards}")
+    return list(indices[shard_id::num_shards])
+
+
+def find_shards(directory: Union[str, Path], task: str) -> List[Path]:
+    """
+    Find the prediction shards of a task, checking that none is missing.
+
+    Args:
+        directory: Prediction directory, see :func:`prediction_dir`
+        task: Task name
+
+    Returns:
+        Shard paths ordered by shard id (empty if the task was not sharded)
+    """
+    found: Dict[int, Path] = {}
+    totals = set()
+    for path in Path(directory).glob(f"{task}.shard-*-of-*.jsonl"):
+        match = _SHARD_PATTERN.match(path.name)
+        if match and match.group("task") == task:
+            found[int(match.group("id"))] = path
+            totals.add(int(match.group("total")))
+    if not found:
+        return []
+    if len(totals) != 1:
+        raise ValueError(f"Shards of {task} in {directory} disagree on the shard count")
+    total = totals.pop()
+    missing = sorted(set(range(total)) - set(found))
+    if missing:
+        raise ValueError(
+            f"Missing shards {missing} of {total} for {task} in {directory}"
+        )
+    return [found[i] for i in range(total)]
+
+
+def merge_shards(
+    output_dir: Union[str, Path],
+    model_name: str,
+    split: str,
+    tasks: Optional[Sequence[str]] = None,
+    config: Optional[Dict[str, Any]] = None,
+    dataset=None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Merge shard predictions and compute the final metrics once.
+
+    Each shard is accumulated into its own metric state; the states are
+    merged from their sufficient statistics and computed once. The shard
+    records are also merged in dataset order into ``{task}.jsonl`` and the
+    metrics written to ``metrics.json`` in the prediction directory.
+
+    Args:
+        output_dir: Run output directory
+        model_name: Name of the evaluated model
+        split: Data split
+        tasks: Tasks to merge. Defaults to every task with shards.
+        config: Benchmark configuration
+        dataset: Dataset of the split, for the CIDEr-D document frequencies.
+            Opened from the configured ``data_dir`` if it has the split;
+            otherwise they are counted in a first pass over the shards.
+
+    Returns:
+        Dictionary containing evaluation results per task
+    """
+    config = config or {}
+    directory = prediction_dir(output_dir, model_name, split)
+    if dataset is None:
+        # Imported here: the dataset module pulls in torch
+        from .datasets import CamouflageDataset
+
+        dataset = CamouflageDataset.from_config(config, split=split)
+        if not len(dataset):
+            dataset = None
+    results = {}
+    for task in tasks or TASKS:
+        paths = find_shards(directory, task)
+        if not paths:
+            if tasks:
+                raise ValueError(f"No shards found for {task} in {directory}")
+            continue
+
+        if dataset is not None:
+            corpus = build_corpus(task, dataset, config)
+        else:
+            corpus = records_corpus(
+                task,
+                (record for path in paths for record in read_predictions(path)),
+                config,
+            )
+        metrics = [build_metric(task, config, corpus=corpus) for _ in paths]
+
+        def accumulate(path: Path, metric) -> Iterator[Dict]:
+            for record in read_predictions(path):
+                metric.update((record,))
+                yield record
+
+        streams = [accumulate(path, metric) for path, metric in zip(paths, metrics)]
+        ordered = heapq.merge(
+            *streams, key=lambda r: (r["index"], r.get("query_id", 0))
+        )
+        identities = [read_metadata(path).get("model") for path in paths]
+        if any(identity != identities[0] for identity in identities):
+            raise ValueError(
+                f"Shards of {task} in {directory} were written by different models"
+            )
+        metadata = {
+            "model": identities[0] or {"name": model_name, "config": {}},
+            "split": split,
+            "task": task,
+            "shards": len(paths),
+        }
+        with PredictionWriter(directory / f"{task}.jsonl", metadata=metadata) as writer:
+            for record in ordered:
+                writer.write(record)
+                writer.commit()
+
+        merged = metrics[0]
+        for metric in metrics[1:]:
+            merged.merge(metric)
+        results[task] = select_metrics(task, merged.compute(), config)
+
+    if not results:
+        raise ValueError(f"No shards found in {directory}")
+    with open(directory / "metrics.json", "w") as f:
+        json.dump(results, f, indent=2)
+    return results
@@ -0,0 +1,230 @@
+"""
+Shared-memory handoff of decoded images between processes
+
+Sending a decoded image to another process through a ``multiprocessing``
+queue pickles it, writes it through a pipe and unpickles it again.
+:class:`SharedImageRing` preallocates a fixed number of ``(H, W, 3)`` uint8
+slots in one :class:`multiprocessing.shared_memory.SharedMemory` block and
+passes only slot numbers and small metadata through its queues:
+
+* a producer takes a free slot with :meth:`~SharedImageRing.acquire`, writes
+  the pixels into :meth:`~SharedImageRing.slot` and hands it on with
+  :meth:`~SharedImageRing.publish`;
+* a consumer in any process gets ``(slot, metadata)`` from
+  :meth:`~SharedImageRing.receive`, reads the slot in place and returns it
+  with :meth:`~SharedImageRing.release`.
+
+:func:`stream_shared_images` runs loader processes that decode dataset items
+straight into the slots (:meth:`CamouflageDataset.load_image` with ``out``);
+the slot numbers can then be forwarded to model worker processes. The
+number of slots bounds how far loading runs ahead of the models.
+
+Example::
+
+    with SharedImageRing.from_dataset(dataset, num_slots=64) as ring:
+        for idx, slot, present in stream_shared_images(dataset, indices, ring):
+            model_queue.put((idx, slot))  # the model worker releases the slot
+"""
+
+import multiprocessing
+import os
+import queue
+import traceback
+from multiprocessing import shared_memory
+from typing import Any, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+_WORKER_DONE = "done"
+_WORKER_FAILED = "failed"
+_POLL_INTERVAL = 0.5
+
+
+class SharedImageRing:
+    """
+    Fixed pool of image slots in shared memory.
+
+    The ring is created in the parent process and passed to child processes
+    as a ``Process`` argument; children attach to the same memory block and
+    queues. The creator unlinks the block on :meth:`close`.
+    """
+
+    def __init__(self, num_slots: int, image_size: Tuple[int, int], context=None):
+        """
+        Allocate the slots.
+
+        Args:
+            num_slots: Number of images that can be in flight at once
+            image_size: Image ``(height, width)``
+            context: ``multiprocessing`` context of the processes using the ring
+        """
+        if num_slots < 1:
+            raise ValueError("A shared image ring needs at least one slot")
+        context = context or multiprocessing.get_context()
+        self.num_slots = num_slots
+        self.shape = (num_slots, int(image_size[0]), int(image_size[1]), 3)
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(self.shape))
+        )
+        self.name = self._shm.name
+        self._creator = os.getpid()
+        self._array = np.ndarray(self.shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._free = context.Queue()
+        self._ready = context.Queue()
+        for slot in range(num_slots):
+            self._free.put(slot)
+
+    @classmethod
+    def from_dataset(
+        cls, dataset, num_slots: int = 64, context=None
+    ) -> "SharedImageRing":
+        """Create a ring with slots of the dataset's ``image_size``."""
+        if dataset.image_size is None:
+            raise ValueError("A shared image ring requires a dataset image_size")
+        return cls(num_slots, dataset.image_size, context=context)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_shm=None, _array=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=self.name)
+        self._array = np.ndarray(self.shape, dtype=np.uint8, buffer=self._shm.buf)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the shared memory block."""
+        return self._array.nbytes
+
+    def slot(self, slot: int) -> np.ndarray:
+        """Writable ``(H, W, 3)`` view of a slot, without copying."""
+        return self._array[slot]
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """Take a free slot, waiting until a consumer releases one."""
+        return self._free.get(timeout=timeout)
+
+    def release(self, slot: int):
+        """Return a slot to the free list once its image has been consumed."""
+        self._free.put(slot)
+
+    def publish(self, slot: Optional[int], meta: Any = None):
+        """Hand a filled slot (and picklable metadata) to the consumers."""
+        self._ready.put((slot, meta))
+
+    def receive(self, timeout: Optional[float] = None) -> Tuple[Optional[int], Any]:
+        """Get the next published ``(slot, metadata)``."""
+        return self._ready.get(timeout=timeout)
+
+    def close(self):
+        """Detach from the memory block, and free it in the creating process."""
+        if self._shm is None:
+            return
+        self._array = None
+        self._shm.close()
+        # Forked children inherit the ring object but must not free the block
+        if os.getpid() == self._creator:
+            self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self) -> "SharedImageRing":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _load_worker(dataset, indices: Sequence[int], ring: SharedImageRing):
+    try:
+        for idx in indices:
+            slot = ring.acquire()
+            present = dataset.load_image(idx, out=ring.slot(slot)) is not None
+            if not present:
+                ring.slot(slot)[...] = 0
+            ring.publish(slot, (idx, present))
+        ring.publish(None, (_WORKER_DONE, None))
+    except BaseException:  # surfaced in the consumer
+        ring.publish(None, (_WORKER_FAILED, traceback.format_exc()))
+    finally:
+        ring.close()
+
+
+def stream_shared_images(
+    dataset,
+    indices: Sequence[int],
+    ring: SharedImageRing,
+    num_workers: int = 2,
+    context=None,
+    timeout: Optional[float] = None,
+) -> Iterator[Tuple[int, int, bool]]:
+    """
+    Decode dataset images into ring slots in loader processes.
+
+    Items are split round-robin over the workers and arrive in completion
+    order. The caller owns every yielded slot and must :meth:`release` it,
+    possibly from another process, once the image has been used.
+
+    Args:
+        dataset: :class:`CamouflageDataset` with an ``image_size``
+        indices: Items to load
+        ring: Ring with slots of the dataset's image size
+        num_workers: Loader processes
+        context: ``multiprocessing`` context; must match the ring's
+        timeout: Seconds to wait for the next image before giving up
+
+    Yields:
+        ``(index, slot, whether the item has an image)``; missing images are
+        zero-filled slots
+    """
+    indices = list(indices)
+    if not indices:
+        return
+    context = context or multiprocessing.get_context()
+    num_workers = max(1, min(num_workers, len(indices)))
+    workers = [
+        context.Process(
+            target=_load_worker,
+            args=(dataset, indices[w::num_workers], ring),
+            name=f"mmcsbench-shm-load-{w}",
+            daemon=True,
+        )
+        for w in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    running = num_workers
+    try:
+        while running:
+            waited = 0.0
+            while True:
+                try:
+                    slot, meta = ring.receive(timeout=_POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    # A worker killed before reporting would otherwise hang the stream
+                    crashed = [w for w in workers if w.exitcode not in (None, 0)]
+                    if crashed:
+                        raise RuntimeError(
+                            f"Image loader process {crashed[0].name} exited "
+                            f"with code {crashed[0].exitcode}"
+                        ) from None
+                    waited += _POLL_INTERVAL
+                    if timeout is not None and waited >= timeout:
+                        raise TimeoutError(
+                            "Timed out waiting for a shared image"
+                        ) from None
+            if slot is None:
+                status, detail = meta
+                if status == _WORKER_FAILED:
+                    raise RuntimeError(f"Image loader process failed:\n{detail}")
+                running -= 1
+                continue
+            idx, present = meta
+            yield idx, slot, present
+    finally:
+        for worker in workers:
+            if worker.is_alive() and running:
+                worker.terminate()
+            worker.join()
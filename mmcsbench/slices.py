@@ -0,0 +1,657 @@
+"""
+Slice analytics over per-sample predictions
+
+:class:`PredictionFrame` loads the prediction records of one model and task
+into columns: integer codes for the slice dimensions (``category``,
+``difficulty`` and, for reasoning, ``question_type``) and a matrix of
+additive per-sample statistics, e.g. clipped n-gram matches, ROUGE-L,
+correct answers or confusion-matrix cells. Every metric is a function of
+column sums, so :func:`slice_metrics` computes all metrics for every
+combination of dimensions with one ``np.bincount`` per statistic, and
+bootstrap confidence intervals multiply a matrix of resampling counts with
+the statistics of a slice. Detection mAP is computed per slice from
+score-binned PR histograms and reported without an interval.
+
+Example::
+
+    report = slice_report({'my-model': {'reasoning': records}}, config)
+    write_report(report, 'results/')
+"""
+
+import json
+from collections import defaultdict
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .metrics import CiderCorpus, build_metric
+from .metrics.base import prediction_text
+from .metrics.captioning import MAX_N, SAMPLE_STATISTICS
+from .metrics.detection import (
+    IOU_THRESHOLDS,
+    histogram_average_precision,
+    match_images,
+    prepare_detections,
+)
+from .predictions import read_predictions
+from .tasks import TASKS
+
+DIMENSIONS = ("category", "difficulty", "question_type")
+
+
+def _dimension_values(record: Dict[str, Any], dimension: str) -> Optional[str]:
+    if dimension == "question_type":
+        reference = record.get("reference") or {}
+        value = reference.get("question_type")
+    else:
+        value = record.get(dimension)
+    return None if value is None else str(value)
+
+
+def _configured_values(config: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Slice values listed in the config, which fix the order of each dimension."""
+    tasks = config.get("tasks", {})
+    return {
+        "category": list(
+            tasks.get("classification", {}).get(
+                "categories", ["animal", "military", "adaptive", "natural"]
+            )
+        ),
+        "difficulty": list(
+            tasks.get("detection", {}).get(
+                "difficulty_levels", ["easy", "medium", "hard"]
+            )
+        ),
+        "question_type": list(tasks.get("reasoning", {}).get("question_types", [])),
+    }
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    numerator = np.asarray(numerator, dtype=np.float64)
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros_like(numerator),
+        where=np.asarray(denominator) > 0,
+    )
+
+
+class _TaskStatistics:
+    """Per-sample additive statistics of a task and the metrics from their sums."""
+
+    def __init__(
+        self, task: str, config: Dict[str, Any], corpus: Optional[CiderCorpus]
+    ):
+        self.task = task
+        self.metric = build_metric(task, config, corpus=corpus)
+
+    def statistics(self, records: Sequence[Dict]) -> np.ndarray:
+        raise NotImplementedError
+
+    def metrics(self, sums: np.ndarray) -> Dict[str, np.ndarray]:
+        """Metric values from statistic sums of shape (..., k)."""
+        raise NotImplementedError
+
+
+class _ClassificationStatistics(_TaskStatistics):
+    """Correct and top-5 flags plus one confusion-matrix cell per sample."""
+
+    def statistics(self, records: Sequence[Dict]) -> np.ndarray:
+        classified = [
+            self.metric.classify(
+                record.get("prediction"), record.get("reference") or {}
+            )
+            for record in records
+        ]
+        labels = list(self.metric.labels)
+        for gold, _, _ in classified:
+            if gold not in labels:
+                labels.append(gold)
+        self.labels = labels
+        codes = {label: code for code, label in enumerate(labels)}
+        width = (
+            len(labels) + 1
+        )  # the last column counts samples without a predicted label
+        stats = np.zeros((len(records), 2 + len(labels) * width))
+        for row, (gold, predicted, top5) in enumerate(classified):
+            guess = (
+                codes.get(predicted, len(labels))
+                if predicted is not None
+                else len(labels)
+            )
+            stats[row, 0] = gold == predicted
+            stats[row, 1] = top5
+            stats[row, 2 + codes[gold] * width + guess] = 1
+        return stats
+
+    def metrics(self, sums: np.ndarray) -> Dict[str, np.ndarray]:
+        num_labels = len(self.labels)
+        confusion = sums[..., 2:].reshape(*sums.shape[:-1], num_labels, num_labels + 1)
+        total = confusion.sum(axis=(-1, -2))
+        true_positive = np.diagonal(confusion[..., :num_labels], axis1=-2, axis2=-1)
+        support = confusion.sum(axis=-1)
+        predicted = confusion[..., :num_labels].sum(axis=-2)
+        precision = _ratio(true_positive, predicted)
+        recall = _ratio(true_positive, support)
+        f1 = _ratio(2 * precision * recall, precision + recall)
+        present = (support > 0) | (predicted > 0)
+        return {
+            "accuracy": _ratio(sums[..., 0], total),
+            "top5_accuracy": _ratio(sums[..., 1], total),
+            "macro_f1": _ratio((f1 * present).sum(axis=-1), present.sum(axis=-1)),
+            "weighted_f1": _ratio((f1 * support).sum(axis=-1), total),
+        }
+
+
+class _CaptionStatistics(_TaskStatistics):
+    """BLEU match counts, ROUGE-L, METEOR and CIDEr-D per sample."""
+
+    def statistics(self, records: Sequence[Dict]) -> np.ndarray:
+        stats = np.zeros((len(records), len(SAMPLE_STATISTICS) + 1))
+        stats[:, -1] = 1  # sample count
+        for row, record in enumerate(records):
+            sample = self.metric.sample_statistics(
+                record.get("prediction"), record.get("reference") or {}
+            )
+            if sample is not None:
+                stats[row, :-1] = sample
+        return stats
+
+    def caption_metrics(self, sums: np.ndarray) -> Dict[str, np.ndarray]:
+        matches = sums[..., :MAX_N]
+        totals = sums[..., MAX_N : 2 * MAX_N]
+        hyp_len, ref_len, rouge, meteor, cider, count = np.moveaxis(
+            sums[..., 2 * MAX_N :], -1, 0
+        )
+        tiny = 1e-9
+        log_precision = np.cumsum(np.log((matches + tiny) / (totals + tiny)), axis=-1)
+        brevity = np.where(hyp_len > ref_len, 1.0, np.exp(1 - _ratio(ref_len, hyp_len)))
+        scores = {}
+        for n in range(1, MAX_N + 1):
+            bleu = brevity * np.exp(log_precision[..., n - 1] / n)
+            scores[f"bleu_{n}"] = np.where(hyp_len > 0, bleu, 0.0)
+        scores["rouge_l"] = _ratio(rouge, count)
+        scores["meteor"] = _ratio(meteor, count)
+        scores["cider"] = _ratio(cider, count)
+        return scores
+
+    def metrics(self, sums: np.ndarray) -> Dict[str, np.ndarray]:
+        scores = self.caption_metrics(sums)
+        return {name: scores[name] for name in self.metric.names}
+
+
+class _ReasoningStatistics(_CaptionStatistics):
+    """Captioning statistics plus answer correctness."""
+
+    def statistics(self, records: Sequence[Dict]) -> np.ndarray:
+        correct = [
+            self.metric.is_correct(
+                prediction_text(record.get("prediction")), record.get("reference") or {}
+            )
+            for record in records
+        ]
+        return np.column_stack([super().statistics(records), correct])
+
+    def metrics(self, sums: np.ndarray) -> Dict[str, np.ndarray]:
+        scores = self.caption_metrics(sums[..., :-1])
+        return {
+            "accuracy": _ratio(sums[..., -1], sums[..., -2]),
+            "bleu_score": scores["bleu_4"],
+            "rouge_l": scores["rouge_l"],
+            "cider_score": scores["cider"],
+        }
+
+
+class _DetectionStatistics(_TaskStatistics):
+    """Ground-truth, detection and true-positive counts per sample; mAP detections."""
+
+    def statistics(self, records: Sequence[Dict]) -> np.ndarray:
+        prepared = [
+            prepare_detections(
+                record.get("prediction"),
+                record.get("reference") or {},
+                record.get("image_size"),
+                record.get("input_size"),
+            )
+            for record in records
+        ]
+        tp = match_images(
+            [boxes for boxes, _, _ in prepared], [gt for _, _, gt in prepared]
+        )
+        self.rows = np.repeat(
+            np.arange(len(records)), [len(boxes) for boxes, _, _ in prepared]
+        )
+        resolution = self.metric.score_resolution
+        scores = (
+            np.concatenate([s for _, s, _ in prepared]) if prepared else np.zeros(0)
+        )
+        self.keys = np.round(scores / resolution).astype(np.int64)
+        self.tp = (
+            np.concatenate(tp, axis=1)
+            if tp
+            else np.zeros((len(IOU_THRESHOLDS), 0), dtype=bool)
+        )
+        return (
+            np.column_stack(
+                [
+                    [len(gt) for _, _, gt in prepared],
+                    [len(boxes) for boxes, _, _ in prepared],
+                    [flags[0].sum() for flags in tp],
+                ]
+            )
+            .astype(np.float64)
+            .reshape(len(records), 3)
+        )
+
+    def metrics(self, sums: np.ndarray) -> Dict[str, np.ndarray]:
+        num_gt, num_det, hits = np.moveaxis(sums, -1, 0)
+        precision = _ratio(hits, num_det)
+        recall = _ratio(hits, num_gt)
+        return {
+            "precision": precision,
+            "recall": recall,
+            "f1_score": _ratio(2 * precision * recall, precision + recall),
+        }
+
+    def average_precision(
+        self, sample_groups: np.ndarray, num_groups: int, num_gt: np.ndarray
+    ) -> np.ndarray:
+        """mAP per group, from the detections of its samples (-1: none)."""
+        groups = sample_groups[self.rows]
+        keep = groups >= 0
+        groups, keys, tp = groups[keep], self.keys[keep], self.tp[:, keep]
+        bins, column = np.unique(keys, return_inverse=True)
+        flat = groups * len(bins) + column
+        counts = np.bincount(flat, minlength=num_groups * len(bins)).reshape(
+            num_groups, -1
+        )
+        hits = (
+            np.stack(
+                [
+                    np.bincount(flat, weights=flags, minlength=num_groups * len(bins))
+                    for flags in tp
+                ]
+            ).reshape(len(tp), num_groups, -1)
+            if len(tp)
+            else np.zeros((0, num_groups, 0))
+        )
+        return np.array(
+            [
+                histogram_average_precision(
+                    counts[g], hits[:, g], int(num_gt[g])
+                ).mean()
+                for g in range(num_groups)
+            ]
+        )
+
+
+_STATISTICS = {
+    "detection": _DetectionStatistics,
+    "classification": _ClassificationStatistics,
+    "reasoning": _ReasoningStatistics,
+    "description": _CaptionStatistics,
+}
+
+
+class PredictionFrame:
+    """
+    Columnar view of the prediction records of one model and task.
+
+    Attributes:
+        codes: Integer code per sample for each dimension (-1 if missing)
+        vocabularies: Values of each dimension, indexed by code
+        statistics: Additive per-sample statistics, shape (samples, k)
+    """
+
+    def __init__(
+        self,
+        task: str,
+        model: str,
+        codes: Dict[str, np.ndarray],
+        vocabularies: Dict[str, List[str]],
+        statistics: np.ndarray,
+        stats: _TaskStatistics,
+    ):
+        self.task = task
+        self.model = model
+        self.codes = codes
+        self.vocabularies = vocabularies
+        self.statistics = statistics
+        self._stats = stats
+
+    @classmethod
+    def from_records(
+        cls,
+        task: str,
+        records: Iterable[Dict],
+        model: str = "",
+        config: Optional[Dict[str, Any]] = None,
+        corpus: Optional[CiderCorpus] = None,
+    ) -> "PredictionFrame":
+        """
+        Build a frame from prediction records.
+
+        Args:
+            task: Task name
+            records: Prediction records of the task
+            model: Model name
+            config: Benchmark configuration
+            corpus: CIDEr-D document frequencies. Computed from the records'
+                references if not given.
+
+        Returns:
+            The frame
+        """
+        if task not in TASKS:
+            raise ValueError(f"Unknown task: {task}")
+        config = config or {}
+        records = list(records)
+        stats = _STATISTICS[task](task, config, corpus)
+        if corpus is None and hasattr(stats.metric, "references"):
+            corpus = CiderCorpus.from_references(
+                stats.metric.references(record.get("reference") or {})
+                for record in records
+            )
+            stats.metric = build_metric(task, config, corpus=corpus)
+
+        configured = _configured_values(config)
+        codes, vocabularies = {}, {}
+        for dimension in DIMENSIONS:
+            values = [_dimension_values(record, dimension) for record in records]
+            present = {value for value in values if value is not None}
+            vocabulary = [v for v in configured[dimension] if v in present]
+            vocabulary += sorted(present - set(vocabulary))
+            lookup = {value: code for code, value in enumerate(vocabulary)}
+            codes[dimension] = np.array(
+                [
+                    lookup.get(value, -1) if value is not None else -1
+                    for value in values
+                ],
+                dtype=np.int64,
+            )
+            vocabularies[dimension] = vocabulary
+        return cls(task, model, codes, vocabularies, stats.statistics(records), stats)
+
+    def __len__(self) -> int:
+        return len(self.statistics)
+
+
+def bootstrap_sums(
+    statistics: np.ndarray,
+    num_samples: int,
+    rng: np.random.Generator,
+    max_cells: int = 1 << 22,
+) -> np.ndarray:
+    """
+    Column sums of bootstrap resamples.
+
+    Each resample is a row of draw counts per sample; the sums are the
+    product of that resampling matrix with the statistics.
+
+    Args:
+        statistics: Per-sample statistics, shape (n, k)
+        num_samples: Number of resamples
+        rng: Random generator
+        max_cells: Largest resampling matrix built at once
+
+    Returns:
+        Sums of shape (num_samples, k)
+    """
+    n = len(statistics)
+    sums = np.zeros((num_samples, statistics.shape[1]))
+    if not n:
+        return sums
+    rows = max(1, max_cells // max(n, 1))
+    for start in range(0, num_samples, rows):
+        count = min(rows, num_samples - start)
+        draws = rng.integers(0, n, size=(count, n)) + (np.arange(count) * n)[:, None]
+        weights = np.bincount(draws.ravel(), minlength=count * n).astype(np.float64)
+        sums[start : start + count] = weights.reshape(count, n) @ statistics
+    return sums
+
+
+def slice_metrics(
+    frame: PredictionFrame,
+    dimensions: Optional[Sequence[str]] = None,
+    num_bootstrap: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Compute every metric for every combination of slice dimensions.
+
+    Args:
+        frame: Predictions of one model and task
+        dimensions: Dimensions to slice by. Defaults to those present in the frame.
+        num_bootstrap: Bootstrap resamples per slice (0 disables intervals)
+        confidence: Coverage of the percentile intervals
+        seed: Random seed of the resampling
+
+    Returns:
+        One row per slice with ``slice`` (dimension values, empty for the
+        whole split), ``count``, ``metrics`` and ``ci`` (``[low, high]``
+        per metric)
+    """
+    if dimensions is None:
+        dimensions = [d for d in DIMENSIONS if frame.vocabularies[d]]
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence) / 2 * 100
+    rows = []
+    for size in range(len(dimensions) + 1):
+        for subset in combinations(dimensions, size):
+            valid = np.ones(len(frame), dtype=bool)
+            for dimension in subset:
+                valid &= frame.codes[dimension] >= 0
+            shape = [len(frame.vocabularies[d]) for d in subset]
+            if subset:
+                keys = np.ravel_multi_index(
+                    [frame.codes[d][valid] for d in subset], shape
+                )
+                groups, inverse = np.unique(keys, return_inverse=True)
+            else:
+                groups, inverse = np.zeros(1, dtype=np.int64), np.zeros(
+                    int(valid.sum()), np.int64
+                )
+            statistics = frame.statistics[valid]
+            sums = np.stack(
+                [
+                    np.bincount(inverse, weights=column, minlength=len(groups))
+                    for column in statistics.T
+                ],
+                axis=1,
+            )
+            counts = np.bincount(inverse, minlength=len(groups))
+            values = frame._stats.metrics(sums)
+            if isinstance(frame._stats, _DetectionStatistics):
+                sample_groups = np.full(len(frame), -1, dtype=np.int64)
+                sample_groups[valid] = inverse
+                values = {
+                    "mAP": frame._stats.average_precision(
+                        sample_groups, len(groups), sums[:, 0]
+                    ),
+                    **values,
+                }
+
+            intervals: Dict[str, np.ndarray] = {}
+            if num_bootstrap:
+                order = np.argsort(inverse, kind="stable")
+                bounds = np.concatenate([[0], np.cumsum(counts)])
+                resampled = np.stack(
+                    [
+                        bootstrap_sums(
+                            statistics[order[bounds[g] : bounds[g + 1]]],
+                            num_bootstrap,
+                            rng,
+                        )
+                        for g in range(len(groups))
+                    ]
+                )
+                intervals = {
+                    name: np.moveaxis(
+                        np.percentile(samples, [tail, 100 - tail], axis=1), 0, -1
+                    )
+                    for name, samples in frame._stats.metrics(resampled).items()
+                }
+
+            coordinates = np.unravel_index(groups, shape) if subset else []
+            for g in range(len(groups)):
+                rows.append(
+                    {
+                        "slice": {
+                            d: frame.vocabularies[d][int(coordinates[i][g])]
+                            for i, d in enumerate(subset)
+                        },
+                        "count": int(counts[g]),
+                        "metrics": {
+                            name: float(value[g]) for name, value in values.items()
+                        },
+                        "ci": {
+                            name: [float(v) for v in interval[g]]
+                            for name, interval in intervals.items()
+                        },
+                    }
+                )
+    return rows
+
+
+def slice_report(
+    predictions: Dict[str, Dict[str, Iterable[Dict]]],
+    config: Optional[Dict[str, Any]] = None,
+    num_bootstrap: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Slice metrics of several models and tasks.
+
+    CIDEr-D document frequencies are computed once per task over the
+    references of every model's records, so all models share them.
+
+    Args:
+        predictions: Records per task per model name
+        config: Benchmark configuration
+        num_bootstrap: Bootstrap resamples per slice
+        confidence: Coverage of the intervals
+        seed: Random seed of the resampling
+
+    Returns:
+        ``{'confidence': ..., 'models': {model: {task: [slice rows]}}}``
+    """
+    config = config or {}
+    records = {
+        model: {task: list(task_records) for task, task_records in tasks.items()}
+        for model, tasks in predictions.items()
+    }
+    corpora: Dict[str, CiderCorpus] = {}
+    for task in TASKS:
+        metric = build_metric(task, config)
+        if not hasattr(metric, "references"):
+            continue
+        references: Dict[Tuple[Any, Any], List[str]] = {}
+        for tasks in records.values():
+            for record in tasks.get(task, ()):
+                key = (
+                    record.get("index", record.get("image_id")),
+                    record.get("query_id", 0),
+                )
+                references.setdefault(
+                    key, metric.references(record.get("reference") or {})
+                )
+        if references:
+            corpora[task] = CiderCorpus.from_references(references.values())
+
+    report: Dict[str, Any] = {
+        "confidence": confidence,
+        "num_bootstrap": num_bootstrap,
+        "models": defaultdict(dict),
+    }
+    for model, tasks in records.items():
+        for task, task_records in tasks.items():
+            frame = PredictionFrame.from_records(
+                task, task_records, model, config, corpus=corpora.get(task)
+            )
+            report["models"][model][task] = slice_metrics(
+                frame, num_bootstrap=num_bootstrap, confidence=confidence, seed=seed
+            )
+    report["models"] = dict(report["models"])
+    return report
+
+
+def load_predictions(
+    output_dir: Union[str, Path], split: str = "test"
+) -> Dict[str, Dict[str, Iterable[Dict]]]:
+    """
+    Find the merged prediction files of every model in a run output directory.
+
+    Args:
+        output_dir: Run output directory
+        split: Data split
+
+    Returns:
+        Record streams per task per model directory name
+    """
+    predictions: Dict[str, Dict[str, Iterable[Dict]]] = {}
+    for model_dir in sorted((Path(output_dir) / "predictions").glob("*")):
+        for task in TASKS:
+            path = model_dir / split / f"{task}.jsonl"
+            if path.exists():
+                predictions.setdefault(model_dir.name, {})[task] = read_predictions(
+                    path
+                )
+    return predictions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Format the per-slice metrics of a report as Markdown tables, one per task."""
+    level = int(round(report["confidence"] * 100))
+    lines = ["# MMCSBench slice report", ""]
+    by_task: Dict[str, List[Tuple[str, Dict[str, Any]]]] = defaultdict(list)
+    for model, tasks in report["models"].items():
+        for task, rows in tasks.items():
+            by_task[task].extend((model, row) for row in rows)
+    for task in TASKS:
+        if task not in by_task:
+            continue
+        names = list(by_task[task][0][1]["metrics"])
+        lines += [
+            f"## {task}",
+            "",
+            "| model | slice | n | " + " | ".join(names) + " |",
+            "|---|---|---:|" + "---:|" * len(names),
+        ]
+        for model, row in by_task[task]:
+            label = ", ".join(f"{k}={v}" for k, v in row["slice"].items()) or "all"
+            cells = []
+            for name in names:
+                value = f"{row['metrics'][name]:.4f}"
+                if name in row["ci"]:
+                    low, high = row["ci"][name]
+                    value += f" [{low:.3f}, {high:.3f}]"
+                cells.append(value)
+            lines.append(
+                f"| {model} | {label} | {row['count']} | " + " | ".join(cells) + " |"
+            )
+        lines.append("")
+    lines.append(
+        f"Brackets: {level}% bootstrap confidence intervals "
+        f'({report["num_bootstrap"]} resamples).'
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_report(report: Dict[str, Any], output_dir: Union[str, Path]) -> Path:
+    """
+    Write ``slices.json`` and ``report.md`` to a directory.
+
+    Returns:
+        Path of the Markdown report
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / "slices.json", "w") as f:
+        json.dump(report, f, indent=2)
+    path = output_dir / "report.md"
+    path.write_text(format_report(report))
+    return path
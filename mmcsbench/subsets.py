@@ -0,0 +1,325 @@
+"""
+Deterministic stratified subsets of a split for fast smoke evaluations
+
+:func:`load_subset` draws a fixed-size sample of a split's items that keeps
+the proportions of every category × difficulty × task-combination stratum
+(largest-remainder allocation, items picked per stratum with a seeded
+generator), and stores the indices in an index file under
+``{data_dir}/subsets``. Later runs with the same split, size, seed and tasks
+read the file, so every checkpoint is evaluated on the same items; the file is
+redrawn when the split's annotations change.
+
+:func:`subset_report` then says how far the subset metrics can be from the
+full-split metrics: a bootstrap interval over the subset's samples, narrowed
+by the finite-population correction ``sqrt((N - n) / (N - 1))``, and, given
+the full-split results of an earlier run of the same model, the actual
+differences.
+
+Example::
+
+    subset = load_subset(dataset, 500, tasks)
+    results = evaluator.evaluate_tasks(model, tasks, subset=subset['indices'],
+                                       output_dir=output_dir)
+    report = subset_report(records_per_task, subset, config, reference=full_results)
+"""
+
+import json
+import math
+import os
+import warnings
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .metrics import CiderCorpus, select_metrics
+from .slices import PredictionFrame, slice_metrics
+from .tasks import TASKS
+
+SUBSET_VERSION = 1
+
+
+def parse_subset(spec: str) -> Union[int, float]:
+    """
+    Parse a subset size: an item count, or a fraction of the split below 1.
+
+    Args:
+        spec: E.g. ``'500'`` or ``'0.05'``
+
+    Returns:
+        Item count or fraction
+    """
+    try:
+        size = float(spec) if "." in spec else int(spec)
+    except ValueError:
+        raise ValueError(
+            f"Invalid subset '{spec}', expected an item count or a fraction"
+        ) from None
+    if size <= 0 or (isinstance(size, float) and size >= 1):
+        raise ValueError(
+            f"Invalid subset '{spec}': need a count >= 1 or a fraction in (0, 1)"
+        )
+    return size
+
+
+def subset_size(size: Union[int, float], total: int) -> int:
+    """Number of items of a subset given as a count or as a fraction below 1."""
+    if isinstance(size, float) and 0 < size < 1:
+        return max(1, round(size * total)) if total else 0
+    if size < 1 or int(size) != size:
+        raise ValueError(
+            f"A subset is a positive item count or a fraction in (0, 1), got {size}"
+        )
+    return min(int(size), total)
+
+
+def strata(
+    dataset, tasks: Sequence[str] = TASKS
+) -> Dict[Tuple[str, str, Tuple[str, ...]], List[int]]:
+    """
+    Group the items annotated for any of the tasks by stratum.
+
+    Args:
+        dataset: :class:`CamouflageDataset` of the split
+        tasks: Tasks whose items are sampled
+
+    Returns:
+        Item indices per ``(category, difficulty, tasks of the item)``
+    """
+    task_sets: Dict[int, List[str]] = defaultdict(list)
+    for task in tasks:
+        for idx in dataset.get_task_indices(task):
+            task_sets[idx].append(task)
+    groups: Dict[Tuple[str, str, Tuple[str, ...]], List[int]] = defaultdict(list)
+    for idx in sorted(task_sets):
+        annotation = dataset.get_annotation(idx)
+        key = (
+            str(annotation.get("category", "")),
+            str(annotation.get("difficulty", "")),
+            tuple(task_sets[idx]),
+        )
+        groups[key].append(idx)
+    return dict(groups)
+
+
+def stratified_sample(
+    groups: Dict[Any, List[int]], size: int, seed: int = 0
+) -> List[int]:
+    """
+    Sample items so that every stratum keeps its share of the split.
+
+    Args:
+        groups: Item indices per stratum, see :func:`strata`
+        size: Number of items to draw
+        seed: Random seed
+
+    Returns:
+        Sorted item indices
+    """
+    keys = sorted(groups)
+    total = sum(len(groups[key]) for key in keys)
+    if not total or size <= 0:
+        return []
+    quotas = [size * len(groups[key]) / total for key in keys]
+    counts = [math.floor(quota) for quota in quotas]
+    # Largest remainders get the items lost to rounding down; ties go to the larger
+    # stratum
+    order = sorted(
+        range(len(keys)),
+        key=lambda i: (counts[i] - quotas[i], -len(groups[keys[i]]), i),
+    )
+    for i in order[: size - sum(counts)]:
+        counts[i] += 1
+    rng = np.random.default_rng(seed)
+    chosen: List[int] = []
+    for key, count in zip(keys, counts):
+        members = np.asarray(groups[key])
+        chosen.extend(members[rng.permutation(len(members))[:count]].tolist())
+    return sorted(chosen)
+
+
+def _source_signature(dataset) -> Optional[Dict[str, int]]:
+    path = Path(dataset.data_dir) / "annotations" / f"{dataset.split}.json"
+    try:
+        stat = path.stat()
+    except OSError:
+        pack = getattr(dataset, "pack", None)
+        return pack.source if pack is not None else None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def subset_name(
+    split: str, size: Union[int, float], seed: int = 0, tasks: Sequence[str] = TASKS
+) -> str:
+    """Name of a subset, used for its index file and output directory."""
+    name = f"{split}-subset-{size}-seed{seed}"
+    if set(tasks) != set(TASKS):
+        name += "-" + "-".join(task for task in TASKS if task in tasks)
+    return name
+
+
+def load_subset(
+    dataset,
+    size: Union[int, float],
+    tasks: Sequence[str] = TASKS,
+    seed: int = 0,
+    path: Optional[Union[str, Path]] = None,
+) -> Dict[str, Any]:
+    """
+    Read the subset's index file, drawing the sample and writing it if needed.
+
+    Args:
+        dataset: :class:`CamouflageDataset` of the split
+        size: Number of items, or a fraction of the split below 1
+        tasks: Tasks whose items are sampled
+        seed: Random seed
+        path: Index file. Defaults to ``{data_dir}/subsets/{name}.json``.
+
+    Returns:
+        Subset with ``name``, ``split``, ``size``, ``seed``, ``tasks``,
+        ``total`` (items in the split), ``indices`` and ``task_totals`` /
+        ``task_counts`` (items per task in the split and in the subset)
+    """
+    tasks = [task for task in TASKS if task in tasks]
+    name = subset_name(dataset.split, size, seed, tasks)
+    path = (
+        Path(path)
+        if path is not None
+        else Path(dataset.data_dir) / "subsets" / f"{name}.json"
+    )
+    source = _source_signature(dataset)
+    if path.exists():
+        with open(path, "r") as f:
+            subset = json.load(f)
+        if (
+            subset.get("version") == SUBSET_VERSION
+            and subset.get("source") == source
+            and subset.get("tasks") == tasks
+            and subset.get("seed") == seed
+            and subset.get("size") == size
+        ):
+            return subset
+
+    groups = strata(dataset, tasks)
+    total = sum(len(members) for members in groups.values())
+    indices = stratified_sample(groups, subset_size(size, total), seed)
+    selected = set(indices)
+    task_totals = {task: len(dataset.get_task_indices(task)) for task in tasks}
+    subset = {
+        "version": SUBSET_VERSION,
+        "name": name,
+        "split": dataset.split,
+        "size": size,
+        "seed": seed,
+        "tasks": tasks,
+        "source": source,
+        "total": total,
+        "task_totals": task_totals,
+        "task_counts": {
+            task: sum(idx in selected for idx in dataset.get_task_indices(task))
+            for task in tasks
+        },
+        "indices": indices,
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(subset, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        # Read-only data directory: the sample is deterministic, so it is redrawn
+        # next time
+        warnings.warn(f"Could not write subset index {path}: {e}")
+    return subset
+
+
+def subset_report(
+    records: Dict[str, Iterable[Dict]],
+    subset: Dict[str, Any],
+    config: Optional[Dict[str, Any]] = None,
+    corpora: Optional[Dict[str, Optional[CiderCorpus]]] = None,
+    reference: Optional[Dict[str, Dict[str, float]]] = None,
+    num_bootstrap: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Estimate how far subset metrics are from the full-split metrics.
+
+    Args:
+        records: Prediction records of the subset per task
+        subset: Subset from :func:`load_subset`
+        config: Benchmark configuration
+        corpora: CIDEr-D corpus of the full split per task
+        reference: Full-split results of the same model, per task
+        num_bootstrap: Bootstrap resamples
+        confidence: Coverage of the error bound
+        seed: Random seed of the resampling
+
+    Returns:
+        ``{'subset': name, 'confidence': ..., 'tasks': {task: {metric: row}}}``
+        with ``value``, ``error`` (bound on ``|subset - full|`` at the given
+        confidence, None for metrics without an interval) and, with a
+        reference, ``full`` and ``difference``
+    """
+    corpora = corpora or {}
+    reference = reference or {}
+    report: Dict[str, Any] = {
+        "subset": subset.get("name"),
+        "confidence": confidence,
+        "tasks": {},
+    }
+    for task, task_records in records.items():
+        frame = PredictionFrame.from_records(
+            task, task_records, config=config, corpus=corpora.get(task)
+        )
+        if not len(frame):
+            continue
+        row = slice_metrics(
+            frame,
+            dimensions=[],
+            num_bootstrap=num_bootstrap,
+            confidence=confidence,
+            seed=seed,
+        )[0]
+        n = subset["task_counts"].get(task, 0)
+        population = subset["task_totals"].get(task, 0)
+        correction = (
+            math.sqrt((population - n) / (population - 1)) if population > 1 else 0.0
+        )
+        rows = {}
+        for metric, value in select_metrics(task, row["metrics"], config).items():
+            entry: Dict[str, Any] = {"value": value, "error": None}
+            if metric in row["ci"]:
+                low, high = row["ci"][metric]
+                entry["error"] = max(value - low, high - value, 0.0) * correction
+            full = reference.get(task, {}).get(metric)
+            if full is not None:
+                entry["full"] = float(full)
+                entry["difference"] = value - float(full)
+            rows[metric] = entry
+        report["tasks"][task] = rows
+    return report
+
+
+def format_subset_report(report: Dict[str, Any]) -> str:
+    """Format a subset report as a Markdown table."""
+    lines = [
+        f"Subset {report['subset']}: metric ± bound on the difference to the "
+        f"full split ({report['confidence']:.0%} confidence)",
+        "",
+        "| task | metric | subset | ± | full | difference |",
+        "|---|---|---:|---:|---:|---:|",
+    ]
+    for task, rows in report["tasks"].items():
+        for metric, entry in rows.items():
+            error = "-" if entry["error"] is None else f"{entry['error']:.4f}"
+            full = f"{entry['full']:.4f}" if "full" in entry else "-"
+            difference = f"{entry['difference']:+.4f}" if "difference" in entry else "-"
+            lines.append(
+                f"| {task} | {metric} | {entry['value']:.4f} | {error} | {full} | "
+                f"{difference} |"
+            )
+    return "\n".join(lines) + "\n"
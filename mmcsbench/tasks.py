@@ -0,0 +1,122 @@
+"""
+Task definitions and prompt construction for MMCSBench
+
+Each annotation entry in ``annotations/{split}.json`` describes one image::
+
+    {
+        "image_id": "000123",
+        "image_file": "000123.jpg",
+        "category": "animal",
+        "difficulty": "hard",
+        "tasks": {
+            "detection": {"boxes": [[x1, y1, x2, y2], ...], "labels": [...]},
+            "classification": {"label": "animal"},
+            "reasoning": [{"question": "...", "answer": "...", "options": [...],
+                           "question_type": "factual"}, ...],
+            "description": {"captions": ["...", "..."]}
+        }
+    }
+
+A task annotation may be a single dict or a list of dicts; every dict is one
+query sent to the model for that image.
+"""
+
+from typing import Any, Dict, List, Optional
+
+TASKS = ("detection", "classification", "reasoning", "description")
+
+DEFAULT_PROMPTS = {
+    "detection": (
+        "Locate every camouflaged object in the image. Answer with one bounding "
+        "box per object as [x1, y1, x2, y2] in pixel coordinates."
+    ),
+    "classification": (
+        "Which type of camouflage does this image show? Answer with one of: "
+        "{categories}."
+    ),
+    "reasoning": "{question}",
+    "description": "Describe the camouflaged object and how it blends into the scene.",
+}
+
+
+def task_queries(task: str, task_annotation: Any) -> List[Dict]:
+    """
+    Normalize a task annotation into a list of queries.
+
+    Args:
+        task: Task name
+        task_annotation: Task annotation (dict, list of dicts or None)
+
+    Returns:
+        List of query annotations, one per model call
+    """
+    if task not in TASKS:
+        raise ValueError(f"Unknown task: {task}")
+    if task_annotation is None:
+        return []
+    if isinstance(task_annotation, list):
+        return [q if isinstance(q, dict) else {"value": q} for q in task_annotation]
+    if isinstance(task_annotation, dict):
+        return [task_annotation]
+    return [{"value": task_annotation}]
+
+
+def build_prompt(
+    task: str, query: Dict, config: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Build the model prompt for a single query.
+
+    An explicit ``prompt`` field in the query always wins over the task default.
+
+    Args:
+        task: Task name
+        query: Query annotation
+        config: Benchmark configuration
+
+    Returns:
+        Prompt text
+    """
+    if query.get("prompt"):
+        return query["prompt"]
+
+    config = config or {}
+    task_config = config.get("tasks", {}).get(task, {})
+    template = task_config.get("prompt", DEFAULT_PROMPTS[task])
+
+    if task == "classification":
+        categories = task_config.get(
+            "categories", ["animal", "military", "adaptive", "natural"]
+        )
+        return template.format(categories=", ".join(categories))
+    if task == "reasoning":
+        question = query.get("question", "")
+        options = query.get("options")
+        prompt = template.format(question=question)
+        if options:
+            letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+            lines = [f"{letters[i]}. {option}" for i, option in enumerate(options)]
+            prompt = prompt + "\n" + "\n".join(lines)
+        return prompt
+    return template
+
+
+def generation_kwargs(
+    task: str, config: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Collect generation keyword arguments configured for a task.
+
+    Args:
+        task: Task name
+        config: Benchmark configuration
+
+    Returns:
+        Keyword arguments forwarded to the model's generate call
+    """
+    config = config or {}
+    task_config = config.get("tasks", {}).get(task, {})
+    kwargs = dict(task_config.get("generation", {}))
+    if "max_length" in task_config:
+        kwargs.setdefault("max_length", task_config["max_length"])
+    return kwargs
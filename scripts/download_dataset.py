@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 """
 Script to download the MMCSBench dataset.
+
+Without ``--manifest`` the script only creates the directory structure and
+placeholder metadata. With a manifest it downloads, verifies and extracts the
+dataset files in parallel; rerunning it resumes an interrupted download.
 """
 
-import os
 import argparse
+import importlib.util
+import os
+import sys
+import time
 from pathlib import Path
 
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
 
 def download_dataset(data_dir: str = "data/", force: bool = False):
     """
@@ -18,11 +27,11 @@ def download_dataset(data_dir: str = "data/", force: bool = False):
     """
     data_path = Path(data_dir)
     data_path.mkdir(parents=True, exist_ok=True)
-    
+
     print("MMCSBench Dataset Downloader")
     print("=" * 40)
     print(f"Target directory: {data_path.absolute()}")
-    
+
     # Create directory structure
     directories = [
         "annotations",
@@ -31,12 +40,12 @@ def download_dataset(data_dir: str = "data/", force: bool = False):
         "images/test",
         "metadata"
     ]
-    
+
     for dir_name in directories:
         dir_path = data_path / dir_name
         dir_path.mkdir(parents=True, exist_ok=True)
         print(f"Created directory: {dir_path}")
-    
+
     # Create placeholder annotation files
     annotation_files = ["train.json", "val.json", "test.json"]
     for file_name in annotation_files:
@@ -51,12 +60,12 @@ def download_dataset(data_dir: str = "data/", force: bool = False):
                 "images": [],
                 "annotations": []
             }
-            
+
             import json
             with open(file_path, 'w') as f:
                 json.dump(sample_annotation, f, indent=2)
             print(f"Created annotation file: {file_path}")
-    
+
     # Create dataset info file
     info_file = data_path / "metadata" / "dataset_info.json"
     if not info_file.exists() or force:
@@ -75,12 +84,12 @@ def download_dataset(data_dir: str = "data/", force: bool = False):
                 "difficulty_levels": ["easy", "medium", "hard"]
             }
         }
-        
+
         import json
         with open(info_file, 'w') as f:
             json.dump(dataset_info, f, indent=2)
         print(f"Created dataset info: {info_file}")
-    
+
     # Create README for data directory
     readme_file = data_path / "README.md" 
     if not readme_file.exists() or force:
@@ -130,7 +139,7 @@ If you use this dataset, please cite:
         with open(readme_file, 'w') as f:
             f.write(readme_content)
         print(f"Created data README: {readme_file}")
-    
+
     print("\nDataset structure created successfully!")
     print("\nNote: This script creates the directory structure and metadata files.")
     print("For the actual dataset images and annotations, please:")
@@ -139,16 +148,135 @@ If you use this dataset, please cite:
     print("3. Download the complete dataset files")
 
 
+def download_from_manifest(
+    data_dir: str,
+    manifest_source: str,
+    base_url: str = None,
+    num_workers: int = 16,
+    chunk_size_mb: int = 32,
+    extract: bool = True,
+    keep_archives: bool = True,
+    pack: bool = False,
+    force: bool = False,
+):
+    """
+    Download the dataset files listed in a manifest.
+
+    Args:
+        data_dir: Directory to download data to
+        manifest_source: URL or path of the manifest
+        base_url: Overrides the URL the manifest paths are relative to
+        num_workers: Concurrent range requests
+        chunk_size_mb: Megabytes per range request
+        extract: Whether to extract the image archives
+        keep_archives: Whether to keep archives after extracting them
+        pack: Whether to pack the downloaded splits into shard files
+        force: Whether to download files again that are already present
+    """
+    if importlib.util.find_spec("mmcsbench") is None:
+        # Running from a checkout without the package installed
+        sys.path.insert(0, str(REPO_ROOT))
+    from mmcsbench.download import Downloader, load_manifest
+
+    manifest, default_base = load_manifest(manifest_source)
+    last = [0.0]
+
+    def progress(done, total):
+        now = time.perf_counter()
+        if now - last[0] >= 1.0 or done == total:
+            last[0] = now
+            print(f"\r{done / 1e6:,.0f} / {total / 1e6:,.0f} MB", end="", flush=True)
+
+    downloader = Downloader(
+        data_dir,
+        num_workers=num_workers,
+        chunk_size=chunk_size_mb << 20,
+        progress=progress,
+    )
+    summary = downloader.fetch(
+        manifest,
+        base_url or default_base,
+        extract=extract,
+        keep_archives=keep_archives,
+        force=force,
+    )
+    seconds = max(summary["seconds"], 1e-9)
+    print(
+        f"\nDownloaded {len(summary['downloaded'])} files "
+        f"({summary['bytes'] / 1e6:,.1f} MB in {seconds:.1f}s, "
+        f"{summary['bytes'] / 1e6 / seconds:,.1f} MB/s), "
+        f"skipped {len(summary['skipped'])}, extracted {len(summary['extracted'])}"
+    )
+
+    if pack:
+        from mmcsbench.packed import write_pack
+
+        for split in ("train", "val", "test"):
+            if (Path(data_dir) / "annotations" / f"{split}.json").exists():
+                print(f"Packed {split}: {write_pack(data_dir, split)}")
+
+
 def main():
     parser = argparse.ArgumentParser(description='Download MMCSBench dataset')
     parser.add_argument('--data-dir', default='data/', 
                         help='Directory to download data to (default: data/)')
-    parser.add_argument('--force', action='store_true',
-                        help='Overwrite existing files')
-    
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Overwrite existing files (with --manifest: download them again)",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="URL or path of the dataset manifest to download",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=None,
+        help="URL the manifest paths are relative to (default: from the manifest)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="Concurrent range requests (default: 16)",
+    )
+    parser.add_argument(
+        "--chunk-size-mb",
+        type=int,
+        default=32,
+        help="Megabytes per range request (default: 32)",
+    )
+    parser.add_argument(
+        "--no-extract", action="store_true", help="Do not extract downloaded archives"
+    )
+    parser.add_argument(
+        "--delete-archives",
+        action="store_true",
+        help="Delete archives once they are extracted",
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Pack the downloaded splits into shard files",
+    )
+
     args = parser.parse_args()
-    download_dataset(args.data_dir, args.force)
+    if args.manifest:
+        download_from_manifest(
+            args.data_dir,
+            args.manifest,
+            args.base_url,
+            args.workers,
+            args.chunk_size_mb,
+            extract=not args.no_extract,
+            keep_archives=not args.delete_archives,
+            pack=args.pack,
+            force=args.force,
+        )
+    else:
+        download_dataset(args.data_dir, args.force)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
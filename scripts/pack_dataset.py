@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Script to pack MMCSBench splits into large shard files.
+
+Each split is written to ``{data_dir}/packed/{split}`` (see
+:mod:`mmcsbench.packed`); ``CamouflageDataset`` reads it instead of the
+per-image files when ``dataset.packed`` is enabled.
+"""
+
+import argparse
+import importlib.util
+import sys
+import time
+from pathlib import Path
+
+if importlib.util.find_spec("mmcsbench") is None:
+    # Running from a checkout without the package installed
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mmcsbench.packed import PackedSplit, write_pack  # noqa: E402
+
+
+def pack_dataset(
+    data_dir: str = "data/",
+    splits=("train", "val", "test"),
+    output_dir: str = None,
+    shard_size_mb: int = 1024,
+    num_workers: int = 8,
+):
+    """
+    Pack the given splits of a dataset directory.
+
+    Args:
+        data_dir: Dataset directory with ``annotations/`` and ``images/``
+        splits: Splits to pack; splits without an annotation file are skipped
+        output_dir: Directory the packs are written to (default: ``{data_dir}/packed``)
+        shard_size_mb: Approximate size of each shard file
+        num_workers: Threads reading image files
+    """
+    data_path = Path(data_dir)
+    output_path = Path(output_dir) if output_dir else data_path / "packed"
+    for split in splits:
+        if not (data_path / "annotations" / f"{split}.json").exists():
+            print(f"Skipping {split}: no annotations/{split}.json")
+            continue
+        start = time.perf_counter()
+        path = write_pack(
+            data_path,
+            split,
+            output_path / split,
+            shard_size=shard_size_mb << 20,
+            num_workers=num_workers,
+        )
+        pack = PackedSplit(path)
+        size = sum((path / shard).stat().st_size for shard in pack.meta["shards"])
+        print(
+            f"Packed {split}: {len(pack)} items "
+            f"in {len(pack.meta['shards'])} shard(s), "
+            f"{size / (1 << 20):.1f} MB, {time.perf_counter() - start:.1f}s -> {path}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack MMCSBench splits into shard files"
+    )
+    parser.add_argument(
+        "--data-dir", default="data/", help="Dataset directory (default: data/)"
+    )
+    parser.add_argument(
+        "--splits", nargs="+", default=["train", "val", "test"], help="Splits to pack"
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="Directory for the packs (default: DATA_DIR/packed)",
+    )
+    parser.add_argument(
+        "--shard-size-mb", type=int, default=1024, help="Approximate shard size in MB"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Threads reading image files"
+    )
+
+    args = parser.parse_args()
+    pack_dataset(
+        args.data_dir, args.splits, args.output_dir, args.shard_size_mb, args.workers
+    )
+
+
+if __name__ == "__main__":
+    main()
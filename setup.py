@@ -45,7 +45,12 @@ setup(
             "sphinx-rtd-theme>=1.0.0",
         ],
     },
+    entry_points={
+        "console_scripts": [
+            "mmcsbench=mmcsbench.cli:main",
+        ],
+    },
     include_package_data=True,
     zip_safe=False,
     keywords="computer vision, natural language processing, benchmark, camouflage, vision-language models",
-)
\ No newline at end of file
+)
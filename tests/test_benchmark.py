@@ -2,9 +2,13 @@
 Test module for MMCSBench benchmark functionality.
 """
 
-import pytest
+import json
+import os
 import tempfile
 from pathlib import Path
+
+import pytest
+
 from mmcsbench import MMCSBenchmark
 from mmcsbench.models import BaseModel
 
@@ -22,7 +26,7 @@ class DummyModel(BaseModel):
 
 class TestBenchmark:
     """Test cases for MMCSBenchmark class."""
-    
+
     def test_benchmark_initialization_with_dict_config(self):
         """Test benchmark initialization with dictionary config."""
         config = {
@@ -32,7 +36,7 @@ class TestBenchmark:
         benchmark = MMCSBenchmark(config=config)
         assert benchmark.data_dir == 'test_data/'
         assert benchmark.config == config
-    
+
     def test_benchmark_initialization_with_file_config(self):
         """Test benchmark initialization with file config."""
         # Create temporary config file
@@ -40,19 +44,19 @@ class TestBenchmark:
             'data_dir': 'file_test_data/',
             'evaluation': {'batch_size': 2}
         }
-        
+
         with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
             import yaml
             yaml.dump(config_data, f)
             config_file = f.name
-        
+
         try:
             benchmark = MMCSBenchmark(config=config_file)
             assert benchmark.data_dir == 'file_test_data/'
             assert benchmark.config['evaluation']['batch_size'] == 2
         finally:
             Path(config_file).unlink()  # Clean up temp file
-    
+
     def test_evaluate_with_dummy_model(self):
         """Test evaluation with dummy model."""
         config = {
@@ -61,19 +65,19 @@ class TestBenchmark:
         }
         benchmark = MMCSBenchmark(config=config)
         model = DummyModel()
-        
+
         # Test with specific tasks
         results = benchmark.evaluate(
             model=model,
             tasks=['classification', 'reasoning'],
             split='test'
         )
-        
+
         assert 'classification' in results
         assert 'reasoning' in results
         assert isinstance(results['classification'], dict)
         assert isinstance(results['reasoning'], dict)
-    
+
     def test_evaluate_all_tasks(self):
         """Test evaluation with all tasks."""
         config = {
@@ -82,10 +86,48 @@ class TestBenchmark:
         }
         benchmark = MMCSBenchmark(config=config)
         model = DummyModel()
-        
+
         # Test with all tasks (default)
         results = benchmark.evaluate(model=model, split='test')
-        
+
         expected_tasks = ['detection', 'classification', 'reasoning', 'description']
         for task in expected_tasks:
-            assert task in results
\ No newline at end of file
+            assert task in results
+
+
+def _write_split(root, split, answers):
+    annotations = [
+        {
+            "image_id": f"{split}{i}",
+            "image_file": f"{i}.jpg",
+            "tasks": {"reasoning": {"question": "What hides?", "answer": answer}},
+        }
+        for i, answer in enumerate(answers)
+    ]
+    (root / "annotations").mkdir(exist_ok=True)
+    path = root / "annotations" / f"{split}.json"
+    path.write_text(json.dumps(annotations))
+    return path
+
+
+def test_datasets_are_loaded_per_split_and_reloaded_on_change(tmp_path):
+    """Splits load lazily, task views are memoized and edited annotations reload."""
+    path = _write_split(tmp_path, "test", ["moth", "leaf"])
+    _write_split(tmp_path, "train", ["frog"])
+    benchmark = MMCSBenchmark(config={"data_dir": str(tmp_path)})
+    assert "test" not in benchmark.datasets and "train" not in benchmark.datasets
+
+    dataset = benchmark.get_dataset("test")
+    assert dataset.split == "test" and "train" not in benchmark.datasets
+    assert benchmark.get_dataset("test") is dataset
+    view = dataset.get_task_data("reasoning")
+    assert dataset.get_task_data("reasoning") is view
+    assert [item["answer"] for item in view] == ["moth", "leaf"]
+    assert view[1:] == [{"question": "What hides?", "answer": "leaf"}]
+
+    _write_split(tmp_path, "test", ["moth", "leaf", "stick insect"])
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reloaded = benchmark.get_dataset("test")
+    assert reloaded is not dataset
+    assert len(reloaded.get_task_data("reasoning")) == 3
@@ -0,0 +1,129 @@
+"""
+Test module for the persistent prediction cache.
+"""
+
+import json
+
+import pytest
+
+from mmcsbench.cache import PredictionCache, make_key
+from mmcsbench.datasets import CamouflageDataset
+from mmcsbench.engine import InferenceEngine
+from mmcsbench.models import BaseModel
+
+
+class CountingModel(BaseModel):
+    """Model that counts generate calls."""
+
+    def __init__(self, checkpoint="base"):
+        self.checkpoint = checkpoint
+        self.calls = 0
+
+    def cache_identity(self):
+        return {"checkpoint": self.checkpoint}
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        self.calls += 1
+        return f"answer to {prompt}"
+
+
+class CountingDataset(CamouflageDataset):
+    """Dataset that counts image loads."""
+
+    loads = 0
+
+    def __getitem__(self, idx):
+        CountingDataset.loads += 1
+        return super().__getitem__(idx)
+
+
+def _write_annotations(root, count):
+    annotations = [
+        {
+            "image_id": f"img{i}",
+            "image_file": f"{i}.jpg",
+            "tasks": {"reasoning": {"question": f"question {i}", "answer": "yes"}},
+        }
+        for i in range(count)
+    ]
+    (root / "annotations").mkdir()
+    with open(root / "annotations" / "test.json", "w") as f:
+        json.dump(annotations, f)
+
+
+def test_cache_roundtrip_and_refresh(tmp_path):
+    cache = PredictionCache(str(tmp_path / "cache.sqlite"))
+    key = make_key({"name": "m", "config": {}}, "prompt", {}, "abc")
+    cache.put(key, {"text": "hello"})
+    assert cache.get(key) == {"text": "hello"}
+
+    refreshing = PredictionCache(str(tmp_path / "cache.sqlite"), refresh=True)
+    assert refreshing.get(key) is None
+
+
+def test_cache_key_depends_on_every_component():
+    identity = {"name": "m", "config": {"temperature": 0}}
+    base = make_key(identity, "p", {"max_length": 8}, "img")
+    assert base != make_key(
+        {"name": "m", "config": {"temperature": 1}}, "p", {"max_length": 8}, "img"
+    )
+    assert base != make_key(identity, "q", {"max_length": 8}, "img")
+    assert base != make_key(identity, "p", {"max_length": 9}, "img")
+    assert base != make_key(identity, "p", {"max_length": 8}, "other")
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = PredictionCache(str(tmp_path / "cache.sqlite"), max_bytes=100)
+    cache.put("old", "x" * 30)
+    cache.put("recent", "y" * 30)
+    cache.get("old")
+    cache.put("new", "z" * 50)
+    assert cache.size_bytes() <= 100
+    assert cache.get("recent") is None
+    assert cache.get("old") == "x" * 30
+
+
+def test_engine_reuses_cached_predictions(tmp_path):
+    _write_annotations(tmp_path, 5)
+    dataset = CountingDataset(str(tmp_path), split="test")
+    cache = PredictionCache(str(tmp_path / "cache.sqlite"))
+    engine = InferenceEngine(batch_size=2, num_workers=0, cache=cache)
+
+    model = CountingModel()
+    first = list(engine.run(model, dataset, "reasoning"))
+    assert model.calls == 5
+
+    CountingDataset.loads = 0
+    second = list(engine.run(model, dataset, "reasoning"))
+    assert model.calls == 5
+    assert CountingDataset.loads == 0
+    assert [r["prediction"] for r in second] == [r["prediction"] for r in first]
+
+
+def test_engine_keys_cache_on_model_identity(tmp_path):
+    """Instances with other weights miss the cache; models without identity skip it."""
+    _write_annotations(tmp_path, 3)
+    dataset = CamouflageDataset(str(tmp_path), split="test")
+    engine = InferenceEngine(
+        batch_size=2,
+        num_workers=0,
+        cache=PredictionCache(str(tmp_path / "cache.sqlite")),
+    )
+    list(engine.run(CountingModel("base"), dataset, "reasoning"))
+
+    finetuned = CountingModel("finetuned")
+    list(engine.run(finetuned, dataset, "reasoning"))
+    assert finetuned.calls == 3
+
+    class Anonymous(CountingModel):
+        def cache_identity(self):
+            return None
+
+    for _ in range(2):
+        model = Anonymous()
+        with pytest.warns(UserWarning, match="Not caching"):
+            list(engine.run(model, dataset, "reasoning"))
+        assert model.calls == 3
@@ -0,0 +1,230 @@
+"""
+Test module for dataset handling.
+"""
+
+import json
+import os
+
+from mmcsbench.annotation_store import AnnotationStore
+from mmcsbench.datasets import CamouflageDataset
+
+
+def _annotations(count):
+    categories = ["animal", "military", "adaptive", "natural"]
+    difficulties = ["easy", "medium", "hard"]
+    annotations = []
+    for i in range(count):
+        tasks = {"classification": {"label": categories[i % 4]}}
+        if i % 3 == 0:
+            tasks["detection"] = {"boxes": [[0, 0, 10, 10]]}
+        annotations.append(
+            {
+                "image_id": f"img{i}",
+                "image_file": f"{i}.jpg",
+                "category": categories[i % 4],
+                "difficulty": difficulties[i % 3],
+                "tasks": tasks,
+            }
+        )
+    return annotations
+
+
+def _write(root, annotations, split="test"):
+    (root / "annotations").mkdir(exist_ok=True)
+    path = root / "annotations" / f"{split}.json"
+    with open(path, "w") as f:
+        json.dump(annotations, f)
+    return path
+
+
+def test_store_matches_json_annotations(tmp_path):
+    annotations = _annotations(50)
+    _write(tmp_path, annotations)
+    indexed = CamouflageDataset(str(tmp_path), split="test")
+    plain = CamouflageDataset(str(tmp_path), split="test", use_store=False)
+
+    assert isinstance(indexed.annotations, AnnotationStore)
+    assert len(indexed) == len(plain) == 50
+    assert indexed.get_annotation(7) == annotations[7]
+    for task in ("classification", "detection", "reasoning"):
+        assert indexed.get_task_indices(task) == plain.get_task_indices(task)
+        assert indexed.get_task_data(task) == plain.get_task_data(task)
+    assert indexed.get_indices(
+        task="detection", category="animal", difficulty="easy"
+    ) == plain.get_indices(task="detection", category="animal", difficulty="easy")
+
+
+def test_store_is_reused_and_rebuilt_when_stale(tmp_path):
+    path = _write(tmp_path, _annotations(10))
+    store = AnnotationStore.open(path)
+    meta_mtime = os.stat(store.path / "meta.json").st_mtime_ns
+
+    assert (
+        os.stat(AnnotationStore.open(path).path / "meta.json").st_mtime_ns == meta_mtime
+    )
+
+    _write(tmp_path, _annotations(12))
+    assert len(AnnotationStore.open(path)) == 12
+
+
+def test_dict_annotation_file(tmp_path):
+    (tmp_path / "annotations").mkdir()
+    with open(tmp_path / "annotations" / "val.json", "w") as f:
+        json.dump({"info": {}, "images": [], "annotations": _annotations(3)}, f)
+    dataset = CamouflageDataset(str(tmp_path), split="val")
+    assert len(dataset) == 3
+    assert dataset.get_task_indices("detection") == [0]
+
+
+def _write_images(root, count, split="test"):
+    from PIL import Image
+
+    images_dir = root / "images" / split
+    images_dir.mkdir(parents=True)
+    for i in range(count):
+        Image.new("RGB", (640, 480), (i * 20, 100, 200)).save(images_dir / f"{i}.jpg")
+
+
+def test_decode_image_to_target_size(tmp_path):
+    from mmcsbench.images import decode_image
+
+    _write_images(tmp_path, 1)
+    image = decode_image(tmp_path / "images" / "test" / "0.jpg", (60, 80))
+    assert image.shape == (60, 80, 3)
+    assert image.dtype.name == "uint8"
+    assert abs(int(image[30, 40, 2]) - 200) < 8
+
+
+def test_image_cache_decodes_each_image_once(tmp_path, monkeypatch):
+    import mmcsbench.datasets as datasets
+
+    _write(tmp_path, _annotations(6))
+    _write_images(tmp_path, 6)
+    decoded = []
+    decode = datasets.decode_image
+    monkeypatch.setattr(
+        datasets,
+        "decode_image",
+        lambda path, size: decoded.append(path) or decode(path, size),
+    )
+
+    dataset = CamouflageDataset(
+        str(tmp_path), split="test", image_size=[32, 48], image_cache=True
+    )
+    assert dataset.warm_image_cache(num_workers=2) == 6
+    assert dataset.warm_image_cache() == 0
+    first = dataset.load_image(3)
+
+    # Another dataset instance (e.g. another model's run) reuses the cache
+    reopened = CamouflageDataset(
+        str(tmp_path), split="test", image_size=[32, 48], image_cache=True
+    )
+    assert (reopened.load_image(3) == first).all()
+    assert first.shape == (32, 48, 3)
+    assert len(decoded) == 6
+
+
+def test_image_cache_notices_replaced_images(tmp_path):
+    from PIL import Image
+
+    _write(tmp_path, _annotations(2))
+    _write_images(tmp_path, 2)
+    dataset = CamouflageDataset(
+        str(tmp_path), split="test", image_size=[32, 48], image_cache=True
+    )
+    before = dataset.load_image(1).copy()
+
+    image_path = tmp_path / "images" / "test" / "1.jpg"
+    Image.new("RGB", (80, 60), (255, 255, 255)).save(image_path)
+    stat = image_path.stat()
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reopened = CamouflageDataset(
+        str(tmp_path), split="test", image_size=[32, 48], image_cache=True
+    )
+    after = reopened.load_image(1)
+    assert (after != before).any() and after.min() > 240
+
+
+def test_packed_split_matches_image_files(tmp_path):
+    import shutil
+    import warnings
+
+    from mmcsbench.packed import write_pack
+
+    annotations = _annotations(8)
+    annotations[5]["image_file"] = "missing.jpg"
+    _write(tmp_path, annotations)
+    _write_images(tmp_path, 8)
+    plain = CamouflageDataset(str(tmp_path), split="test", image_size=[32, 48])
+    expected = {
+        idx: (plain.get_image_hash(idx), plain.load_image(idx)) for idx in range(8)
+    }
+
+    # Tiny shards: every image starts a new one
+    pack_dir = write_pack(tmp_path, "test", shard_size=1)
+    pack_copy = tmp_path / "pack-copy"
+    shutil.copytree(pack_dir, pack_copy)
+    packed = CamouflageDataset(
+        str(tmp_path), split="test", image_size=[32, 48], packed=True
+    )
+    assert packed.pack is not None and len(packed.pack.meta["shards"]) == 7
+    assert list(packed.pack.iter_images([6, 5, 0])) == [
+        (5, None),
+        (0, packed.pack.read(0)),
+        (6, packed.pack.read(6)),
+    ]
+
+    # A node with only the pack: no per-image files or annotation JSON
+    shutil.rmtree(tmp_path / "images")
+    (tmp_path / "annotations" / "test.json").unlink()
+    packed = CamouflageDataset(
+        str(tmp_path),
+        split="test",
+        image_size=[32, 48],
+        packed=str(pack_copy),
+        image_cache=True,
+    )
+    assert packed.get_annotation(3) == annotations[3]
+    assert packed.get_task_indices("detection") == plain.get_task_indices("detection")
+    assert packed.warm_image_cache(num_workers=2) == 8
+    for idx, (image_hash, image) in expected.items():
+        assert packed.get_image_hash(idx) == image_hash
+        if image is None:
+            assert packed.load_image(idx) is None
+        else:
+            assert (packed.load_image(idx) == image).all()
+
+    # A pack older than the annotations is ignored
+    _write(tmp_path, annotations + _annotations(1))
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        stale = CamouflageDataset(str(tmp_path), split="test", packed=str(pack_copy))
+    assert stale.pack is None and len(stale) == 9
+    assert any("stale pack" in str(w.message) for w in caught)
+
+
+def test_shared_image_ring_streams_decoded_images(tmp_path):
+    import numpy as np
+
+    from mmcsbench.shared_images import SharedImageRing, stream_shared_images
+
+    annotations = _annotations(9)
+    annotations[4]["image_file"] = "missing.jpg"
+    _write(tmp_path, annotations)
+    _write_images(tmp_path, 9)
+    dataset = CamouflageDataset(str(tmp_path), split="test", image_size=[32, 48])
+
+    # Fewer slots than images: loaders wait for the consumer to release slots
+    with SharedImageRing.from_dataset(dataset, num_slots=2) as ring:
+        seen = {}
+        for idx, slot, present in stream_shared_images(
+            dataset, range(9), ring, num_workers=2, timeout=60
+        ):
+            seen[idx] = present
+            expected = dataset.load_image(idx)
+            if expected is None:
+                assert not ring.slot(slot).any()
+            else:
+                assert np.array_equal(ring.slot(slot), expected)
+            ring.release(slot)
+    assert seen == {idx: idx != 4 for idx in range(9)}
@@ -0,0 +1,228 @@
+"""
+Test module for the parallel dataset downloader.
+"""
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mmcsbench.download import Downloader, DownloadError, load_manifest
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """Serves ``server.files`` with optional Range support, counting requests."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        name = self.path.lstrip("/")
+        with server.lock:
+            server.requests.append((name, self.headers.get("Range")))
+            fail = server.failures > 0
+            if fail:
+                server.failures -= 1
+        if name not in server.files or fail:
+            self.send_response(404 if not fail else 503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = server.files[name]
+        requested = self.headers.get("Range")
+        if requested and server.ranges:
+            start, end = (int(x) for x in requested[len("bytes=") :].split("-"))
+            body = data[start : end + 1]
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{start + len(body) - 1}/{len(data)}"
+            )
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def file_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FileHandler)
+    server.lock = threading.Lock()
+    server.files = {}
+    server.requests = []
+    server.failures = 0
+    server.ranges = True
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _publish(server, files, extract=None):
+    """Serve files and return a manifest for them."""
+    extract = extract or {}
+    server.files.update(files)
+    return {
+        "version": 1,
+        "base_url": server.url,
+        "files": [
+            dict(
+                {
+                    "path": path,
+                    "size": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                },
+                **({"extract": extract[path]} if path in extract else {}),
+            )
+            for path, data in files.items()
+        ],
+    }
+
+
+def _tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_download_verifies_and_extracts(file_server, tmp_path):
+    """Files are fetched in ranges, archives extracted and a rerun downloads nothing."""
+    blob = bytes(range(256)) * 20000  # ~5 MB, several chunks
+    images = {"0001.jpg": b"a" * 3000, "sub/0002.jpg": b"b" * 5000}
+    manifest = _publish(
+        file_server,
+        {
+            "annotations/test.json": json.dumps({"annotations": []}).encode(),
+            "blobs/data.bin": blob,
+            "archives/test-00000.tar.gz": _tar(images),
+        },
+        extract={"archives/test-00000.tar.gz": "images/test"},
+    )
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text(json.dumps(manifest))
+    loaded, base_url = load_manifest(str(manifest_path))
+
+    downloader = Downloader(tmp_path / "data", num_workers=4, chunk_size=1 << 20)
+    summary = downloader.fetch(loaded, base_url, keep_archives=False)
+
+    data = tmp_path / "data"
+    assert (data / "blobs" / "data.bin").read_bytes() == blob
+    assert (data / "images" / "test" / "sub" / "0002.jpg").read_bytes() == images[
+        "sub/0002.jpg"
+    ]
+    assert not (data / "archives" / "test-00000.tar.gz").exists()
+    assert not list(data.rglob("*.part*"))
+    assert sorted(summary["downloaded"]) == sorted(f["path"] for f in manifest["files"])
+    assert summary["extracted"] == ["archives/test-00000.tar.gz"]
+    blob_ranges = [r for name, r in file_server.requests if name == "blobs/data.bin"]
+    assert len(blob_ranges) == 5 and all(r.startswith("bytes=") for r in blob_ranges)
+
+    file_server.requests.clear()
+    summary = downloader.fetch(loaded, base_url, keep_archives=False)
+    assert file_server.requests == []
+    assert summary["bytes"] == 0 and len(summary["skipped"]) == 3
+
+
+def test_download_resumes_missing_chunks(file_server, tmp_path):
+    """An interrupted download fetches only the chunks it did not finish."""
+    blob = bytes(range(256)) * 16384  # 4 MB = 4 chunks
+    manifest = _publish(file_server, {"blob.bin": blob})
+    downloader = Downloader(tmp_path, num_workers=1, chunk_size=1 << 20, max_retries=0)
+
+    # The first chunk succeeds, the next request fails and aborts the run
+    original = downloader._fetch_chunk
+    calls = []
+
+    def flaky(state, index):
+        calls.append(index)
+        if len(calls) > 1:
+            raise DownloadError("connection lost")
+        return original(state, index)
+
+    downloader._fetch_chunk = flaky
+    with pytest.raises(DownloadError):
+        downloader.fetch(manifest, file_server.url)
+    assert (tmp_path / "blob.bin.part").exists()
+
+    file_server.requests.clear()
+    downloader._fetch_chunk = original
+    summary = downloader.fetch(manifest, file_server.url)
+    assert (tmp_path / "blob.bin").read_bytes() == blob
+    assert len(file_server.requests) == 3
+    assert summary["bytes"] == 3 << 20
+
+
+def test_download_retries_and_rejects_bad_checksum(file_server, tmp_path):
+    """Transient server errors are retried; a corrupt file is removed and reported."""
+    manifest = _publish(file_server, {"a.bin": b"x" * 1000})
+    file_server.failures = 2
+    Downloader(tmp_path, retry_backoff=0.01).fetch(manifest, file_server.url)
+    assert (tmp_path / "a.bin").read_bytes() == b"x" * 1000
+
+    manifest = _publish(file_server, {"b.bin": b"y" * 1000})
+    manifest["files"][0]["sha256"] = hashlib.sha256(b"z").hexdigest()
+    with pytest.raises(DownloadError, match="Checksum mismatch"):
+        Downloader(tmp_path).fetch(manifest, file_server.url)
+    assert not (tmp_path / "b.bin").exists() and not (tmp_path / "b.bin.part").exists()
+
+
+def test_download_without_range_support(file_server, tmp_path):
+    """Servers that ignore Range send the whole file once."""
+    file_server.ranges = False
+    blob = bytes(range(256)) * 12000
+    manifest = _publish(file_server, {"blob.bin": blob})
+    summary = Downloader(tmp_path, num_workers=1, chunk_size=1 << 20).fetch(
+        manifest, file_server.url
+    )
+    assert (tmp_path / "blob.bin").read_bytes() == blob
+    assert summary["bytes"] == len(blob)
+    assert len(file_server.requests) == 1
+
+
+def test_download_without_range_support_streams_the_file_once(
+    file_server, tmp_path, monkeypatch
+):
+    """With several workers only the first 200 response is read; others are aborted."""
+    file_server.ranges = False
+    file_server.handle_error = lambda *args: None  # aborted responses break the pipe
+    blob = bytes(range(256)) * 32768  # 8 MB = 8 chunks
+    manifest = _publish(file_server, {"blob.bin": blob})
+    written = []
+    pwrite = os.pwrite
+    monkeypatch.setattr(
+        os,
+        "pwrite",
+        lambda fd, data, offset: written.append(len(data)) or pwrite(fd, data, offset),
+    )
+
+    summary = Downloader(tmp_path, num_workers=4, chunk_size=1 << 20).fetch(
+        manifest, file_server.url
+    )
+    assert (tmp_path / "blob.bin").read_bytes() == blob
+    assert sum(written) == len(blob) and summary["bytes"] == len(blob)
+
+
+def test_force_downloads_present_files_again(file_server, tmp_path):
+    manifest = _publish(file_server, {"a.bin": b"x" * 1000})
+    downloader = Downloader(tmp_path)
+    downloader.fetch(manifest, file_server.url)
+    file_server.requests.clear()
+    assert downloader.fetch(manifest, file_server.url)["skipped"] == ["a.bin"]
+
+    summary = downloader.fetch(manifest, file_server.url, force=True)
+    assert summary["downloaded"] == ["a.bin"] and len(file_server.requests) == 1
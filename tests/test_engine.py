@@ -0,0 +1,254 @@
+"""
+Test module for the batched inference engine.
+"""
+
+import json
+import time
+
+import numpy as np
+import pytest
+
+from mmcsbench.batching import DynamicBatcher
+from mmcsbench.datasets import CamouflageDataset
+from mmcsbench.embeddings import EmbeddingCache
+from mmcsbench.engine import InferenceEngine, iter_batches
+from mmcsbench.models import BaseModel
+
+
+class BatchRecordingModel(BaseModel):
+    """Model that records the size of every batch it receives."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        return prompt.upper()
+
+    def generate_batch(self, images, prompts, **kwargs):
+        self.batch_sizes.append(len(prompts))
+        return [self.generate(image, prompt) for image, prompt in zip(images, prompts)]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    annotations = []
+    for i in range(10):
+        tasks = {"classification": {"label": "animal"}}
+        if i % 2 == 0:
+            tasks["reasoning"] = [
+                {"question": f"q{i}a", "answer": "yes"},
+                {"question": f"q{i}b", "answer": "no"},
+            ]
+        annotations.append(
+            {"image_id": f"img{i}", "image_file": f"{i}.jpg", "tasks": tasks}
+        )
+    (tmp_path / "annotations").mkdir()
+    with open(tmp_path / "annotations" / "test.json", "w") as f:
+        json.dump(annotations, f)
+    return CamouflageDataset(str(tmp_path), split="test")
+
+
+def test_iter_batches_preserves_order(dataset):
+    batches = list(iter_batches(dataset, list(range(10)), batch_size=4, num_workers=2))
+    assert [len(b) for b in batches] == [4, 4, 2]
+    assert [item["index"] for b in batches for item in b] == list(range(10))
+
+
+def test_iter_batches_propagates_errors():
+    class Broken:
+        def __getitem__(self, idx):
+            raise IOError("unreadable image")
+
+    with pytest.raises(IOError):
+        list(iter_batches(Broken(), [0, 1], batch_size=1))
+
+
+def test_engine_batches_queries(dataset):
+    model = BatchRecordingModel()
+    engine = InferenceEngine(batch_size=3, num_workers=2)
+    records = list(engine.run(model, dataset, "reasoning"))
+
+    assert [r["image_id"] for r in records] == [
+        f"img{i}" for i in (0, 0, 2, 2, 4, 4, 6, 6, 8, 8)
+    ]
+    assert [r["query_id"] for r in records[:2]] == [0, 1]
+    assert records[0]["prediction"] == "Q0A"
+    assert model.batch_sizes == [6, 4]
+
+
+def test_default_generate_batch_loops_generate():
+    model = BatchRecordingModel()
+    assert BaseModel.generate_batch(model, [None, None], ["a", "b"]) == ["A", "B"]
+
+
+class EmbeddingModel(BaseModel):
+    """Model with a separate vision encoder that counts encoder passes."""
+
+    name = "embedding"
+
+    def __init__(self):
+        self.config = {}
+        self.encoded = 0
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        raise AssertionError("generate should not be called")
+
+    def encode_image(self, image):
+        self.encoded += 1
+        return np.zeros(256, dtype=np.float32)
+
+    def generate_from_embedding(self, embedding, prompt, **kwargs):
+        return f"{prompt}:{embedding.shape[0]}"
+
+
+def test_engine_encodes_each_image_once(dataset):
+    model = EmbeddingModel()
+    engine = InferenceEngine(batch_size=4, num_workers=0, embeddings=EmbeddingCache())
+    for task in ("reasoning", "classification"):
+        records = list(engine.run(model, dataset, task))
+        assert all(r["prediction"].endswith(":256") for r in records)
+    assert model.encoded == 10
+    assert engine.embeddings.hits == 5
+
+
+def test_embedding_cache_evicts_by_size_and_spills(tmp_path):
+    cache = EmbeddingCache(max_bytes=3 * 1024, spill_dir=str(tmp_path / "spill"))
+    for i in range(5):
+        cache.put(f"k{i}", np.full(256, i, dtype=np.float32))
+    assert len(cache) == 3
+    assert cache.size_bytes() == 3 * 1024
+
+    restored = cache.get("k0")
+    assert restored is not None and restored[0] == 0
+    assert cache.spill_hits == 1
+    assert cache.get("missing") is None
+
+
+class OutOfMemoryModel(BatchRecordingModel):
+    """Model that runs out of memory on batches of more than three prompts."""
+
+    def generate_batch(self, images, prompts, **kwargs):
+        if len(prompts) > 3:
+            raise RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+        return super().generate_batch(images, prompts, **kwargs)
+
+
+def test_dynamic_batcher_backs_off_on_oom(dataset, tmp_path):
+    state_path = tmp_path / "batch_sizes.json"
+    model = OutOfMemoryModel()
+    engine = InferenceEngine(
+        batch_size=10,
+        num_workers=2,
+        batcher=DynamicBatcher(initial_size=8, state_path=str(state_path)),
+    )
+    records = list(engine.run(model, dataset, "reasoning"))
+
+    assert [r["prediction"] for r in records] == [r["prompt"].upper() for r in records]
+    # Only the failed items are retried: every prompt is answered exactly once
+    assert sum(model.batch_sizes) == 10
+    assert max(model.batch_sizes) <= 3
+
+    state = json.loads(state_path.read_text())
+    ((key, tuned),) = state.items()
+    assert key.endswith("/reasoning")
+    assert tuned["ceiling"] <= 4 and tuned["size"] <= 3
+
+
+def test_dynamic_batcher_grows_and_persists(tmp_path):
+    state_path = tmp_path / "batch_sizes.json"
+    sizes = []
+
+    def call(images, prompts):
+        # Fixed per-call overhead: larger batches are cheaper per sample
+        sizes.append(len(prompts))
+        time.sleep(0.01)
+        return list(prompts)
+
+    batcher = DynamicBatcher(initial_size=1, max_size=8, state_path=str(state_path))
+    prompts = [f"p{i}" for i in range(40)]
+    assert batcher.run("stub/task", [None] * 40, prompts, call) == prompts
+    assert sizes[:4] == [1, 2, 4, 8]
+    assert batcher.batch_size("stub/task") == 8
+
+    reloaded = DynamicBatcher(initial_size=1, max_size=8, state_path=str(state_path))
+    assert reloaded.batch_size("stub/task") == 8
+
+
+def test_dynamic_batcher_keeps_tuning_below_its_size(tmp_path):
+    sizes = []
+
+    def call(images, prompts):
+        sizes.append(len(prompts))
+        time.sleep(0.01)
+        return list(prompts)
+
+    # Callers never have more than 20 requests pending at once
+    batcher = DynamicBatcher(initial_size=8, max_size=256)
+    prompts = [f"p{i}" for i in range(20)]
+    for _ in range(4):
+        assert batcher.run("stub/task", [None] * 20, prompts, call) == prompts
+    assert sizes[-1] == 20
+    assert batcher.batch_size("stub/task") == 20
+
+
+class PixelBoxModel(BaseModel):
+    """Detects one box, in pixels of the image it is given, and counts calls."""
+
+    name = "pixel-box"
+
+    def __init__(self):
+        self.config = {}
+        self.calls = 0
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        self.calls += 1
+        height, width = np.asarray(image).shape[:2]
+        return {
+            "boxes": [[width / 8, height / 6, 3 * width / 8, height / 2]],
+            "scores": [0.9],
+        }
+
+
+def test_detection_boxes_on_resized_images_match_full_resolution(tmp_path):
+    from PIL import Image
+
+    from mmcsbench.cache import PredictionCache
+    from mmcsbench.metrics import build_metric
+
+    (tmp_path / "images" / "test").mkdir(parents=True)
+    Image.new("RGB", (640, 480)).save(tmp_path / "images" / "test" / "0.jpg")
+    (tmp_path / "annotations").mkdir()
+    with open(tmp_path / "annotations" / "test.json", "w") as f:
+        json.dump(
+            [
+                {
+                    "image_id": "img0",
+                    "image_file": "0.jpg",
+                    "tasks": {"detection": {"boxes": [[80, 80, 240, 240]]}},
+                }
+            ],
+            f,
+        )
+    engine = InferenceEngine(
+        batch_size=1,
+        num_workers=0,
+        cache=PredictionCache(str(tmp_path / "cache.sqlite")),
+    )
+    model = PixelBoxModel()
+
+    for size in ([120, 160], [60, 80], None):
+        dataset = CamouflageDataset(str(tmp_path), split="test", image_size=size)
+        records = list(engine.run(model, dataset, "detection"))
+        metrics = build_metric("detection").update(records).compute()
+        assert metrics["mAP"] == pytest.approx(1.0)
+    # Every image size is a separate cache entry
+    assert model.calls == 3
@@ -0,0 +1,565 @@
+"""
+Test module for evaluation metrics and protocols.
+"""
+
+import json
+import random
+import time
+
+import pytest
+
+from mmcsbench import profiling
+from mmcsbench.cache import model_identity
+from mmcsbench.datasets import CamouflageDataset
+from mmcsbench.evaluation import Evaluator
+from mmcsbench.metrics import build_metric, score_captions
+from mmcsbench.metrics.captioning import lcs_length
+from mmcsbench.models import BaseModel
+from mmcsbench.predictions import prediction_path, read_metadata
+from mmcsbench.sharding import merge_shards, parse_shard, shard_indices
+
+CATEGORIES = ["animal", "military", "adaptive", "natural"]
+WORDS = ["a", "moth", "hides", "on", "the", "bark", "green", "leaf", "insect", "blends"]
+
+
+class VaryingModel(BaseModel):
+    """Deterministic model whose answers depend on the prompt."""
+
+    name = "varying"
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        seed = sum(map(ord, prompt))
+        if "type of camouflage" in prompt:
+            return f"It is {CATEGORIES[seed % 4]} camouflage."
+        return " ".join(WORDS[(seed + i) % len(WORDS)] for i in range(seed % 7 + 2))
+
+
+def _write_dataset(root, count=23):
+    annotations = []
+    for i in range(count):
+        annotations.append(
+            {
+                "image_id": f"img{i}",
+                "image_file": f"{i}.jpg",
+                "tasks": {
+                    "classification": {"label": CATEGORIES[i % 4]},
+                    "reasoning": {
+                        "question": f"Where does object {i} hide?",
+                        "answer": " ".join(WORDS[i % 5 : i % 5 + 4]),
+                    },
+                    "description": {
+                        "captions": [
+                            " ".join(WORDS[i % 3 : i % 3 + 6]),
+                            " ".join(WORDS[: i % 8 + 2]),
+                        ]
+                    },
+                },
+            }
+        )
+    (root / "annotations").mkdir()
+    with open(root / "annotations" / "test.json", "w") as f:
+        json.dump(annotations, f)
+    return CamouflageDataset(str(root), split="test")
+
+
+def test_classification_metric():
+    metric = build_metric("classification")
+    metric.add("This is animal camouflage", {"label": "animal"})
+    metric.add(["natural", "military"], {"label": "military"})
+    metric.add("no idea", {"label": "adaptive"})
+    results = metric.compute()
+    assert results["accuracy"] == pytest.approx(1 / 3)
+    assert results["top5_accuracy"] == pytest.approx(2 / 3)
+
+
+def test_reasoning_accuracy_resolves_option_letters():
+    metric = build_metric("reasoning")
+    reference = {"answer": "B", "options": ["a leaf", "a moth"]}
+    metric.add("B. a moth", reference)
+    metric.add("Moth", reference)
+    metric.add("a leaf", reference)
+    assert metric.compute()["accuracy"] == pytest.approx(2 / 3)
+
+
+@pytest.mark.parametrize(
+    "prediction, answer, options, expected",
+    [
+        ("It is a stick insect.", "stick insect", None, True),
+        ("Probably a walking stick", "stick insect", None, True),
+        ("three", "3", None, True),
+        ("A moth, not a leaf.", "B", ["a leaf", "a moth"], False),
+        ("The answer is (B)", "B", ["a leaf", "a moth"], True),
+        ("A moth", "B", ["a leaf", "a moth"], True),
+        ("leaf moth", "leaf moth", ["moth", "leaf moth"], True),
+        ("moth", "leaf moth", ["moth", "leaf moth"], False),
+    ],
+)
+def test_reasoning_accuracy_matches_free_form_answers(
+    prediction, answer, options, expected
+):
+    config = {"tasks": {"reasoning": {"synonyms": {"stick insect": ["walking stick"]}}}}
+    metric = build_metric("reasoning", config)
+    reference = (
+        {"answer": answer, "options": options} if options else {"answer": answer}
+    )
+    assert metric.is_correct(prediction, reference) is expected
+
+
+def test_answer_indexes_are_shared_and_bounded():
+    from mmcsbench.metrics.answers import INDEX_CACHE_SIZE, answer_index
+
+    def config(i):
+        return {"tasks": {"reasoning": {"synonyms": {f"answer {i}": [f"alias {i}"]}}}}
+
+    assert answer_index(config(0)) is answer_index(config(0))
+    indexes = [answer_index(config(i)) for i in range(3 * INDEX_CACHE_SIZE)]
+    assert len({id(index) for index in indexes}) == len(indexes)
+    assert answer_index(config(0)) is not indexes[0]
+
+
+def test_caption_metric_perfect_match():
+    metric = build_metric("description")
+    caption = "a moth hides on the bark of a tree"
+    metric.add(caption, {"captions": [caption]})
+    metric.add("green leaf insect", {"captions": ["green leaf insect"]})
+    results = metric.compute()
+    assert results["bleu_1"] == pytest.approx(1.0)
+    assert results["rouge_l"] == pytest.approx(1.0)
+    assert results["meteor"] == pytest.approx(1 - (0.5 / 9**3 + 0.5 / 3**3) / 2)
+
+
+def test_bit_parallel_lcs_matches_dynamic_programming():
+    def reference_lcs(a, b):
+        table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+        for i, x in enumerate(a):
+            for j, y in enumerate(b):
+                table[i + 1][j + 1] = (
+                    table[i][j] + 1 if x == y else max(table[i][j + 1], table[i + 1][j])
+                )
+        return table[-1][-1]
+
+    rng = random.Random(0)
+    for _ in range(200):
+        a = [rng.choice("abcde") for _ in range(rng.randint(0, 30))]
+        b = [rng.choice("abcde") for _ in range(rng.randint(0, 80))]
+        assert lcs_length(a, b) == reference_lcs(a, b)
+
+
+def test_caption_scores_with_split_corpus_match_accumulated():
+    candidates = ["a moth on bark", "green insect on a leaf", "a snake in sand", ""]
+    references = [
+        ["a moth rests on tree bark", "moth on bark"],
+        ["a green leaf insect"],
+        ["a viper buried in sand"],
+        ["an owl"],
+    ]
+    metric = build_metric("description")
+    for candidate, refs in zip(candidates, references):
+        metric.add(candidate, {"captions": refs})
+    assert score_captions(candidates, references) == pytest.approx(
+        metric.caption_scores()
+    )
+
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    with pytest.raises(ValueError):
+        parse_shard("4/4")
+    shards = [shard_indices(list(range(10)), i, 3) for i in range(3)]
+    assert sorted(sum(shards, [])) == list(range(10))
+
+
+def test_merged_shards_match_single_run(tmp_path):
+    dataset = _write_dataset(tmp_path)
+    evaluator = Evaluator({"evaluation": {"batch_size": 4, "num_workers": 0}})
+    model = VaryingModel()
+    output_dir = str(tmp_path / "results")
+    tasks = ["classification", "reasoning", "description"]
+
+    expected = {
+        task: evaluator.evaluate_task(model, task, "test", dataset=dataset)
+        for task in tasks
+    }
+    for shard_id in range(3):
+        for task in tasks:
+            evaluator.evaluate_task(
+                model,
+                task,
+                "test",
+                dataset=dataset,
+                output_dir=output_dir,
+                shard=(shard_id, 3),
+            )
+
+    merged = merge_shards(output_dir, "varying", "test")
+    assert set(merged) == set(tasks)
+    shard_metadata = read_metadata(
+        prediction_path(output_dir, "varying", "test", "reasoning", shard=(0, 3))
+    )
+    metadata = read_metadata(
+        prediction_path(output_dir, "varying", "test", "reasoning")
+    )
+    assert metadata["model"] == shard_metadata["model"] == model_identity(model)
+    for task in tasks:
+        assert merged[task] == pytest.approx(expected[task])
+
+
+def test_shards_keep_each_item_in_one_shard(tmp_path):
+    annotations = [
+        {
+            "image_id": f"img{i}",
+            "image_file": f"{i}.jpg",
+            "tasks": {
+                "classification": {"label": "animal"},
+                **({"reasoning": {"question": "q", "answer": "a"}} if i % 3 else {}),
+            },
+        }
+        for i in range(20)
+    ]
+    (tmp_path / "annotations").mkdir()
+    with open(tmp_path / "annotations" / "test.json", "w") as f:
+        json.dump(annotations, f)
+    dataset = CamouflageDataset(str(tmp_path), split="test")
+
+    owners = {}
+    for shard_id in range(3):
+        for task in ("classification", "reasoning"):
+            for idx in Evaluator.task_indices(dataset, task, shard=(shard_id, 3)):
+                assert owners.setdefault(idx, shard_id) == shard_id
+    assert sorted(owners) == list(range(20))
+
+
+def test_records_corpus_matches_the_split(tmp_path):
+    from mmcsbench.metrics import build_corpus, records_corpus
+
+    dataset = _write_dataset(tmp_path)
+    evaluator = Evaluator({"evaluation": {"batch_size": 4, "num_workers": 0}})
+    records = list(evaluator.engine.run(VaryingModel(), dataset, "description"))
+    from_split = build_corpus("description", dataset)
+    from_records = records_corpus("description", iter(records))
+    assert (
+        from_records.df == from_split.df
+        and from_records.num_docs == from_split.num_docs
+    )
+    assert records_corpus("classification", records) is None
+
+
+def test_configured_metrics_select_task_results(tmp_path):
+    dataset = _write_dataset(tmp_path)
+    config = {
+        "evaluation": {
+            "batch_size": 4,
+            "num_workers": 0,
+            "metrics": {"description": ["cider", "bleu_4", "spice"]},
+        }
+    }
+    evaluator = Evaluator(config)
+    results = evaluator.evaluate_task(
+        VaryingModel(), "description", "test", dataset=dataset
+    )
+    assert list(results) == ["cider", "bleu_4"]
+    assert (
+        len(
+            evaluator.evaluate_task(
+                VaryingModel(), "reasoning", "test", dataset=dataset
+            )
+        )
+        == 4
+    )
+
+
+def test_rescore_streams_saved_predictions(tmp_path, capsys):
+    from mmcsbench.cli import main
+
+    dataset = _write_dataset(tmp_path)
+    evaluator = Evaluator({"evaluation": {"batch_size": 4, "num_workers": 0}})
+    output_dir = str(tmp_path / "results")
+    expected = evaluator.evaluate_task(
+        VaryingModel(), "description", "test", dataset=dataset, output_dir=output_dir
+    )
+
+    main(
+        ["rescore", str(prediction_path(output_dir, "varying", "test", "description"))]
+    )
+    printed = capsys.readouterr().out
+    assert f"cider: {expected['cider']:.4f}" in printed
+
+
+def test_merge_reports_missing_shards(tmp_path):
+    dataset = _write_dataset(tmp_path)
+    evaluator = Evaluator({"evaluation": {"batch_size": 4, "num_workers": 0}})
+    output_dir = str(tmp_path / "results")
+    evaluator.evaluate_task(
+        VaryingModel(),
+        "classification",
+        "test",
+        dataset=dataset,
+        output_dir=output_dir,
+        shard=(0, 2),
+    )
+    with pytest.raises(ValueError, match="Missing shards"):
+        merge_shards(output_dir, "varying", "test")
+
+
+def test_box_iou_matrix():
+    import numpy as np
+
+    from mmcsbench.metrics.detection import box_iou
+
+    ious = box_iou([[0, 0, 10, 10], [5, 5, 15, 15]], [[0, 0, 10, 10], [20, 20, 30, 30]])
+    assert ious.shape == (2, 2)
+    assert ious[0, 0] == pytest.approx(1.0)
+    assert ious[1, 0] == pytest.approx(25 / 175)
+    assert np.all(ious[:, 1] == 0)
+
+
+def test_detection_metric():
+    metric = build_metric("detection")
+    metric.update(
+        [
+            {
+                "prediction": "The moth is at [0, 0, 10, 10].",
+                "reference": {"boxes": [[0, 0, 10, 10]]},
+                "difficulty": "easy",
+            },
+            {
+                "prediction": [[50, 50, 60, 60, 0.9], [0, 0, 20, 20, 0.1]],
+                "reference": {"boxes": [[0, 0, 20, 20], [100, 100, 120, 120]]},
+                "difficulty": "hard",
+            },
+        ]
+    )
+    results = metric.compute()
+    assert results["precision"] == pytest.approx(2 / 3)
+    assert results["recall"] == pytest.approx(2 / 3)
+    assert results["mAP_easy"] == pytest.approx(1.0)
+    assert 0 < results["mAP"] < 1
+
+
+def test_detection_ap_ignores_order_of_ties():
+    records = [
+        {"prediction": "[0, 0, 10, 10]", "reference": {"boxes": [[0, 0, 10, 10]]}},
+        {"prediction": "[0, 0, 10, 10]", "reference": {"boxes": [[50, 50, 60, 60]]}},
+    ]
+    forward = build_metric("detection").update(records).compute()
+    backward = build_metric("detection").update(records[::-1]).compute()
+    assert forward == backward
+
+
+def test_detection_state_is_a_bounded_histogram():
+    rng = random.Random(0)
+    records = []
+    for i in range(600):
+        x, y = rng.uniform(0, 200), rng.uniform(0, 200)
+        boxes = [
+            f"[{x + rng.uniform(-5, 5):.0f}, {y:.0f}, {x + 40:.0f}, {y + 30:.0f}]"
+            for _ in range(rng.randint(1, 3))
+        ]
+        records.append(
+            {
+                "prediction": " and ".join(boxes),
+                "difficulty": "easy",
+                "reference": {"boxes": [[x, y, x + 40, y + 30]]},
+            }
+        )
+    whole = build_metric("detection").update(records)
+    halves = build_metric("detection").update(records[:250])
+    halves.merge(build_metric("detection").update(records[250:]))
+
+    results = whole.compute()
+    assert halves.compute() == pytest.approx(results)
+    assert results["mAP_easy"] == pytest.approx(results["mAP"])
+    # Text predictions rank boxes by mention order: one score bin per rank
+    assert len(whole.bins) == 3 and whole.hits.shape == (4, 10, 3)
+
+
+def test_partial_metrics_are_reported_live(tmp_path):
+    dataset = _write_dataset(tmp_path)
+    reports = []
+    evaluator = Evaluator(
+        {"evaluation": {"batch_size": 4, "num_workers": 0, "report_every": 10}},
+        progress=lambda task, count, results: reports.append((task, count, results)),
+    )
+    final = evaluator.evaluate_tasks(
+        VaryingModel(), ["classification", "description"], "test", dataset=dataset
+    )
+    assert [(task, count) for task, count, _ in reports] == [
+        ("classification", 10),
+        ("description", 10),
+        ("classification", 20),
+        ("description", 20),
+    ]
+    assert set(reports[0][2]) == set(final["classification"])
+
+    reports.clear()
+    streamed = evaluator.evaluate_task(
+        VaryingModel(),
+        "description",
+        "test",
+        dataset=dataset,
+        output_dir=str(tmp_path / "results"),
+    )
+    assert [count for _, count, _ in reports] == [10, 20]
+    assert streamed == pytest.approx(final["description"])
+
+
+class SlowModel(VaryingModel):
+    def generate(self, image, prompt, **kwargs):
+        time.sleep(0.005)
+        return super().generate(image, prompt, **kwargs)
+
+
+def test_evaluate_task_times_metrics_apart_from_the_model(tmp_path, monkeypatch):
+    """Metric timers exclude the model run, and live reports score each record once."""
+    import mmcsbench.metrics.classification as classification
+
+    dataset = _write_dataset(tmp_path)
+    scored = []
+    add = classification.ClassificationMetric.add
+    monkeypatch.setattr(
+        classification.ClassificationMetric,
+        "add",
+        lambda self, *args: scored.append(1) or add(self, *args),
+    )
+    evaluator = Evaluator(
+        {"evaluation": {"batch_size": 4, "num_workers": 0, "report_every": 10}},
+        progress=lambda *args: None,
+    )
+    with profiling.enable() as profiler:
+        evaluator.evaluate_task(SlowModel(), "classification", "test", dataset=dataset)
+
+    assert len(scored) == len(dataset)
+    metrics = sum(
+        timer.total
+        for name, timer in profiler.timers.items()
+        if name.startswith("metrics.")
+    )
+    assert metrics < profiler.timers["model.generate"].total / 2
+
+
+class FeatureModel(VaryingModel):
+    """Model that encodes images once and generates from the features."""
+
+    shares_image_features = True
+
+    def __init__(self):
+        self.encoded = 0
+
+    def forward(self, image, text=None):
+        self.encoded += 1
+        return ("features", image)
+
+    def generate(self, image, prompt, **kwargs):
+        assert image[0] == "features"
+        return super().generate(image, prompt, **kwargs)
+
+
+def test_fused_evaluation_matches_per_task(tmp_path, monkeypatch):
+    from PIL import Image
+
+    _write_dataset(tmp_path)
+    (tmp_path / "images" / "test").mkdir(parents=True)
+    for i in range(23):
+        Image.new("RGB", (16, 16)).save(tmp_path / "images" / "test" / f"{i}.jpg")
+    dataset = CamouflageDataset(str(tmp_path), split="test", image_size=8)
+    evaluator = Evaluator({"evaluation": {"batch_size": 4, "num_workers": 0}})
+    tasks = ["classification", "reasoning", "description"]
+    separate = {
+        task: evaluator.evaluate_task(VaryingModel(), task, "test", dataset=dataset)
+        for task in tasks
+    }
+
+    loads = []
+    getitem = CamouflageDataset.__getitem__
+    monkeypatch.setattr(
+        CamouflageDataset,
+        "__getitem__",
+        lambda self, idx: loads.append(idx) or getitem(self, idx),
+    )
+    model = FeatureModel()
+    fused = evaluator.evaluate_tasks(model, tasks, "test", dataset=dataset)
+    assert sorted(loads) == list(range(23))
+    assert model.encoded == 23
+    for task in tasks:
+        assert fused[task] == pytest.approx(separate[task])
+
+    streamed = evaluator.evaluate_tasks(
+        FeatureModel(),
+        tasks,
+        "test",
+        dataset=dataset,
+        output_dir=str(tmp_path / "results"),
+    )
+    for task in tasks:
+        assert streamed[task] == pytest.approx(separate[task])
+
+
+class ShiftedModel(VaryingModel):
+    """Varying model with different answers, for multi-model runs."""
+
+    name = "shifted"
+
+    def generate(self, image, prompt, **kwargs):
+        return super().generate(image, prompt + " ", **kwargs)
+
+
+@pytest.mark.parametrize("concurrent", [False, True])
+def test_evaluate_many_loads_each_image_once(tmp_path, monkeypatch, concurrent):
+    from PIL import Image
+
+    from mmcsbench.leaderboard import leaderboard, write_leaderboard
+
+    _write_dataset(tmp_path)
+    (tmp_path / "images" / "test").mkdir(parents=True)
+    for i in range(23):
+        Image.new("RGB", (16, 16)).save(tmp_path / "images" / "test" / f"{i}.jpg")
+    dataset = CamouflageDataset(str(tmp_path), split="test", image_size=8)
+    evaluator = Evaluator({"evaluation": {"batch_size": 4, "num_workers": 0}})
+    tasks = ["classification", "reasoning", "description"]
+    separate = {
+        model.name: evaluator.evaluate_tasks(model, tasks, "test", dataset=dataset)
+        for model in (VaryingModel(), ShiftedModel())
+    }
+
+    loads = []
+    getitem = CamouflageDataset.__getitem__
+    monkeypatch.setattr(
+        CamouflageDataset,
+        "__getitem__",
+        lambda self, idx: loads.append(idx) or getitem(self, idx),
+    )
+    results = evaluator.evaluate_many(
+        [VaryingModel(), ShiftedModel()],
+        tasks,
+        "test",
+        dataset=dataset,
+        concurrent=concurrent,
+    )
+    assert sorted(loads) == list(range(23))
+    assert results == separate
+
+    streamed = evaluator.evaluate_many(
+        [VaryingModel(), ShiftedModel()],
+        tasks,
+        "test",
+        dataset=dataset,
+        output_dir=str(tmp_path / "results"),
+        concurrent=concurrent,
+    )
+    for name, model_results in separate.items():
+        for task in tasks:
+            assert streamed[name][task] == pytest.approx(model_results[task])
+
+    rows = leaderboard(results)
+    assert [row["rank"] for row in rows] == [1, 2]
+    assert {row["model"] for row in rows} == {"varying", "shifted"}
+    assert rows[0]["mean_rank"] <= rows[1]["mean_rank"]
+    assert "| 1 |" in write_leaderboard(rows, tmp_path).read_text()
+
+    with pytest.raises(ValueError, match="distinct names"):
+        evaluator.evaluate_many(
+            [VaryingModel(), VaryingModel()], tasks, "test", dataset=dataset
+        )
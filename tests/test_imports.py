@@ -0,0 +1,50 @@
+"""
+Test module for package import time.
+"""
+
+import json
+import subprocess
+import sys
+
+# Generous bound for ``import mmcsbench`` in a fresh interpreter; an eager
+# import of torch, PIL, numpy or yaml alone takes longer than this
+IMPORT_BUDGET_S = 0.25
+
+HEAVY_MODULES = ("torch", "PIL", "numpy", "yaml", "asyncio")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed,
+                  'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _probe(module):
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def test_package_import_is_fast_and_light():
+    result = min((_probe("mmcsbench") for _ in range(3)), key=lambda r: r["elapsed"])
+    assert result["loaded"] == []
+    assert result["elapsed"] < IMPORT_BUDGET_S
+
+
+def test_model_registry_does_not_import_heavy_modules():
+    assert _probe("mmcsbench.models")["loaded"] == []
+
+
+def test_public_api_resolves_lazily():
+    import mmcsbench
+
+    assert mmcsbench.ModelRegistry is mmcsbench.models.ModelRegistry
+    assert mmcsbench.profiling.timer is not None
+    assert "Evaluator" in dir(mmcsbench)
@@ -0,0 +1,171 @@
+"""
+Test module for model registry and loading.
+"""
+
+import sys
+import threading
+import types
+
+import pytest
+
+from mmcsbench.models import BaseModel, ModelPool, ModelRegistry, load_model
+
+
+class WeightedModel(BaseModel):
+    """Model reporting a fixed weight size and counting instances."""
+
+    instances = 0
+
+    def __init__(self, size=100, **kwargs):
+        WeightedModel.instances += 1
+        self.memory_bytes = size
+        self.unloaded = False
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        return prompt
+
+    def unload(self):
+        self.unloaded = True
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    models = dict(ModelRegistry._models)
+    ModelRegistry.register("weighted", WeightedModel)
+    yield
+    ModelRegistry._models = models
+    ModelRegistry.pool = ModelPool()
+
+
+def test_load_model_sets_identity():
+    model = load_model("weighted", {"size": 5})
+    assert model.name == "weighted"
+    assert model.config == {"size": 5}
+
+
+def test_pool_reuses_instances_by_normalized_config():
+    pool = ModelPool()
+    created = WeightedModel.instances
+    first = pool.acquire("weighted", {"size": 10, "variant": "a"})
+    second = pool.acquire("weighted", {"variant": "a", "size": 10})
+    assert first is second
+    assert WeightedModel.instances == created + 1
+    assert pool.acquire("weighted", {"size": 20}) is not first
+
+
+def test_pool_unloads_idle_models_lru_within_budget():
+    pool = ModelPool(memory_budget=250)
+    a = pool.acquire("weighted", {"size": 100, "id": "a"})
+    b = pool.acquire("weighted", {"size": 100, "id": "b"})
+    pool.release(a)
+    pool.release(b)
+    pool.acquire("weighted", {"size": 100, "id": "a"})  # a is now most recently used
+
+    pool.acquire("weighted", {"size": 100, "id": "c"})
+    assert b.unloaded and not a.unloaded
+    assert pool.memory() == 200
+    assert len(pool.loaded()) == 2
+
+
+def test_pool_never_unloads_models_in_use():
+    pool = ModelPool(memory_budget=150)
+    a = pool.acquire("weighted", {"size": 100, "id": "a"})
+    with pytest.warns(UserWarning):
+        with pool.use("weighted", {"size": 100, "id": "b"}):
+            pass
+    assert not a.unloaded
+    with pytest.raises(ValueError):
+        pool.release(object())
+
+
+def test_pool_loads_outside_its_lock():
+    """A slow load blocks neither other models nor duplicates the load."""
+    pool = ModelPool()
+    loaded = pool.acquire("weighted", {"size": 10})
+    started, finish = threading.Event(), threading.Event()
+    loads = []
+
+    def slow_factory():
+        loads.append(1)
+        started.set()
+        assert finish.wait(5)
+        return WeightedModel(size=20)
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                pool.acquire("weighted", {"size": 20}, factory=slow_factory)
+            )
+        )
+        for _ in range(2)
+    ]
+    threads[0].start()
+    assert started.wait(5)
+    threads[1].start()
+
+    # Hits and releases of loaded models go through while the load runs
+    assert pool.acquire("weighted", {"size": 10}) is loaded
+    pool.release(loaded)
+    finish.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(loads) == 1 and results[0] is results[1]
+
+
+class BlockingUnloadModel(WeightedModel):
+    """Model whose unload waits for a signal, like a slow GPU teardown."""
+
+    def __init__(self, started, finish, **kwargs):
+        super().__init__(**kwargs)
+        self.started, self.finish = started, finish
+
+    def unload(self):
+        self.started.set()
+        assert self.finish.wait(5)
+        super().unload()
+
+
+def test_pool_unloads_outside_its_lock():
+    pool = ModelPool(max_models=1)
+    started, finish = threading.Event(), threading.Event()
+    slow = pool.acquire(
+        "blocking", factory=lambda: BlockingUnloadModel(started, finish)
+    )
+    pool.release(slow)
+    thread = threading.Thread(target=pool.acquire, args=("weighted", {"size": 10}))
+    thread.start()
+    assert started.wait(5)
+
+    # The evicted model is still unloading: the pool answers other calls
+    loaded = pool.acquire("weighted", {"size": 10})
+    assert pool.loaded() == [ModelPool.key("weighted", {"size": 10})]
+    finish.set()
+    thread.join(5)
+    assert slow.unloaded and not loaded.unloaded
+
+
+def test_model_memory_of_slotted_models():
+    from mmcsbench.models import model_memory
+
+    class Slotted:
+        __slots__ = ("weights",)
+
+    assert model_memory(Slotted()) == 0
+
+
+def test_entry_point_registration_is_lazy(monkeypatch):
+    module = types.ModuleType("fake_mmcs_models")
+    module.Model = WeightedModel
+    for i in range(50):
+        ModelRegistry.register(f"lazy-{i}", "fake_mmcs_models:Model")
+    assert "fake_mmcs_models" not in sys.modules
+
+    monkeypatch.setitem(sys.modules, "fake_mmcs_models", module)
+    model = ModelRegistry.get_model("lazy-7")
+    assert isinstance(model, WeightedModel)
+    assert ModelRegistry._models["lazy-7"] is WeightedModel
+    assert isinstance(ModelRegistry._models["lazy-8"], str)
@@ -0,0 +1,96 @@
+"""
+Test module for incremental prediction storage and resumable runs.
+"""
+
+import json
+
+import pytest
+
+from mmcsbench.datasets import CamouflageDataset
+from mmcsbench.evaluation import Evaluator
+from mmcsbench.models import BaseModel
+from mmcsbench.predictions import PredictionWriter, prediction_path, read_predictions
+
+
+class CrashingModel(BaseModel):
+    """Model that fails after a fixed number of calls."""
+
+    name = "crashing"
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.prompts = []
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        if self.fail_after is not None and len(self.prompts) >= self.fail_after:
+            raise RuntimeError("simulated crash")
+        self.prompts.append(prompt)
+        return "yes"
+
+
+def test_reader_ignores_uncommitted_tail(tmp_path):
+    path = tmp_path / "task.jsonl"
+    writer = PredictionWriter(path, checkpoint_every=1000, checkpoint_interval=1000)
+    writer.write({"index": 0})
+    writer.commit(force=True)
+    writer.write({"index": 1})
+    writer.commit()
+    with open(path, "a") as f:
+        f.write('{"index": 2, "trunc')
+
+    assert [r["index"] for r in read_predictions(path)] == [0]
+
+    resumed = PredictionWriter(path, resume=True)
+    resumed.write({"index": 3})
+    resumed.close()
+    assert [r["index"] for r in read_predictions(path)] == [0, 3]
+
+
+def test_resume_rejects_other_runs(tmp_path):
+    path = tmp_path / "task.jsonl"
+    PredictionWriter(path, metadata={"model": "a"}).close()
+    with pytest.raises(ValueError):
+        PredictionWriter(path, resume=True, metadata={"model": "b"})
+
+
+def test_evaluate_task_resumes_after_crash(tmp_path):
+    annotations = [
+        {
+            "image_id": f"img{i}",
+            "image_file": f"{i}.jpg",
+            "tasks": {"reasoning": {"question": f"question {i}", "answer": "yes"}},
+        }
+        for i in range(10)
+    ]
+    (tmp_path / "annotations").mkdir()
+    with open(tmp_path / "annotations" / "test.json", "w") as f:
+        json.dump(annotations, f)
+    dataset = CamouflageDataset(str(tmp_path), split="test")
+    config = {"evaluation": {"batch_size": 2, "num_workers": 0, "checkpoint_every": 1}}
+    evaluator = Evaluator(config)
+    output_dir = str(tmp_path / "results")
+
+    with pytest.raises(RuntimeError):
+        evaluator.evaluate_task(
+            CrashingModel(fail_after=5),
+            "reasoning",
+            "test",
+            dataset=dataset,
+            output_dir=output_dir,
+        )
+
+    path = prediction_path(output_dir, "crashing", "test", "reasoning")
+    committed = len(list(read_predictions(path)))
+    assert 0 < committed < 5
+
+    model = CrashingModel()
+    evaluator.evaluate_task(
+        model, "reasoning", "test", dataset=dataset, output_dir=output_dir, resume=True
+    )
+
+    indices = [r["index"] for r in read_predictions(path)]
+    assert indices == list(range(10))
+    assert len(model.prompts) == 10 - committed
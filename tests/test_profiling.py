@@ -0,0 +1,74 @@
+"""
+Test module for the profiling hooks.
+"""
+
+import json
+
+import pytest
+
+from mmcsbench import profiling
+from mmcsbench.datasets import CamouflageDataset
+from mmcsbench.engine import InferenceEngine
+from mmcsbench.models import BaseModel
+
+
+class EchoModel(BaseModel):
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        return prompt
+
+
+def test_hooks_are_no_ops_when_disabled():
+    assert not profiling.is_enabled()
+    first = profiling.timer("anything")
+    assert first is profiling.timer("other")
+    with first:
+        profiling.count("calls")
+        profiling.observe("size", 3)
+
+
+def test_profiler_records_engine_stages(tmp_path):
+    annotations = [
+        {
+            "image_id": f"img{i}",
+            "image_file": f"{i}.jpg",
+            "tasks": {"classification": {"label": "animal"}},
+        }
+        for i in range(6)
+    ]
+    (tmp_path / "annotations").mkdir()
+    with open(tmp_path / "annotations" / "test.json", "w") as f:
+        json.dump(annotations, f)
+    dataset = CamouflageDataset(str(tmp_path), split="test")
+
+    with profiling.enable(trace=True) as profiler:
+        records = list(
+            InferenceEngine(batch_size=4, num_workers=2).run(
+                EchoModel(), dataset, "classification"
+            )
+        )
+    assert not profiling.is_enabled()
+    assert len(records) == 6
+
+    assert profiler.timers["model.generate"].count == 2
+    assert profiler.histograms["model.batch_size"].total == 6
+    assert "model.generate" in profiler.summary()
+
+    path = tmp_path / "trace.json"
+    profiler.write_trace(str(path))
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X" and e["name"] == "model.generate"]
+    assert [e["args"]["batch"] for e in spans] == [4, 2]
+    assert any(e["ph"] == "M" for e in events)
+
+
+def test_histogram_percentiles():
+    histogram = profiling.Histogram()
+    for value in range(1, 101):
+        histogram.add(value)
+    assert histogram.mean == pytest.approx(50.5)
+    assert 40 <= histogram.percentile(50) <= 60
+    assert histogram.percentile(100) == 100
@@ -0,0 +1,220 @@
+"""
+Test module for the concurrent generation scheduler.
+"""
+
+import asyncio
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mmcsbench.models import BaseModel
+from mmcsbench.scheduler import GenerationScheduler, TokenBucket, supports_async
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Echo server that fails the first ``failures`` requests with HTTP 503."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+            fail = server.failures > 0
+            if fail:
+                server.failures -= 1
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight -= 1
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+        payload = json.dumps({"text": body["prompt"][::-1]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.lock = threading.Lock()
+    server.in_flight = server.peak = server.failures = 0
+    server.latency = 0.05
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class HTTPModel(BaseModel):
+    """Model served by the stub inference server."""
+
+    concurrent = True
+
+    def __init__(self, url):
+        self.url = url
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        request = urllib.request.Request(
+            self.url, data=json.dumps({"prompt": prompt}).encode(), method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return json.loads(response.read())["text"]
+
+
+class AsyncModel(BaseModel):
+    """Model with a native async generate."""
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        raise AssertionError("the scheduler should use agenerate")
+
+    async def agenerate(self, image, prompt, **kwargs):
+        await asyncio.sleep(0.05)
+        return prompt + "!"
+
+
+def test_thread_scheduler_is_concurrent_and_ordered(stub_server):
+    model = HTTPModel(f"http://127.0.0.1:{stub_server.server_port}/")
+    scheduler = GenerationScheduler(concurrency=8)
+    prompts = [f"prompt {i}" for i in range(16)]
+
+    start = time.perf_counter()
+    outputs = scheduler.map(model, [None] * 16, prompts)
+    elapsed = time.perf_counter() - start
+
+    assert outputs == [p[::-1] for p in prompts]
+    assert stub_server.peak > 1
+    assert elapsed < 16 * stub_server.latency
+
+
+def test_scheduler_retries_failures(stub_server):
+    stub_server.failures = 2
+    model = HTTPModel(f"http://127.0.0.1:{stub_server.server_port}/")
+    scheduler = GenerationScheduler(concurrency=1, max_retries=2, backoff=0.01)
+    assert scheduler.map(model, [None], ["abc"]) == ["cba"]
+
+
+def test_scheduler_gives_up_after_max_retries(stub_server):
+    stub_server.failures = 5
+    model = HTTPModel(f"http://127.0.0.1:{stub_server.server_port}/")
+    scheduler = GenerationScheduler(concurrency=1, max_retries=1, backoff=0.01)
+    with pytest.raises(Exception):
+        scheduler.map(model, [None], ["abc"])
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FailingModel(BaseModel):
+    """Raises the queued errors in turn, then answers."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return prompt
+
+
+def test_scheduler_retries_only_transient_errors():
+    scheduler = GenerationScheduler(concurrency=1, max_retries=3, backoff=0.001)
+    model = FailingModel([ConnectionResetError(), _StatusError(429), _StatusError(502)])
+    assert scheduler.map(model, [None], ["ok"]) == ["ok"] and model.calls == 4
+
+    for error in (TypeError("bad prompt"), KeyError("image"), _StatusError(400)):
+        model = FailingModel([error])
+        with pytest.raises(type(error)):
+            scheduler.map(model, [None], ["ok"])
+        assert model.calls == 1
+
+    widened = GenerationScheduler(concurrency=1, backoff=0.001, retry_on=(Exception,))
+    model = FailingModel([ValueError("flaky")])
+    assert widened.map(model, [None], ["ok"]) == ["ok"] and model.calls == 2
+
+
+def test_async_model_uses_agenerate():
+    model = AsyncModel()
+    assert supports_async(model)
+    outputs = GenerationScheduler(concurrency=10).map(
+        model, [None] * 20, [str(i) for i in range(20)]
+    )
+    assert outputs == [f"{i}!" for i in range(20)]
+
+
+class SessionModel(BaseModel):
+    """Async model whose client session is bound to the loop that opened it."""
+
+    def __init__(self):
+        self.loop = None
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        raise AssertionError("the scheduler should use agenerate")
+
+    async def agenerate(self, image, prompt, **kwargs):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.queue = asyncio.Queue()
+        if asyncio.get_running_loop() is not self.loop:
+            raise RuntimeError("session is bound to a different event loop")
+        await self.queue.put(prompt)
+        return await self.queue.get()
+
+
+def test_async_model_keeps_its_event_loop_across_calls():
+    model = SessionModel()
+    with GenerationScheduler(concurrency=4) as scheduler:
+        for batch in range(3):
+            prompts = [f"{batch}-{i}" for i in range(8)]
+            assert sorted(scheduler.map(model, [None] * 8, prompts)) == prompts
+    assert model.loop.is_closed()
+
+
+def test_scheduler_does_not_retry_local_os_errors():
+    scheduler = GenerationScheduler(concurrency=1, max_retries=3, backoff=0.001)
+    for error in (FileNotFoundError("weights.bin"), PermissionError("cache")):
+        model = FailingModel([error])
+        with pytest.raises(type(error)):
+            scheduler.map(model, [None], ["ok"])
+        assert model.calls == 1
+    model = FailingModel(
+        [TimeoutError(), urllib.error.URLError(ConnectionRefusedError())]
+    )
+    assert scheduler.map(model, [None], ["ok"]) == ["ok"] and model.calls == 3
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, capacity=1)
+    start = time.perf_counter()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.perf_counter() - start >= 0.09
@@ -0,0 +1,176 @@
+"""
+Test module for slice analytics.
+"""
+
+import json
+import random
+import time
+
+import pytest
+
+from mmcsbench.metrics import CiderCorpus, build_metric
+from mmcsbench.slices import PredictionFrame, slice_metrics, slice_report, write_report
+
+CATEGORIES = ["animal", "military", "adaptive", "natural"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+QUESTION_TYPES = ["factual", "inferential", "counterfactual"]
+WORDS = ["a", "moth", "hides", "on", "the", "bark", "green", "leaf", "insect", "blends"]
+
+
+def _records(task, count, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        record = {
+            "index": i,
+            "query_id": 0,
+            "task": task,
+            "category": CATEGORIES[rng.randrange(4)],
+            "difficulty": DIFFICULTIES[rng.randrange(3)],
+        }
+        if task == "classification":
+            record["reference"] = {"label": record["category"]}
+            record["prediction"] = f"It is {CATEGORIES[rng.randrange(4)]} camouflage"
+        elif task == "detection":
+            x, y = rng.uniform(0, 50), rng.uniform(0, 50)
+            record["reference"] = {"boxes": [[x, y, x + 20, y + 20]]}
+            record["prediction"] = [
+                {
+                    "bbox": [
+                        x + rng.uniform(-4, 4),
+                        y + rng.uniform(-4, 4),
+                        x + 20,
+                        y + 20,
+                    ],
+                    "score": round(rng.random(), 3),
+                }
+                for _ in range(rng.randrange(3))
+            ]
+        else:
+            answer = " ".join(WORDS[i % 5 : i % 5 + 4])
+            words = WORDS[:]
+            rng.shuffle(words)
+            record["prediction"] = (
+                answer if rng.random() < 0.4 else " ".join(words[: rng.randrange(2, 7)])
+            )
+            if task == "reasoning":
+                record["reference"] = {
+                    "question": "Where?",
+                    "answer": answer,
+                    "question_type": QUESTION_TYPES[rng.randrange(3)],
+                }
+            else:
+                record["reference"] = {
+                    "captions": [answer, " ".join(WORDS[: i % 8 + 2])]
+                }
+        records.append(record)
+    return records
+
+
+def _question_type(record):
+    return record["reference"].get("question_type")
+
+
+@pytest.mark.parametrize(
+    "task", ["classification", "detection", "reasoning", "description"]
+)
+def test_slices_match_metrics_on_filtered_records(task):
+    records = _records(task, 300)
+    corpus = None
+    metric = build_metric(task)
+    if hasattr(metric, "references"):
+        corpus = CiderCorpus.from_references(
+            metric.references(r["reference"]) for r in records
+        )
+    frame = PredictionFrame.from_records(task, records, "model", corpus=corpus)
+    rows = slice_metrics(frame, num_bootstrap=0)
+
+    values = {
+        "category": lambda r: r["category"],
+        "difficulty": lambda r: r["difficulty"],
+        "question_type": _question_type,
+    }
+    dimensions = ["category", "difficulty"] + (
+        ["question_type"] if task == "reasoning" else []
+    )
+    # Every non-empty combination of values of every subset of dimensions
+    assert len({json.dumps(row["slice"], sort_keys=True) for row in rows}) == len(rows)
+    assert rows[0]["slice"] == {} and rows[0]["count"] == len(records)
+    assert {key for row in rows for key in row["slice"]} == set(dimensions)
+
+    for row in rows:
+        selected = [
+            r
+            for r in records
+            if all(values[d](r) == v for d, v in row["slice"].items())
+        ]
+        assert row["count"] == len(selected)
+        expected = build_metric(task, corpus=corpus).update(selected).compute()
+        for name, value in row["metrics"].items():
+            assert value == pytest.approx(expected[name], abs=1e-9), (
+                row["slice"],
+                name,
+            )
+
+
+def test_bootstrap_intervals_bracket_the_estimate():
+    records = _records("reasoning", 400, seed=1)
+    frame = PredictionFrame.from_records("reasoning", records)
+    rows = slice_metrics(frame, dimensions=["category"], num_bootstrap=500, seed=3)
+    for row in rows:
+        low, high = row["ci"]["accuracy"]
+        assert 0.0 <= low <= row["metrics"]["accuracy"] <= high <= 1.0
+        assert high - low < 0.5
+    # Deterministic for a seed
+    assert rows == slice_metrics(
+        frame, dimensions=["category"], num_bootstrap=500, seed=3
+    )
+
+
+def test_slice_report_for_many_models(tmp_path):
+    predictions = {
+        f"model-{m}": {
+            task: _records(task, 1000, seed=m)
+            for task in ("classification", "reasoning")
+        }
+        for m in range(20)
+    }
+    start = time.perf_counter()
+    report = slice_report(predictions, num_bootstrap=200)
+    elapsed = time.perf_counter() - start
+    assert set(report["models"]) == set(predictions)
+    assert elapsed < 60
+
+    path = write_report(report, tmp_path)
+    assert "| model-0 | all | 1000 |" in path.read_text()
+    with open(tmp_path / "slices.json") as f:
+        assert json.load(f)["models"]["model-3"]["reasoning"][0]["count"] == 1000
+
+
+def test_generate_report_slices_streamed_predictions(tmp_path):
+    from mmcsbench import MMCSBenchmark
+    from mmcsbench.predictions import PredictionWriter, prediction_path
+
+    for model in ("model/a", "model-b"):
+        for task in ("classification", "reasoning"):
+            with PredictionWriter(
+                prediction_path(tmp_path, model, "test", task)
+            ) as writer:
+                for record in _records(task, 50):
+                    writer.write(record)
+                    writer.commit()
+    config = {
+        "data_dir": str(tmp_path / "data"),
+        "evaluation": {"report": {"bootstrap": 50}},
+    }
+    benchmark = MMCSBenchmark(config=config)
+    benchmark.generate_report({"classification": {"accuracy": 0.5}}, str(tmp_path))
+
+    with open(tmp_path / "results.json") as f:
+        assert json.load(f) == {"classification": {"accuracy": 0.5}}
+    with open(tmp_path / "slices.json") as f:
+        report = json.load(f)
+    assert report["num_bootstrap"] == 50
+    assert set(report["models"]) == {"model_a", "model-b"}
+    assert set(report["models"]["model-b"]) == {"classification", "reasoning"}
+    assert (tmp_path / "report.md").exists()
@@ -0,0 +1,165 @@
+"""
+Test module for stratified subset evaluation.
+"""
+
+import json
+import os
+from collections import Counter
+
+import pytest
+
+from mmcsbench import MMCSBenchmark
+from mmcsbench.datasets import CamouflageDataset
+from mmcsbench.models import BaseModel
+from mmcsbench.subsets import load_subset, parse_subset
+
+CATEGORIES = ["animal", "military", "adaptive", "natural"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+
+class GuessingModel(BaseModel):
+    """Always answers 'animal' camouflage, and 'a moth' to questions."""
+
+    name = "guessing"
+
+    def forward(self, image, text=None):
+        return None
+
+    def generate(self, image, prompt, **kwargs):
+        return "animal" if "type of camouflage" in prompt else "a moth"
+
+
+def _write_split(root, count=400):
+    annotations = []
+    for i in range(count):
+        tasks = {"classification": {"label": CATEGORIES[i % 4]}}
+        if i % 3 == 0:
+            tasks["reasoning"] = {
+                "question": "What hides?",
+                "answer": "moth" if i % 2 else "leaf",
+            }
+        annotations.append(
+            {
+                "image_id": f"img{i}",
+                "image_file": f"{i}.jpg",
+                "category": CATEGORIES[i % 4],
+                "difficulty": DIFFICULTIES[i % 3],
+                "tasks": tasks,
+            }
+        )
+    (root / "annotations").mkdir(parents=True, exist_ok=True)
+    path = root / "annotations" / "test.json"
+    path.write_text(json.dumps(annotations))
+    return path
+
+
+def _stratum(dataset, idx):
+    annotation = dataset.get_annotation(idx)
+    return (
+        annotation["category"],
+        annotation["difficulty"],
+        tuple(sorted(annotation["tasks"])),
+    )
+
+
+def test_subset_is_stratified_and_reused(tmp_path):
+    """The sample keeps each stratum's share and is read back from its index file."""
+    path = _write_split(tmp_path)
+    dataset = CamouflageDataset(str(tmp_path), split="test")
+    subset = load_subset(dataset, 0.25, ["classification", "reasoning"], seed=3)
+
+    assert len(subset["indices"]) == 100 and subset["total"] == 400
+    full = Counter(_stratum(dataset, idx) for idx in range(len(dataset)))
+    sampled = Counter(_stratum(dataset, idx) for idx in subset["indices"])
+    for stratum, count in full.items():
+        assert abs(sampled[stratum] - count / 4) < 1
+    index_file = tmp_path / "subsets" / f"{subset['name']}.json"
+    assert index_file.exists()
+
+    os.utime(index_file, ns=(0, 0))
+    assert load_subset(dataset, 0.25, ["classification", "reasoning"], seed=3) == subset
+    assert os.stat(index_file).st_mtime_ns == 0
+    other = load_subset(dataset, 0.25, ["classification", "reasoning"], seed=4)
+    assert other["indices"] != subset["indices"]
+
+    _write_split(tmp_path, count=200)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    redrawn = load_subset(
+        CamouflageDataset(str(tmp_path), split="test"),
+        0.25,
+        ["classification", "reasoning"],
+        seed=3,
+    )
+    assert redrawn["total"] == 200 and len(redrawn["indices"]) == 50
+
+    assert parse_subset("500") == 500 and parse_subset("0.05") == 0.05
+    with pytest.raises(ValueError):
+        parse_subset("1.5")
+
+
+def test_evaluate_subset_reports_error_against_full_split(tmp_path):
+    """A subset run only evaluates the sample and bounds its distance to the split."""
+    _write_split(tmp_path / "data")
+    config = {
+        "data_dir": str(tmp_path / "data"),
+        "evaluation": {"batch_size": 16, "report": {"bootstrap": 200}},
+    }
+    benchmark = MMCSBenchmark(config=config)
+    tasks = ["classification", "reasoning"]
+    full = benchmark.evaluate(GuessingModel(), tasks=tasks)
+
+    output_dir = tmp_path / "subset"
+    results = benchmark.evaluate(
+        GuessingModel(),
+        tasks=tasks,
+        output_dir=str(output_dir),
+        subset=80,
+        subset_reference=full,
+    )
+    with open(output_dir / "subset_report.json") as f:
+        report = json.load(f)["guessing"]["tasks"]
+
+    for task in tasks:
+        for metric, entry in report[task].items():
+            assert entry["value"] == pytest.approx(results[task][metric])
+            assert entry["difference"] == pytest.approx(
+                entry["value"] - full[task][metric]
+            )
+    accuracy = report["classification"]["accuracy"]
+    # Stratified by category, so the subset is within its error bound of the full split
+    assert 0 < abs(accuracy["difference"]) <= accuracy["error"] < 0.2
+    name = load_subset(benchmark.get_dataset("test"), 80, tasks)["name"]
+    predictions = (
+        output_dir / name / "predictions" / "guessing" / "test" / "classification.jsonl"
+    )
+    with open(predictions) as f:
+        assert sum(1 for line in f if '"index"' in line) == 80
+
+
+def test_subset_run_is_kept_apart_from_full_runs(tmp_path):
+    """Resuming a subset run in a full run's directory evaluates the subset only."""
+    _write_split(tmp_path / "data")
+    benchmark = MMCSBenchmark(config={"data_dir": str(tmp_path / "data")})
+    tasks = ["classification", "reasoning"]
+    output_dir = tmp_path / "run"
+    benchmark.evaluate(GuessingModel(), tasks=tasks, output_dir=str(output_dir))
+    results = benchmark.evaluate(
+        GuessingModel(), tasks=tasks, output_dir=str(output_dir), resume=True, subset=80
+    )
+
+    with open(output_dir / "subset_report.json") as f:
+        report = json.load(f)["guessing"]["tasks"]
+    assert report["reasoning"]["accuracy"]["value"] == pytest.approx(
+        results["reasoning"]["accuracy"]
+    )
+    name = load_subset(benchmark.get_dataset("test"), 80, tasks)["name"]
+    for run, count in ((output_dir, 400), (output_dir / name, 80)):
+        predictions = run / "predictions" / "guessing" / "test" / "classification.jsonl"
+        with open(predictions) as f:
+            assert sum(1 for line in f if '"index"' in line) == count
+
+    dataset = CamouflageDataset(str(tmp_path / "data"), split="test")
+    path = tmp_path / "sample.json"
+    assert len(load_subset(dataset, 80, tasks, path=path)["indices"]) == 80
+    assert len(load_subset(dataset, 40, tasks, path=path)["indices"]) == 40